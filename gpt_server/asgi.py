@@ -0,0 +1,332 @@
+# asgi.py
+#  비동기 채팅 게이트웨이
+#  - /api/chat 은 llm_client 의 비동기 경로(AsyncGroq)로 이벤트 루프에서 처리 → Groq 왕복 동안 워커 스레드를 잡지 않음
+#  - 그 외 경로(일기/인증)는 기존 Flask 앱을 전용 스레드 풀(WSGI_WORKERS)에서 그대로 처리
+#  실행: uvicorn asgi:application --host 0.0.0.0 --port 5000
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+
+import jwt as pyjwt
+from a2wsgi import WSGIMiddleware
+from flask_jwt_extended import decode_token
+from flask_jwt_extended.exceptions import JWTExtendedException
+
+import config  # noqa: F401 (.env 로드 — services 가 import 시 환경변수를 읽으므로 가장 먼저)
+from services import (admission, chat_cache, conversation, diary_vectors, llm_client, metrics, profiler,
+                      rate_limiter)
+from gpt_server import (
+    create_app, build_messages, open_chat_session, summarize_complete, _sse,
+    MODEL_NAME, SYSTEM_PROMPT,
+)
+
+# 동시에 Groq 로 나가는 요청 수 / 대기열 / 대기 SLO 는 services/admission.py 의 chat 등급(ADMISSION_CHAT)
+# (LLM_MAX_CONCURRENCY / LLM_QUEUE_TIMEOUT 은 ADMISSION_CHAT 이 없을 때의 기본값으로 계속 읽힌다)
+# Flask(WSGI) 라우트 전용 스레드 수 — 채팅과 공유하지 않으므로 채팅 폭주에도 일기 조회 지연이 유지된다
+WSGI_WORKERS = int(os.getenv("WSGI_WORKERS", "16"))
+
+flask_app = create_app()
+
+# CORS: create_app 과 같은 FRONTEND_ORIGIN 규칙 — "*" 면 모든 Origin, 아니면 목록에 있는 Origin 만 그대로 돌려주고
+# 자격 증명을 허용한다. 목록에 없는 Origin 에는 CORS 헤더를 달지 않는다 (flask-cors 와 동일)
+_ORIGINS = [o.strip() for o in os.getenv("FRONTEND_ORIGIN", "*").split(",") if o.strip()]
+_ALLOW_ALL = _ORIGINS == ["*"]
+_CORS_COMMON = [
+    (b"vary", b"Origin"),
+    (b"access-control-allow-methods", b"GET, POST, PUT, DELETE, OPTIONS"),
+    (b"access-control-allow-headers", b"Authorization, Content-Type, Cache-Control, X-Chat-Cache, X-Profile"),
+    (b"access-control-expose-headers", b"X-Cache, Server-Timing, X-Profile-Id"),
+]
+
+
+def _cors_headers(scope):
+    origin = dict(scope.get("headers") or []).get(b"origin", b"")
+    if _ALLOW_ALL:
+        return [(b"access-control-allow-origin", origin or b"*")] + _CORS_COMMON
+    if origin.decode("latin-1") not in _ORIGINS:
+        return [(b"vary", b"Origin")]
+    return [(b"access-control-allow-origin", origin),
+            (b"access-control-allow-credentials", b"true")] + _CORS_COMMON
+
+
+def _with_cors(scope, send):
+    cors = _cors_headers(scope)
+
+    async def send_cors(message):
+        if message["type"] == "http.response.start":
+            message = dict(message, headers=list(message.get("headers") or []) + cors)
+        await send(message)
+    return send_cors
+
+
+async def _send_json(send, status, payload, extra_headers=()):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode())]
+                   + list(extra_headers),
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _send_llm_error(send, e):
+    logging.warning(f"Groq 호출 실패: {type(e).__name__}: {e}")
+    if isinstance(e, llm_client.LLMUnavailable):
+        retry = str(max(1, math.ceil(e.retry_after))).encode()
+        await _send_json(send, 503, {"error": str(e)}, [(b"retry-after", retry)])
+    else:
+        await _send_json(send, 500, {"error": str(e)})
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        msg = await receive()
+        if msg["type"] == "http.disconnect":
+            return b""
+        chunks.append(msg.get("body", b""))
+        if not msg.get("more_body"):
+            return b"".join(chunks)
+
+
+def _check_token(headers):
+    # Flask 쪽 verify_jwt_in_request(optional=True) 와 동일: 토큰이 없으면 게스트, 있으면 flask_jwt_extended 로 검증
+    # (앱 설정의 알고리즘·만료 여유·클레임 검사를 그대로 따름)
+    # 반환: (오류 코드 또는 None, identity 또는 None) — 오류 코드는 Flask 로더와 같은 invalid_token / token_expired
+    auth = headers.get(b"authorization", b"").decode("latin-1")
+    if not auth:
+        return None, None
+    if not auth.startswith("Bearer "):
+        return "invalid_token", None
+    try:
+        with flask_app.app_context():
+            claims = decode_token(auth[7:].strip())
+    except pyjwt.ExpiredSignatureError:
+        return "token_expired", None
+    except (pyjwt.InvalidTokenError, JWTExtendedException):
+        return "invalid_token", None
+    return None, claims.get("sub")
+
+
+async def _rate_limit(scope, ident):
+    if not rate_limiter.RATE_LIMIT_ENABLED:
+        return True, 0.0
+    if isinstance(ident, int) and ident > 0:
+        key = f"u:{ident}"
+    else:
+        key = f"ip:{(scope.get('client') or ('?',))[0]}"
+    if rate_limiter.limiter.shared is not None:
+        return await asyncio.to_thread(rate_limiter.limiter.take, "chat", key)
+    return rate_limiter.limiter.take("chat", key)
+
+
+def _wants_stream(data, headers, query: bytes) -> bool:
+    flag = data.get("stream")
+    if flag is None and b"stream=" in query:
+        flag = query.split(b"stream=", 1)[1].split(b"&", 1)[0].decode()
+    if isinstance(flag, str):
+        flag = flag.strip().lower() in ("1", "true", "yes")
+    if flag:
+        return True
+    return b"text/event-stream" in headers.get(b"accept", b"")
+
+
+async def chat_app(scope, receive, send):
+    # 프로파일이 켜진 요청이면 구간을 모으고 응답 헤더에 Server-Timing 을 단다.
+    # 이벤트 루프 스레드는 다른 요청과 공유하므로 스택 샘플링은 하지 않는다
+    prof = None
+    if profiler.ENABLED and scope["method"] == "POST":
+        token = dict(scope.get("headers") or []).get(b"x-profile", b"").decode("latin-1")
+        prof = profiler.start(scope["path"], "POST", token or None, stacks=False)
+    if prof is None:
+        await _chat_app(scope, receive, send)
+        return
+
+    status = None
+
+    async def send_profiled(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            message = dict(message, headers=list(message.get("headers") or [])
+                           + [(b"server-timing", prof.server_timing().encode("latin-1")),
+                              (b"x-profile-id", prof.id.encode())])
+        await send(message)
+
+    ctx = profiler.activate(prof)
+    try:
+        await _chat_app(scope, receive, send_profiled)
+    finally:
+        profiler.deactivate(ctx)
+        profiler.finish(prof, status)
+
+
+async def _chat_app(scope, receive, send):
+    if scope["method"] == "OPTIONS":
+        await send({"type": "http.response.start", "status": 204, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+        return
+    if scope["method"] != "POST":
+        await _send_json(send, 405, {"error": "method not allowed"})
+        return
+
+    headers = dict(scope.get("headers") or [])
+    token_error, ident = _check_token(headers)
+    if token_error:
+        await _send_json(send, 401, {"error": token_error})
+        return
+    allowed, retry = await _rate_limit(scope, ident)
+    if not allowed:
+        await _send_json(send, 429, {"error": "요청이 너무 많습니다. 잠시 후 다시 시도해주세요."},
+                         [(b"retry-after", str(max(1, math.ceil(retry))).encode())])
+        return
+
+    try:
+        data = json.loads(await _read_body(receive) or b"{}") or {}
+    except ValueError:
+        data = {}
+    if not isinstance(data, dict):
+        data = {}
+    user_message = (data.get("message") or "").strip()
+    if not user_message:
+        await _send_json(send, 400, {"error": "message가 필요합니다."})
+        return
+    # 서버 측 세션은 DB 를 쓰므로 스레드에서 연다
+    try:
+        session = await asyncio.to_thread(open_chat_session, ident if isinstance(ident, int) else 0, data)
+    except conversation.SessionNotFound:
+        await _send_json(send, 404, {"error": "대화 세션을 찾을 수 없습니다."})
+        return
+    if session is None:
+        messages = build_messages(data.get("history") or [], user_message)
+    else:
+        messages, dropped = conversation.assemble(SYSTEM_PROMPT, session, user_message)
+        conversation.maybe_summarize(session, dropped, summarize_complete)
+    # 관련 일기 조회는 파일/DB 를 쓰므로 스레드에서
+    messages = await asyncio.to_thread(diary_vectors.attach_context, messages, ident, user_message,
+                                       data.get("diary_context") is not False)
+    turn = (session, user_message)
+
+    # 로그인 사용자가 게스트보다 먼저 자리를 받고, 예상 대기가 SLO 를 넘으면 바로 503
+    gate = admission.gate("chat")
+    queued = time.perf_counter()
+    try:
+        started = await gate.aacquire(admission.priority_of(ident))
+    except admission.Shed as e:
+        metrics.LLM_QUEUE_WAIT.observe(time.perf_counter() - queued, path="/api/chat")
+        profiler.record("admission", queued, route_class="chat")
+        await _send_json(send, 503, {"error": "요청이 많습니다. 잠시 후 다시 시도해주세요."},
+                         [(b"retry-after", str(e.retry_after).encode())])
+        return
+    metrics.LLM_QUEUE_WAIT.observe(time.perf_counter() - queued, path="/api/chat")
+    profiler.record("admission", queued, route_class="chat")
+    try:
+        if _wants_stream(data, headers, scope.get("query_string", b"")):
+            await _stream_reply(messages, receive, send, turn)
+        else:
+            await _complete_reply(messages, data, headers, send, turn)
+    finally:
+        gate.release(started)
+
+
+async def _complete_reply(messages, data, headers, send, turn):
+    session, user_message = turn
+    cache = chat_cache.cache
+    cache_key, cache_headers = None, []
+    if cache is not None:
+        str_headers = {k.decode("latin-1").title(): v.decode("latin-1") for k, v in headers.items()}
+        if session is not None or chat_cache.bypass_requested(str_headers, data):
+            cache_headers = [(b"x-cache", b"BYPASS")]
+        else:
+            cache_key = chat_cache.make_key(MODEL_NAME, messages, 0.8)
+            # Redis 조회는 블로킹이므로 공유 저장소가 있을 때만 스레드로 넘긴다
+            if cache.shared is not None:
+                cached = await asyncio.to_thread(cache.get, cache_key)
+            else:
+                cached = cache.get(cache_key)
+            if cached is not None:
+                await _send_json(send, 200, {"reply": cached}, [(b"x-cache", b"HIT")])
+                return
+            cache_headers = [(b"x-cache", b"MISS")]
+
+    try:
+        completion = await llm_client.llm.acomplete(messages, path="/api/chat")
+    except Exception as e:
+        await _send_llm_error(send, e)
+        return
+    reply = completion.choices[0].message.content
+
+    if cache_key is not None:
+        if cache.shared is not None:
+            await asyncio.to_thread(cache.put, cache_key, reply)
+        else:
+            cache.put(cache_key, reply)
+    body = {"reply": reply}
+    if session is not None:
+        await asyncio.to_thread(conversation.record_turn, session, user_message, reply)
+        body["session_id"] = session.id
+    await _send_json(send, 200, body, cache_headers)
+
+
+async def _stream_reply(messages, receive, send, turn):
+    session, user_message = turn
+    try:
+        upstream = await llm_client.llm.aopen_stream(messages, path="/api/chat")
+    except Exception as e:
+        await _send_llm_error(send, e)
+        return
+
+    disconnected = asyncio.Event()
+
+    async def watch_disconnect():
+        while True:
+            msg = await receive()
+            if msg["type"] == "http.disconnect":
+                disconnected.set()
+                return
+
+    watcher = asyncio.create_task(watch_disconnect())
+    parts = []
+    try:
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/event-stream; charset=utf-8"),
+                        (b"cache-control", b"no-cache"),
+                        (b"x-accel-buffering", b"no")],
+        })
+        try:
+            async for delta in upstream:
+                if disconnected.is_set():
+                    return
+                parts.append(delta)
+                await send({"type": "http.response.body",
+                            "body": _sse(None, {"delta": delta}).encode("utf-8"),
+                            "more_body": True})
+            done = {"done": True}
+            if session is not None:
+                await asyncio.to_thread(conversation.record_turn, session, user_message, "".join(parts))
+                done["session_id"] = session.id
+            tail = _sse("done", done)
+        except Exception as e:
+            tail = _sse("error", {"error": str(e)})
+        if not disconnected.is_set():
+            await send({"type": "http.response.body", "body": tail.encode("utf-8")})
+    finally:
+        watcher.cancel()
+        await upstream.aclose()
+
+
+_flask_asgi = WSGIMiddleware(flask_app, workers=WSGI_WORKERS)
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "http" and scope["path"].rstrip("/") == "/api/chat":
+        await chat_app(scope, receive, _with_cors(scope, send))
+    else:
+        await _flask_asgi(scope, receive, send)
@@ -0,0 +1,493 @@
+# bench_api.py
+#  API 벤치마크 하네스: 로그인/채팅/일기 CRUD/검색이 섞인 부하를 고정 동시성으로 돌려
+#  엔드포인트별 처리량과 p50/p95/p99 를 출력하고, 기준(baseline)과 비교해 회귀를 잡습니다.
+#  1) 가짜 Groq 서버(fake_groq.py)를 띄움 — 지연/토큰 속도/오류율 조절
+#  2) 벤치 전용 데이터베이스(--db-name, 기본 gpt_app_bench)를 만들고 schema.sql + 마이그레이션 적용
+#     DB_HOST/DB_USER/DB_PASSWORD/DB_PORT 의 MariaDB(10.5+) 서버를 쓰며, 운영 데이터베이스는 건드리지 않음
+#  3) 앱을 별도 프로세스로 실행(--server flask|uvicorn), 감정 분석 워커도 함께 실행
+#  4) API 로 사용자/일기 시드 → 워밍업 → 측정
+#  사용법:
+#    python bench_api.py --concurrency 32 --duration 60 --save                # bench_baselines/<커밋>.json
+#    python bench_api.py --compare bench_baselines/main.json                   # 회귀면 exit 1
+#  기준 파일은 저장소에 들어 있지 않습니다 — 기준으로 삼을 머신에서 --save 로 한 번 만들어 커밋하세요
+#    python bench_api.py --mix "GET /api/history=50,POST /api/chat=50"         # 부하 비율 변경
+import argparse
+import gzip
+import http.client
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCHEMA_SQL = os.path.join(HERE, "..", "schema.sql")
+BASELINE_DIR = os.path.join(HERE, "bench_baselines")
+
+PASSWORD = "bench-password"
+MOODS = ["happy", "sad", "angry", "anxious", "calm", "tired"]
+WORDS = ["오늘", "회사에서", "친구와", "산책을", "했다", "불안해요", "기분이", "좋았다", "피곤한", "하루",
+         "잠을", "못", "잤다", "가족과", "저녁을", "먹었다", "운동", "공부", "비가", "왔다"]
+CHAT_MESSAGES = ["오늘 너무 불안해요", "잠이 안 와요", "친구랑 싸웠어요", "기분이 좋아요!", "일이 너무 많아요"]
+
+DEFAULT_MIX = {
+    "POST /api/auth/login": 2,
+    "GET /api/auth/me": 8,
+    "GET /api/history": 22,
+    "GET /api/history (If-None-Match)": 10,
+    "GET /api/history?q=": 10,
+    "GET /api/history/stats": 5,
+    "POST /api/history": 12,
+    "PUT /api/history/<id>": 8,
+    "DELETE /api/history/<id>": 4,
+    "POST /api/history/batch": 3,
+    "POST /api/chat": 12,
+    "POST /api/chat (stream)": 4,
+}
+
+# 회귀 판정: p95 가 기준보다 TOLERANCE 이상 느리고 절대 차이가 NOISE_MS 이상이거나, 처리량이 TOLERANCE 이상 줄면
+TOLERANCE = float(os.getenv("BENCH_TOLERANCE", "0.15"))
+NOISE_MS = float(os.getenv("BENCH_NOISE_MS", "5"))
+
+# 결과 파일에 함께 남기는 부하 설정 (기준과 설정이 다르면 비교 시 경고)
+current_params = {}
+
+
+# -------------------------------
+# HTTP 클라이언트 (워커마다 keep-alive 연결 하나)
+# -------------------------------
+class Client:
+    def __init__(self, base_url):
+        u = urllib.parse.urlsplit(base_url)
+        self.host, self.port = u.hostname, u.port or 80
+        self.conn = None
+        self.token = None
+
+    def request(self, method, path, body=None, headers=None, first_byte=None):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8") if body is not None else None
+        h = {"Content-Type": "application/json", "Accept-Encoding": "gzip"}
+        if self.token:
+            h["Authorization"] = f"Bearer {self.token}"
+        h.update(headers or {})
+        reused = self.conn is not None
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=120)
+        try:
+            self.conn.request(method, path, body=data, headers=h)
+            resp = self.conn.getresponse()
+            if first_byte is not None:
+                resp.read(1)
+                first_byte.append(time.perf_counter())
+            payload = resp.read()
+        except (http.client.HTTPException, OSError):
+            self.conn.close()
+            self.conn = None
+            if not reused:
+                raise
+            # 서버가 닫은 keep-alive 연결 → 새 연결로 한 번만 다시
+            return self.request(method, path, body, headers, first_byte)
+        if resp.getheader("Content-Encoding") == "gzip":
+            payload = gzip.decompress(payload)
+        return resp.status, resp, payload
+
+    def json(self, method, path, body=None, headers=None):
+        status, resp, payload = self.request(method, path, body, headers)
+        try:
+            return status, resp, json.loads(payload) if payload else None
+        except ValueError:
+            return status, resp, None
+
+
+# -------------------------------
+# DB / 앱 / 가짜 LLM 준비
+# -------------------------------
+def prepare_db(db_name, fresh):
+    import pymysql
+
+    import config  # noqa: F401 (.env 로드)
+    from migrate import split_statements
+
+    host, port = os.getenv("DB_HOST", "127.0.0.1"), int(os.getenv("DB_PORT", "3306"))
+    try:
+        raw = pymysql.connect(host=host, user=os.getenv("DB_USER", "root"), password=os.getenv("DB_PASSWORD", "aaaa"),
+                              port=port, charset="utf8mb4", autocommit=True)
+    except pymysql.err.OperationalError as e:
+        raise SystemExit(f"MariaDB(10.5+) 서버 {host}:{port} 에 연결할 수 없습니다: {e}\n"
+                         f"DB_HOST/DB_PORT/DB_USER/DB_PASSWORD 를 확인하거나 --base-url 로 떠 있는 서버를 측정하세요.")
+    try:
+        with raw.cursor() as cur:
+            if fresh:
+                cur.execute(f"DROP DATABASE IF EXISTS `{db_name}`")
+            cur.execute(f"CREATE DATABASE IF NOT EXISTS `{db_name}` CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci")
+            cur.execute(f"USE `{db_name}`")
+            cur.execute("SHOW TABLES LIKE 'users'")
+            if cur.fetchone() is None:
+                with open(SCHEMA_SQL, encoding="utf-8") as f:
+                    for stmt in split_statements(f.read()):
+                        if not stmt.upper().startswith(("CREATE DATABASE", "USE ")):
+                            cur.execute(stmt)
+    finally:
+        raw.close()
+    # db.DB_CONF 가 import 시점에 DB_NAME 을 읽으므로 여기서 처음 import
+    import migrate
+    migrate.migrate()
+
+
+def start_process(cmd, env, log_name):
+    log = tempfile.NamedTemporaryFile(prefix=f"bench_{log_name}_", suffix=".log", delete=False)
+    proc = subprocess.Popen(cmd, cwd=HERE, env=env, stdout=log, stderr=subprocess.STDOUT)
+    proc.log_path = log.name
+    return proc
+
+
+def start_app(server, port, env):
+    if server == "uvicorn":
+        cmd = [sys.executable, "-m", "uvicorn", "asgi:application", "--host", "127.0.0.1",
+               "--port", str(port), "--log-level", "warning"]
+    else:
+        cmd = [sys.executable, "-c",
+               f"from gpt_server import create_app; create_app().run(host='127.0.0.1', port={port}, threaded=True)"]
+    return start_process(cmd, env, "app")
+
+
+def wait_ready(base_url, proc, timeout=30):
+    client = Client(base_url)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc is not None and proc.poll() is not None:
+            break
+        try:
+            client.request("GET", "/metrics")
+            return
+        except OSError:
+            client.conn = None
+            time.sleep(0.2)
+    log = open(proc.log_path, encoding="utf-8", errors="replace").read()[-3000:] if proc else ""
+    raise SystemExit(f"앱이 {timeout}초 안에 뜨지 않았습니다.\n{log}")
+
+
+def seed(base_url, users, diaries, rng):
+    """사용자 users 명을 가입(이미 있으면 로그인)시키고, 일기가 없는 사용자에게 diaries 개씩 가져오기."""
+    tokens = []
+    for i in range(users):
+        client = Client(base_url)
+        user_id = f"bench_u{i:04d}"
+        status, _, body = client.json("POST", "/api/auth/signup",
+                                      {"user_id": user_id, "user_name": "벤치 사용자", "password": PASSWORD})
+        if status == 409:
+            status, _, body = client.json("POST", "/api/auth/login", {"user_id": user_id, "password": PASSWORD})
+        if status >= 400:
+            raise SystemExit(f"시드 실패 ({user_id}): {status} {body}")
+        client.token = body["access_token"]
+        tokens.append((user_id, client.token))
+
+        _, _, page = client.json("GET", "/api/history?cursor=&size=1&with_total=0")
+        if diaries and not (page or {}).get("items"):
+            now = datetime.now()
+            lines = []
+            for _ in range(diaries):
+                created = now - timedelta(days=rng.randrange(365), seconds=rng.randrange(86400))
+                lines.append(json.dumps({"mood": rng.choice(MOODS), "notes": " ".join(rng.choices(WORDS, k=12)),
+                                         "createdAt": created.strftime("%Y-%m-%d %H:%M:%S")}, ensure_ascii=False))
+            status, _, payload = _post_raw(client, "/api/history/import", "\n".join(lines).encode("utf-8"),
+                                           "application/x-ndjson")
+            if status >= 400:
+                raise SystemExit(f"일기 시드 실패 ({user_id}): {status} {payload[:200]!r}")
+    return tokens
+
+
+def _post_raw(client, path, data, content_type):
+    if client.conn is None:
+        client.conn = http.client.HTTPConnection(client.host, client.port, timeout=300)
+    client.conn.request("POST", path, body=data, headers={
+        "Content-Type": content_type, "Authorization": f"Bearer {client.token}"})
+    resp = client.conn.getresponse()
+    return resp.status, resp, resp.read()
+
+
+# -------------------------------
+# 부하
+# -------------------------------
+class Worker:
+    def __init__(self, base_url, user_id, token, seed_value):
+        self.client = Client(base_url)
+        self.client.token = token
+        self.user_id = user_id
+        self.rng = random.Random(seed_value)
+        self.my_ids = []
+        self.etag = None
+        self.batch_no = 0
+
+    def _notes(self):
+        return " ".join(self.rng.choices(WORDS, k=10))
+
+    def run(self, name):
+        """name 에 해당하는 요청 하나. [(기록 이름, 상태, 소요 초), ...] 를 돌려줍니다."""
+        c, rng = self.client, self.rng
+        t0 = time.perf_counter()
+        extra = []
+        if name == "POST /api/auth/login":
+            status, _, body = c.json("POST", "/api/auth/login", {"user_id": self.user_id, "password": PASSWORD})
+            if status == 200:
+                c.token = body["access_token"]
+        elif name == "GET /api/auth/me":
+            status, _, _ = c.request("GET", "/api/auth/me")
+        elif name == "GET /api/history":
+            status, _, _ = c.request("GET", "/api/history?cursor=&size=20")
+        elif name == "GET /api/history (If-None-Match)":
+            headers = {"If-None-Match": self.etag} if self.etag else {}
+            status, resp, _ = c.request("GET", "/api/history?page=1&size=20", headers=headers)
+            self.etag = resp.getheader("ETag") or self.etag
+        elif name == "GET /api/history?q=":
+            q = urllib.parse.quote(rng.choice(WORDS))
+            status, _, _ = c.request("GET", f"/api/history?cursor=&size=20&q={q}")
+        elif name == "GET /api/history/stats":
+            status, _, _ = c.request("GET", "/api/history/stats")
+        elif name == "POST /api/history" or (name in ("PUT /api/history/<id>", "DELETE /api/history/<id>")
+                                             and not self.my_ids):
+            name = "POST /api/history"
+            status, _, body = c.json("POST", "/api/history", {"mood": rng.choice(MOODS), "notes": self._notes()})
+            if status == 201:
+                self.my_ids.append(body["item"]["id"])
+        elif name == "PUT /api/history/<id>":
+            diary_id = rng.choice(self.my_ids)
+            status, _, _ = c.request("PUT", f"/api/history/{diary_id}",
+                                     {"mood": rng.choice(MOODS), "notes": self._notes()})
+        elif name == "DELETE /api/history/<id>":
+            diary_id = self.my_ids.pop(rng.randrange(len(self.my_ids)))
+            status, _, _ = c.request("DELETE", f"/api/history/{diary_id}")
+        elif name == "POST /api/history/batch":
+            self.batch_no += 1
+            prefix = f"{self.user_id}-{os.getpid()}-{id(self)}-{self.batch_no}"
+            ops = [{"key": f"{prefix}-{n}", "op": "create", "mood": rng.choice(MOODS), "notes": self._notes()}
+                   for n in range(3)]
+            ops.append({"key": f"{prefix}-u", "op": "update", "ref": f"{prefix}-0",
+                        "mood": rng.choice(MOODS), "notes": self._notes()})
+            ops.append({"key": f"{prefix}-d", "op": "delete", "ref": f"{prefix}-1"})
+            status, _, body = c.json("POST", "/api/history/batch", {"ops": ops})
+            if status == 200:
+                self.my_ids += [r["id"] for r in body["results"] if r.get("status") == 201 and "item" in r]
+        elif name == "POST /api/chat":
+            status, _, _ = c.request("POST", "/api/chat", {"message": rng.choice(CHAT_MESSAGES)})
+        elif name == "POST /api/chat (stream)":
+            first = []
+            status, _, _ = c.request("POST", "/api/chat", {"message": rng.choice(CHAT_MESSAGES), "stream": True},
+                                     first_byte=first)
+            if first:
+                extra.append(("POST /api/chat (stream) TTFB", status, first[0] - t0))
+        else:
+            raise ValueError(f"알 수 없는 요청: {name}")
+        return [(name, status, time.perf_counter() - t0)] + extra
+
+
+def run_load(base_url, tokens, mix, concurrency, duration, seed_value, record=True):
+    names, weights = zip(*mix.items())
+    samples = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def loop(n):
+        user_id, token = tokens[n % len(tokens)]
+        worker = Worker(base_url, user_id, token, seed_value * 100003 + n)
+        local = []
+        while time.monotonic() < deadline:
+            name = worker.rng.choices(names, weights)[0]
+            try:
+                local += worker.run(name)
+            except (OSError, http.client.HTTPException, ValueError, KeyError):
+                local.append((name, 0, 0.0))
+        if record:
+            with lock:
+                for name, status, elapsed in local:
+                    if status == 0 or status >= 400:
+                        errors[name] += 1
+                    else:
+                        samples[name].append(elapsed)
+
+    threads = [threading.Thread(target=loop, args=(n,), daemon=True) for n in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return samples, errors, time.perf_counter() - start
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+
+def summarize(samples, errors, elapsed):
+    out = {}
+    for name in sorted(set(samples) | set(errors)):
+        lat = sorted(samples.get(name, []))
+        out[name] = {
+            "count": len(lat),
+            "errors": errors.get(name, 0),
+            "rps": round(len(lat) / elapsed, 2),
+            "p50_ms": round(percentile(lat, 50) * 1000, 2),
+            "p95_ms": round(percentile(lat, 95) * 1000, 2),
+            "p99_ms": round(percentile(lat, 99) * 1000, 2),
+            "max_ms": round((lat[-1] if lat else 0) * 1000, 2),
+        }
+    return out
+
+
+def print_report(endpoints, elapsed):
+    print(f"{'endpoint':<36}{'count':>8}{'err':>6}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    for name, r in endpoints.items():
+        print(f"{name:<36}{r['count']:>8}{r['errors']:>6}{r['rps']:>9.1f}"
+              f"{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}{r['max_ms']:>9.1f}")
+    total = sum(r["count"] for n, r in endpoints.items() if not n.endswith("TTFB"))
+    print(f"total {total} requests in {elapsed:.1f}s → {total / elapsed:.1f} req/s  (ms 단위)")
+
+
+# -------------------------------
+# 기준 저장 / 비교
+# -------------------------------
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "local"
+
+
+def compare(endpoints, baseline_path):
+    with open(baseline_path, encoding="utf-8") as f:
+        base = json.load(f)
+    if base.get("params") and base["params"] != current_params:
+        print(f"주의: 기준({baseline_path})과 부하 설정이 다릅니다 → {base['params']}")
+    regressions = []
+    print(f"\nvs {baseline_path} ({base.get('commit')})")
+    print(f"{'endpoint':<36}{'p95 base':>10}{'p95 now':>10}{'rps base':>10}{'rps now':>10}")
+    for name, r in endpoints.items():
+        b = base["endpoints"].get(name)
+        if b is None:
+            continue
+        slower = r["p95_ms"] > b["p95_ms"] * (1 + TOLERANCE) and r["p95_ms"] - b["p95_ms"] >= NOISE_MS
+        fewer = not name.endswith("TTFB") and r["rps"] < b["rps"] * (1 - TOLERANCE)
+        mark = "  <-- 회귀" if slower or fewer else ""
+        if mark:
+            regressions.append(name)
+        print(f"{name:<36}{b['p95_ms']:>10.1f}{r['p95_ms']:>10.1f}{b['rps']:>10.1f}{r['rps']:>10.1f}{mark}")
+    return regressions
+
+
+def parse_mix(raw):
+    if not raw:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in raw.split(","):
+        name, _, weight = part.rpartition("=")
+        if name.strip() not in DEFAULT_MIX:
+            raise SystemExit(f"알 수 없는 요청: {name.strip()} (가능: {', '.join(DEFAULT_MIX)})")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def main():
+    ap = argparse.ArgumentParser(description="API 벤치마크 (가짜 LLM + 벤치 전용 DB)")
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--duration", type=float, default=30)
+    ap.add_argument("--warmup", type=float, default=5)
+    ap.add_argument("--users", type=int, default=20)
+    ap.add_argument("--diaries", type=int, default=200, help="사용자당 시드 일기 수")
+    ap.add_argument("--mix", help='"이름=가중치,..." (기본: DEFAULT_MIX)')
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--server", choices=["flask", "uvicorn"], default="flask")
+    ap.add_argument("--port", type=int, default=5055)
+    ap.add_argument("--base-url", help="이미 떠 있는 서버를 측정 (DB 준비/앱 실행 생략)")
+    ap.add_argument("--db-name", default=os.getenv("BENCH_DB_NAME", "gpt_app_bench"))
+    ap.add_argument("--fresh", action="store_true", help="벤치 데이터베이스를 지우고 새로 시드")
+    ap.add_argument("--rate-limit", action="store_true", help="레이트 리밋을 켠 채로 측정")
+    ap.add_argument("--analysis-workers", type=int, default=1)
+    ap.add_argument("--llm-port", type=int, default=8089)
+    ap.add_argument("--llm-latency-ms", type=float, default=300)
+    ap.add_argument("--llm-tokens-per-sec", type=float, default=200)
+    ap.add_argument("--llm-tokens", type=int, default=80)
+    ap.add_argument("--llm-error-rate", type=float, default=0.0)
+    ap.add_argument("--save", nargs="?", const="", help="결과 저장 이름/경로 (생략 시 bench_baselines/<커밋>.json)")
+    ap.add_argument("--compare", help="기준 결과 JSON 과 비교, 회귀가 있으면 exit 1")
+    args = ap.parse_args()
+    if args.compare and not os.path.exists(args.compare):
+        # 측정을 다 돌린 뒤에 실패하지 않도록 먼저 확인
+        ap.error(f"기준 파일이 없습니다: {args.compare} (먼저 --save 로 만드세요)")
+    mix = parse_mix(args.mix)
+    rng = random.Random(args.seed)
+    current_params.update(concurrency=args.concurrency, duration=args.duration, users=args.users,
+                          diaries=args.diaries, server=args.server, mix=mix,
+                          llm=[args.llm_latency_ms, args.llm_tokens_per_sec, args.llm_tokens, args.llm_error_rate])
+
+    procs, llm_server = [], None
+    base_url = args.base_url
+    try:
+        if base_url is None:
+            import fake_groq
+            llm_server, _ = fake_groq.serve(args.llm_port, latency_ms=args.llm_latency_ms,
+                                            tokens_per_sec=args.llm_tokens_per_sec, tokens=args.llm_tokens,
+                                            error_rate=args.llm_error_rate, seed=args.seed)
+            os.environ["DB_NAME"] = args.db_name
+            prepare_db(args.db_name, args.fresh)
+            env = dict(os.environ, DB_NAME=args.db_name, GROQ_API_KEY="fake",
+                       GROQ_BASE_URL=f"http://127.0.0.1:{args.llm_port}", METRICS_TOKEN="")
+            if not args.rate_limit:
+                env["RATE_LIMIT_ENABLED"] = "0"
+            base_url = f"http://127.0.0.1:{args.port}"
+            app = start_app(args.server, args.port, env)
+            procs.append(app)
+            if args.analysis_workers:
+                procs.append(start_process([sys.executable, "-m", "services.emotion_analysis",
+                                            "--workers", str(args.analysis_workers)], env, "analysis"))
+            wait_ready(base_url, app)
+        else:
+            wait_ready(base_url, None)
+
+        tokens = seed(base_url, args.users, args.diaries, rng)
+        if args.warmup:
+            run_load(base_url, tokens, mix, args.concurrency, args.warmup, args.seed - 1, record=False)
+        samples, errors, elapsed = run_load(base_url, tokens, mix, args.concurrency, args.duration, args.seed)
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            try:
+                p.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+        if llm_server is not None:
+            llm_server.shutdown()
+
+    endpoints = summarize(samples, errors, elapsed)
+    print_report(endpoints, elapsed)
+
+    result = {"commit": git_commit(), "date": datetime.now().isoformat(timespec="seconds"),
+              "params": current_params, "elapsed": round(elapsed, 2), "endpoints": endpoints}
+    if args.save is not None:
+        path = args.save or result["commit"]
+        if os.sep not in path and not path.endswith(".json"):
+            # 이름만 주면 bench_baselines/<이름>.json
+            path = os.path.join(BASELINE_DIR, f"{path}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"saved → {path}")
+    if args.compare:
+        regressions = compare(endpoints, args.compare)
+        if regressions:
+            print(f"\n회귀: {', '.join(regressions)} (허용 {TOLERANCE:.0%}, 노이즈 {NOISE_MS}ms)")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
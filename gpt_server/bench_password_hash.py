@@ -0,0 +1,38 @@
+# bench_password_hash.py
+#  로그인 1건 = scrypt 검증 1회. 워커 수별 초당 검증 횟수(= logins/sec)를 측정합니다.
+#  사용법: python bench_password_hash.py [초(기본 5)]
+#  PASSWORD_SCRYPT_N/_R/_P 로 비용을 바꿔 가며 실행해 보세요.
+import os
+import sys
+import time
+
+from services.password_hasher import PasswordHasher, current_method, verify_password_compat
+
+
+def bench(workers: int, seconds: float) -> float:
+    hasher = PasswordHasher(workers=workers, max_pending=workers * 2, timeout=60)
+    stored = hasher.hash("bench-password")
+    hasher.verify(stored, "bench-password")  # 워커 프로세스 예열
+
+    done = 0
+    inflight = []
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    while time.perf_counter() < deadline:
+        while len(inflight) < workers * 2:
+            inflight.append(hasher.submit(verify_password_compat, stored, "bench-password"))
+        inflight.pop(0).result()
+        done += 1
+    for f in inflight:
+        f.result()
+        done += 1
+    return done / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+    cores = os.cpu_count() or 1
+    print(f"method={current_method()} cores={cores}")
+    for workers in sorted({1, max(1, cores // 2), cores}):
+        rate = bench(workers, seconds)
+        print(f"workers={workers:<3} logins/sec={rate:8.1f}  per core={rate / workers:6.1f}")
@@ -0,0 +1,86 @@
+# bench_roundtrips.py
+#  엔드포인트별 DB 왕복(round-trip) 수를 셉니다. 실제 DB(마이그레이션 적용)에 대해 실행하세요.
+#  사용법: python bench_roundtrips.py [반복 횟수(기본 20)]
+#  - pymysql 이 서버로 명령을 보낼 때마다(_execute_command) 1회로 셉니다 (BEGIN/COMMIT 포함).
+#  - 연결 풀의 헬스체크 PING 은 유휴 시간에 따라 달라지므로 따로 표시합니다.
+#  - BEFORE 는 변경 전 코드(사전 SELECT, LAST_INSERT_ID(), 수정 후 재조회, /me 매번 조회)에서 센 값입니다.
+import sys
+import time
+import uuid
+from collections import Counter
+
+from pymysql.connections import Connection
+from pymysql.constants import COMMAND
+
+from gpt_server import create_app
+
+BEFORE = {
+    "POST /api/auth/signup": 4,
+    "POST /api/auth/login": 1,
+    "GET /api/auth/me": 1,
+    "POST /api/history": 8,
+    "PUT /api/history/<id> (notes)": 8,
+    "PUT /api/history/<id> (mood)": 8,
+}
+
+_counts = Counter()
+_orig = Connection._execute_command
+
+
+def _counting(self, command, sql):
+    _counts["ping" if command == COMMAND.COM_PING else "query"] += 1
+    return _orig(self, command, sql)
+
+
+Connection._execute_command = _counting
+
+
+def measure(fn):
+    _counts.clear()
+    start = time.perf_counter()
+    resp = fn()
+    elapsed = time.perf_counter() - start
+    assert resp.status_code < 400, (resp.status_code, resp.get_data(as_text=True))
+    return _counts["query"], _counts["ping"], elapsed, resp
+
+
+def main(repeat: int):
+    client = create_app().test_client()
+    user_id = f"bench_{uuid.uuid4().hex[:10]}"
+    password = "bench-password"
+    results = {}
+
+    def record(name, fn):
+        q, p, t, resp = measure(fn)
+        rows = results.setdefault(name, [])
+        rows.append((q, p, t))
+        return resp
+
+    resp = record("POST /api/auth/signup", lambda: client.post(
+        "/api/auth/signup", json={"user_id": user_id, "user_name": "Bench", "password": password}))
+    token = resp.get_json()["access_token"]
+    auth = {"Authorization": f"Bearer {token}"}
+    record("POST /api/auth/login", lambda: client.post(
+        "/api/auth/login", json={"user_id": user_id, "password": password}))
+
+    for i in range(repeat):
+        record("GET /api/auth/me", lambda: client.get("/api/auth/me", headers=auth))
+        resp = record("POST /api/history", lambda: client.post(
+            "/api/history", headers=auth, json={"mood": "happy", "notes": f"오늘은 기분이 좋았다 {i}"}))
+        diary_id = resp.get_json()["item"]["id"]
+        record("PUT /api/history/<id> (notes)", lambda: client.put(
+            f"/api/history/{diary_id}", headers=auth, json={"mood": "happy", "notes": f"수정된 일기 {i}"}))
+        record("PUT /api/history/<id> (mood)", lambda: client.put(
+            f"/api/history/{diary_id}", headers=auth, json={"mood": "sad", "notes": f"수정된 일기 {i}"}))
+        client.delete(f"/api/history/{diary_id}", headers=auth)
+
+    print(f"{'endpoint':<32}{'before':>8}{'after':>8}{'pings':>7}{'avg ms':>9}")
+    for name, rows in results.items():
+        after = max(q for q, _, _ in rows)
+        pings = sum(p for _, p, _ in rows)
+        avg_ms = sum(t for _, _, t in rows) / len(rows) * 1000
+        print(f"{name:<32}{BEFORE.get(name, '-'):>8}{after:>8}{pings:>7}{avg_ms:>9.1f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,52 @@
+# bench_startup.py
+#  워커 콜드 스타트 비용을 측정합니다. 매 회 새 파이썬 프로세스에서
+#    import gpt_server → create_app() → 첫 요청(GET /metrics, DB/Groq 접속 없음)
+#  까지의 시간과, 그 시점에 groq SDK 가 로드됐는지 / DB 연결이 생겼는지를 출력합니다.
+#  사용법: python bench_startup.py [반복 횟수(기본 10)]
+#  GROQ_API_KEY / DB 없이도 실행됩니다 (지연 초기화 확인용).
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+CHILD = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import gpt_server
+t1 = time.perf_counter()
+app = gpt_server.create_app()
+t2 = time.perf_counter()
+resp = app.test_client().get("/metrics")
+t3 = time.perf_counter()
+import db
+print(json.dumps({
+    "import_ms": (t1 - t0) * 1000,
+    "create_app_ms": (t2 - t1) * 1000,
+    "first_request_ms": (t3 - t2) * 1000,
+    "status": resp.status_code,
+    "groq_loaded": "groq" in sys.modules,
+    "db_pool_created": db._pool is not None,
+}))
+"""
+
+
+def run_once(env):
+    out = subprocess.run([sys.executable, "-c", CHILD], cwd=os.path.dirname(os.path.abspath(__file__)),
+                         env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main(repeat: int):
+    env = dict(os.environ)
+    env.pop("METRICS_TOKEN", None)
+    runs = [run_once(env) for _ in range(repeat)]
+    for key in ("import_ms", "create_app_ms", "first_request_ms"):
+        values = [r[key] for r in runs]
+        print(f"{key:<18} median={statistics.median(values):8.1f}  min={min(values):8.1f}  max={max(values):8.1f}")
+    last = runs[-1]
+    print(f"status={last['status']} groq_loaded={last['groq_loaded']} db_pool_created={last['db_pool_created']}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
@@ -0,0 +1,78 @@
+# bench_vectors.py
+#  일기 벡터 색인(services/diary_vectors.py) 벤치마크 — DB 없이 임시 디렉터리에서 실행
+#  - build   : N 개 일기를 배치(upsert_many)로 색인하는 시간, 한 건씩(upsert) 추가하는 시간
+#  - memory  : 1만 건당 디스크 크기(vectors.npy + ids.npy)와 로드 후 파이썬 메모리(tracemalloc)
+#  - query   : top-k 조회 지연 p50/p95/p99 (캐시된 색인 / 매번 다시 여는 색인)
+#  사용법: python bench_vectors.py [일기 수(기본 10000)] [조회 수(기본 500)]
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+WORDS = ["오늘", "회사에서", "친구와", "산책을", "했다", "불안해요", "기분이", "좋았다", "피곤한", "하루", "잠을",
+         "못", "잤다", "가족과", "저녁을", "먹었다", "운동", "공부", "시험", "비가", "왔다", "외로웠다", "감사한",
+         "발표", "면접", "걱정", "여행", "카페", "음악", "영화", "월요일", "주말", "야근", "두통", "행복했다"]
+MOODS = ["happy", "sad", "angry", "anxious", "calm", "tired"]
+
+
+def pct(values, p):
+    values = sorted(values)
+    return values[max(0, int(round(p / 100 * len(values))) - 1)] * 1000
+
+
+def main(n, queries):
+    os.environ["DIARY_VECTOR_DIR"] = tempfile.mkdtemp(prefix="diary_vectors_")
+    from services import diary_vectors as dv
+
+    rng = random.Random(7)
+    rows = [{"id": i + 1, "mood": rng.choice(MOODS), "notes": " ".join(rng.choices(WORDS, k=rng.randint(8, 40)))}
+            for i in range(n)]
+
+    t0 = time.perf_counter()
+    for start in range(0, n, 1000):
+        dv.upsert_many(1, rows[start:start + 1000])
+    build = time.perf_counter() - t0
+
+    single = min(n, 500)
+    t0 = time.perf_counter()
+    for r in rows[:single]:
+        dv.upsert(2, r["id"], r["mood"], r["notes"])
+    per_write = (time.perf_counter() - t0) / single
+
+    path = dv._path(1)
+    disk = sum(os.path.getsize(os.path.join(path, f)) for f in ("vectors.npy", "ids.npy", "meta.json"))
+    dv._cache.clear()
+    tracemalloc.start()
+    idx = dv._index(1)
+    mem, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    texts = [" ".join(rng.choices(WORDS, k=rng.randint(3, 12))) for _ in range(queries)]
+    warm = []
+    for text in texts:
+        t0 = time.perf_counter()
+        dv.search(1, text)
+        warm.append(time.perf_counter() - t0)
+    cold = []
+    for text in texts[:min(queries, 100)]:
+        dv._cache.clear()
+        t0 = time.perf_counter()
+        dv.search(1, text)
+        cold.append(time.perf_counter() - t0)
+
+    per10k = 10000 / n
+    print(f"entries            {n}  (dim={dv.DIARY_VECTOR_DIM}, int8)")
+    print(f"build (batch)      {build * 1000:9.1f} ms total   {build / n * 1e6:7.1f} us/entry")
+    print(f"build (one by one) {per_write * 1000:9.3f} ms/entry (upsert 한 건 = 파일 잠금 + meta 저장 포함)")
+    print(f"disk / 10k         {disk * per10k / 1024 / 1024:9.2f} MiB   (live={idx.live}, capacity={idx.vectors.shape[0]})")
+    print(f"python mem / 10k   {mem * per10k / 1024 / 1024:9.2f} MiB   (id→행 dict 등, memmap 페이지 제외)")
+    print(f"query warm         p50={pct(warm, 50):7.3f}ms  p95={pct(warm, 95):7.3f}ms  p99={pct(warm, 99):7.3f}ms"
+          f"  mean={statistics.mean(warm) * 1000:7.3f}ms")
+    print(f"query cold (reopen) p50={pct(cold, 50):7.3f}ms  p95={pct(cold, 95):7.3f}ms  p99={pct(cold, 99):7.3f}ms")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000, int(sys.argv[2]) if len(sys.argv) > 2 else 500)
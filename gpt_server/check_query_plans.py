@@ -0,0 +1,80 @@
+# check_query_plans.py
+#  일기 조회 쿼리들의 실행 계획(EXPLAIN)을 확인해 전체 스캔이 있으면 실패(exit 1)합니다.
+#  마이그레이션 적용 후 / 쿼리 수정 후 실행하세요:  python check_query_plans.py [user_pk]
+#  행이 몇 개 없는 테이블에서는 옵티마이저가 전체 스캔을 고를 수 있으니 데이터가 채워진 DB에서 실행하세요.
+#  아래 쿼리는 gpt_server.diary_list / routes/diary.diary_collection 이 만드는 형태와 같게 유지합니다.
+import sys
+
+from db import get_conn
+from services import diary_archive, diary_search
+
+COLS = "id, mood, notes, created_at, updated_at"
+LIVE = "user_pk=%s AND deleted_at IS NULL"
+ORDER = "ORDER BY created_at DESC, id DESC LIMIT 21"
+
+
+def queries(user_pk):
+    join_sql, join_params = diary_search.match_clause(user_pk, "불안해요")
+    return [
+        ("list", f"SELECT {COLS} FROM emotion_diary WHERE {LIVE} {ORDER}", [user_pk]),
+        ("list mood", f"SELECT {COLS} FROM emotion_diary WHERE {LIVE} AND mood=%s {ORDER}",
+         [user_pk, "happy"]),
+        ("list mood IN", f"SELECT {COLS} FROM emotion_diary WHERE {LIVE} AND mood IN (%s, %s) {ORDER}",
+         [user_pk, "happy", "sad"]),
+        ("list range",
+         f"SELECT {COLS} FROM emotion_diary WHERE {LIVE} AND created_at >= %s "
+         f"AND created_at < DATE(%s) + INTERVAL 1 DAY {ORDER}",
+         [user_pk, "2024-01-01", "2024-12-31"]),
+        ("list keyset",
+         f"SELECT {COLS} FROM emotion_diary WHERE {LIVE} "
+         f"AND (created_at < %s OR (created_at = %s AND id < %s)) {ORDER}",
+         [user_pk, "2024-06-01 00:00:00", "2024-06-01 00:00:00", 1000]),
+        ("count", f"SELECT COUNT(*) AS cnt FROM emotion_diary WHERE {LIVE}", [user_pk]),
+        ("search", f"SELECT {COLS} FROM emotion_diary {join_sql} WHERE {LIVE} {ORDER}",
+         [*join_params, user_pk]),
+        # services/diary_archive.py 정리 작업의 배치 선택
+        ("maint purge", "SELECT id FROM emotion_diary WHERE deleted_at < %s ORDER BY deleted_at, id LIMIT 500",
+         ["2024-01-01 00:00:00"]),
+        ("maint archive",
+         "SELECT id FROM emotion_diary WHERE deleted_at IS NULL AND created_at < %s ORDER BY created_at, id LIMIT 500",
+         ["2024-01-01 00:00:00"]),
+        # services/diary_sync.fetch_changes (보관분 포함)
+        ("changes",
+         f"SELECT id, change_version FROM {diary_archive.source(True)} "
+         f"WHERE user_pk=%s AND change_version > %s ORDER BY change_version, id LIMIT 501",
+         [user_pk, 0]),
+        ("archive probe", "SELECT 1 FROM emotion_diary_archive WHERE user_pk=%s AND created_at >= %s LIMIT 1",
+         [user_pk, "2024-01-01"]),
+    ]
+
+
+def bad_rows(plan):
+    # type=ALL: 테이블 전체 스캔, type=index: 인덱스 전체 스캔 (둘 다 행 수에 비례)
+    out = []
+    for row in plan:
+        table = row.get("table") or ""
+        if table.startswith("<"):  # 파생 테이블 자체(<derived2>) 는 제외
+            continue
+        if row.get("type") in ("ALL", "index"):
+            out.append(f"{table}: type={row['type']} key={row.get('key')} rows={row.get('rows')}")
+    return out
+
+
+def main(user_pk):
+    failed = 0
+    with get_conn() as conn, conn.cursor() as cur:
+        for name, sql, params in queries(user_pk):
+            cur.execute("EXPLAIN " + sql, params)
+            plan = cur.fetchall()
+            bad = bad_rows(plan)
+            keys = ", ".join(f"{r.get('table')}:{r.get('key')}" for r in plan)
+            if bad:
+                failed += 1
+                print(f"FAIL {name:<14} {'; '.join(bad)}")
+            else:
+                print(f"ok   {name:<14} {keys}")
+    return failed
+
+
+if __name__ == "__main__":
+    sys.exit(1 if main(int(sys.argv[1]) if len(sys.argv) > 1 else 1) else 0)
@@ -0,0 +1,101 @@
+# check_read_routing.py
+#  읽기 복제본 라우팅(db.get_read_conn) 점검 — 주 DB + 복제본 한 대 이상이 떠 있는 환경에서 실행합니다.
+#  사용법: DB_REPLICAS=127.0.0.1:3307 python check_read_routing.py [반복 수(기본 200)]
+#  - 복제본이 점검을 통과해 읽기 후보가 되는지
+#  - 고정되지 않은 사용자의 읽기가 복제본(@@server_id 가 다른 서버)으로 가는지
+#  - 쓰기 직후(note_write) 같은 사용자의 읽기가 항상 자기 쓰기를 보는지 (한 번이라도 못 보면 exit 1)
+#  - 참고용: 고정 없이 바로 복제본에서 읽었다면 몇 번이나 옛 값을 봤을지
+#  주 DB 에 임시 테이블(replica_route_check)을 만들었다가 지웁니다.
+import sys
+import time
+
+import db
+
+TABLE = "replica_route_check"
+WRITER = -1      # 쓰기 후 고정되는 가상 사용자
+READER = -2      # 고정되지 않은 가상 사용자
+
+
+def server_id(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT @@server_id AS id")
+        return cur.fetchone()["id"]
+
+
+def read_value(conn):
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT v FROM {TABLE} WHERE id=1")
+        row = cur.fetchone()
+        return row["v"] if row else None
+
+
+def wait_healthy(timeout=15.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = db.replica_status()
+        if any(r["usable"] for r in status):
+            return status
+        time.sleep(0.2)
+    return db.replica_status()
+
+
+def main(rounds):
+    if not db.REPLICAS:
+        print("DB_REPLICAS 가 비어 있습니다. 예) DB_REPLICAS=127.0.0.1:3307 python check_read_routing.py")
+        return 2
+
+    with db.get_conn() as conn, conn.cursor() as cur:
+        primary_id = server_id(conn)
+        cur.execute(f"CREATE TABLE IF NOT EXISTS {TABLE} (id INT PRIMARY KEY, v INT NOT NULL) ENGINE=InnoDB")
+        cur.execute(f"REPLACE INTO {TABLE} (id, v) VALUES (1, 0)")
+
+    status = wait_healthy()
+    for r in status:
+        print(f"replica {r['name']:<20} usable={r['usable']} lag={r['lag']} pos={r['pos']} error={r['error']}")
+    if not any(r["usable"] for r in status):
+        print("FAIL 읽기 후보가 되는 복제본이 없습니다.")
+        return 1
+
+    # 고정되지 않은 사용자 → 복제본
+    with db.get_read_conn(READER) as conn:
+        reader_id = server_id(conn)
+    routed = "replica" if reader_id != primary_id else "primary"
+    print(f"unpinned read   → server_id={reader_id} ({routed})")
+
+    stale_pinned = stale_unpinned = to_primary = 0
+    replica = next(r for r in db.get_replicas() if r.usable())
+    for v in range(1, rounds + 1):
+        with db.get_conn() as conn, conn.cursor() as cur:
+            conn.begin()
+            cur.execute(f"UPDATE {TABLE} SET v=%s WHERE id=1", (v,))
+            conn.commit()
+            db.note_write(cur, WRITER)
+
+        # 고정 없이 복제본에서 바로 읽었다면 (참고용)
+        with replica.pool.acquire() as conn:
+            if read_value(conn) != v:
+                stale_unpinned += 1
+
+        with db.get_read_conn(WRITER) as conn:
+            if server_id(conn) == primary_id:
+                to_primary += 1
+            if read_value(conn) != v:
+                stale_pinned += 1
+
+    print(f"writes          {rounds}")
+    print(f"stale (pinned)  {stale_pinned}   ← 0 이어야 함")
+    print(f"stale (no pin)  {stale_unpinned}   (복제 지연을 그대로 노출했을 때)")
+    print(f"pinned → primary {to_primary} / replica {rounds - to_primary}")
+
+    with db.get_conn() as conn, conn.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+    if routed != "replica" or stale_pinned:
+        print("FAIL")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200))
@@ -1,9 +1,30 @@
-# db.py
 import os
+import random
+import re
+import threading
+import time
+from collections import deque
+
 import pymysql
-from dotenv import load_dotenv
+from pymysql.constants import SERVER_STATUS
+
+import config  # noqa: F401 (.env 로드)
+from services import metrics, profiler
+
+
+class TimedDictCursor(pymysql.cursors.DictCursor):
+    """execute 마다 소요 시간을 db_query_duration_seconds 에 기록합니다."""
+
+    def execute(self, query, args=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, args)
+        finally:
+            end = time.perf_counter()
+            verb = query.lstrip().split(None, 1)[0].upper() if query.strip() else "?"
+            metrics.DB_QUERY.observe(end - start, statement=verb)
+            profiler.record("db.query", start, end, statement=verb)
 
-load_dotenv()
 
 DB_CONF = dict(
     host=os.getenv("DB_HOST", "127.0.0.1"),
@@ -12,9 +33,502 @@ DB_CONF = dict(
     database=os.getenv("DB_NAME", "gpt_app"),
     port=int(os.getenv("DB_PORT", "3306")),
     charset="utf8mb4",
-    cursorclass=pymysql.cursors.DictCursor,
+    cursorclass=TimedDictCursor,
     autocommit=True,
 )
 
+# -------------------------------
+# Connection Pool
+#  - 요청마다 TCP 연결 + 로그인 핸드셰이크를 하지 않도록 연결을 재사용합니다.
+#  - DB_POOL_SIZE      : 최대 동시 연결 수 (max_connections 보호)
+#  - DB_POOL_TIMEOUT   : 풀이 가득 찼을 때 대기할 최대 시간(초)
+#  - DB_POOL_MAX_IDLE  : 이 시간(초) 이상 놀고 있던 연결은 버리고 새로 연결
+#  - DB_POOL_PING_AFTER: 이 시간(초) 이상 놀았던 연결은 체크아웃 시 ping 으로 확인
+# -------------------------------
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))
+POOL_PING_AFTER = float(os.getenv("DB_POOL_PING_AFTER", "5"))
+
+
+class PoolTimeout(pymysql.err.OperationalError):
+    pass
+
+
+class PooledConnection:
+    """pymysql 연결을 감싼 프록시. close() / with 블록 종료 시 풀로 반납됩니다."""
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+
+    def __getattr__(self, name):
+        raw = self.__dict__.get("_raw")
+        if raw is None:
+            raise pymysql.err.InterfaceError("이미 풀로 반납된 연결입니다.")
+        return getattr(raw, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(broken=exc_type is not None)
+
+    def close(self, broken=False):
+        raw, self._raw = self._raw, None
+        if raw is not None:
+            self._pool._release(raw, broken=broken)
+
+    def discard(self):
+        """재사용하지 않고 버립니다 (예: 다 읽지 않은 SSCursor 결과가 남은 연결)."""
+        raw, self._raw = self._raw, None
+        if raw is not None:
+            self._pool._release(raw, discard=True)
+
+
+class ConnectionPool:
+    def __init__(self, conf, size=POOL_SIZE, timeout=POOL_TIMEOUT,
+                 max_idle=POOL_MAX_IDLE, ping_after=POOL_PING_AFTER):
+        self.conf = conf
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.ping_after = ping_after
+
+        self._idle = deque()          # (raw, last_used)
+        self._cond = threading.Condition()
+        self._in_use = 0              # 체크아웃 + 생성 중인 연결 수
+        self._stats = dict(
+            checkouts=0, created=0, discarded=0, timeouts=0,
+            wait_total=0.0, wait_max=0.0,
+        )
+
+    # ---- 내부 ----
+    def _connect(self):
+        raw = pymysql.connect(**self.conf)
+        with self._cond:
+            self._stats["created"] += 1
+        return raw
+
+    def _discard(self, raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._stats["discarded"] += 1
+
+    def _healthy(self, raw, last_used):
+        idle = time.monotonic() - last_used
+        if idle > self.max_idle:
+            return False
+        if idle > self.ping_after:
+            try:
+                raw.ping(reconnect=False)
+            except Exception:
+                return False
+        return True
+
+    def _release(self, raw, broken=False, discard=False):
+        # 예외로 빠져나왔거나 커밋되지 않은 트랜잭션이 남은 연결은 되돌린 뒤에만 재사용
+        reusable = raw.open and not discard
+        in_trans = reusable and raw.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS
+        if reusable and (broken or in_trans):
+            try:
+                raw.rollback()
+            except Exception:
+                reusable = False
+        if not reusable:
+            self._discard(raw)
+            raw = None
+        with self._cond:
+            self._in_use -= 1
+            if raw is not None:
+                self._idle.append((raw, time.monotonic()))
+            self._cond.notify()
+
+    # ---- 공개 API ----
+    def acquire(self):
+        with profiler.span("db.acquire", host=self.conf["host"]):
+            return self._acquire()
+
+    def _acquire(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        with self._cond:
+            while not self._idle and self._in_use >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeout(f"DB 연결 풀 대기 시간 초과 ({self.timeout:.1f}s)")
+                self._cond.wait(remaining)
+            self._in_use += 1
+            # LIFO: 가장 최근에 쓴 연결이 살아있을 확률이 높다
+            item = self._idle.pop() if self._idle else None
+            waited = time.monotonic() - start
+            metrics.DB_POOL_WAIT.observe(waited)
+            self._stats["checkouts"] += 1
+            self._stats["wait_total"] += waited
+            self._stats["wait_max"] = max(self._stats["wait_max"], waited)
+
+        try:
+            if item is not None:
+                raw, last_used = item
+                if self._healthy(raw, last_used):
+                    return PooledConnection(self, raw)
+                self._discard(raw)
+            return PooledConnection(self, self._connect())
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+    def stats(self):
+        with self._cond:
+            s = dict(self._stats)
+            s.update(size=self.size, in_use=self._in_use, idle=len(self._idle))
+        s["wait_avg"] = s["wait_total"] / s["checkouts"] if s["checkouts"] else 0.0
+        return s
+
+    def close_all(self):
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+        for raw, _ in idle:
+            self._discard(raw)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_CONF)
+    return _pool
+
+
 def get_conn():
-    return pymysql.connect(**DB_CONF)
\ No newline at end of file
+    return get_pool().acquire()
+
+
+def pool_stats():
+    return get_pool().stats()
+
+
+metrics.Gauge("db_pool_in_use", "체크아웃된 DB 연결 수", func=lambda: pool_stats()["in_use"])
+metrics.Gauge("db_pool_idle", "유휴 DB 연결 수", func=lambda: pool_stats()["idle"])
+
+
+# -------------------------------
+# 다중 행 INSERT ... RETURNING
+#  - executemany 는 문장이 max_stmt_length(약 1MB)를 넘으면 몰래 여러 문장으로 나누고,
+#    그러면 lastrowid 는 마지막 조각의 첫 id 가 된다. id 가 연속이라는 가정도 innodb_autoinc_lock_mode=2 에서 깨진다
+#  - 그래서 VALUES 크기를 직접 세어 INSERT_MAX_BYTES 단위 문장으로 나누고, 문장마다 RETURNING 으로
+#    넣은 순서 그대로 id(와 지정한 컬럼)를 받는다 (MariaDB 10.5+)
+# -------------------------------
+INSERT_MAX_BYTES = int(os.getenv("DB_INSERT_MAX_BYTES", str(512 * 1024)))
+
+
+def insert_returning(cur, head, rows, returning="id"):
+    """head: "INSERT INTO t (a, b) VALUES", rows: [(a, b), ...] → rows 와 같은 순서의 RETURNING 결과 dict 목록."""
+    out, chunk, size = [], [], len(head)
+
+    def flush():
+        cur.execute(f"{head} {','.join(chunk)} RETURNING {returning}")
+        got = cur.fetchall()
+        if len(got) != len(chunk):
+            raise pymysql.err.DataError(f"INSERT RETURNING: {len(chunk)}행 중 {len(got)}행만 돌아옴")
+        out.extend(got)
+
+    for row in rows:
+        values = cur.mogrify("(" + ",".join(["%s"] * len(row)) + ")", row)
+        n = len(values.encode("utf-8")) + 1
+        if chunk and size + n > INSERT_MAX_BYTES:
+            flush()
+            chunk, size = [], len(head)
+        chunk.append(values)
+        size += n
+    if chunk:
+        flush()
+    return out
+
+
+# -------------------------------
+# 읽기 복제본 라우팅
+#  - DB_REPLICAS="host[:port],host[:port]" 를 지정하면 읽기 전용 조회(get_read_conn)를 복제본으로 보냅니다.
+#    사용자/비밀번호/DB 이름은 주 DB 와 같고 DB_REPLICA_USER / DB_REPLICA_PASSWORD 로 바꿀 수 있습니다.
+#  - 점검 스레드가 DB_REPLICA_CHECK_INTERVAL 초마다 복제본의 @@gtid_slave_pos 와 SHOW SLAVE STATUS 를 읽습니다.
+#    연결 실패 / 복제 중단(IO·SQL 스레드 중 하나라도 멈춤) / 지연 DB_REPLICA_MAX_LAG 초 초과인 복제본은 후보에서 빠집니다.
+#    Seconds_Behind_Master 가 NULL 이거나 SHOW SLAVE STATUS 권한이 없으면, 같은 주기에 읽은 주 DB 의
+#    @@gtid_binlog_pos 표본 중 복제본이 따라잡은 가장 최근 것의 나이를 지연으로 씁니다. 그래도 모르면 빠집니다.
+#    후보가 여럿이면 체크아웃된 연결 비율이 가장 낮은 복제본을 고릅니다.
+#  - 자기 쓰기 읽기(read-your-writes): 쓰기 커밋 직후 note_write(cur, user_pk) 가 그 트랜잭션의 GTID(@@last_gtid)를
+#    사용자 워터마크로 DB_PIN_SECONDS 초 동안 기억합니다. 그동안 그 사용자의 읽기는 워터마크까지 따라온
+#    복제본으로만, 없으면 주 DB 로 갑니다. 워터마크는 토큰(X-Read-After 헤더)으로도 주고받아
+#    다른 프로세스가 요청을 받아도 같은 규칙을 적용합니다 (accept_token).
+#  - 복제본이 없으면 get_read_conn() == get_conn() 이고 note_write 는 쿼리를 하지 않습니다.
+# -------------------------------
+REPLICAS = [h.strip() for h in os.getenv("DB_REPLICAS", "").split(",") if h.strip()]
+REPLICA_POOL_SIZE = int(os.getenv("DB_REPLICA_POOL_SIZE", str(POOL_SIZE)))
+REPLICA_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", "1"))
+REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", "5"))
+REPLICA_CONNECT_TIMEOUT = int(os.getenv("DB_REPLICA_CONNECT_TIMEOUT", "2"))
+REPLICA_POOL_TIMEOUT = float(os.getenv("DB_REPLICA_POOL_TIMEOUT", "1"))  # 복제본 풀이 차면 이만큼만 기다리고 다른 곳으로
+PIN_SECONDS = float(os.getenv("DB_PIN_SECONDS", "10"))
+
+_GTID_RE = re.compile(r"^(\d+)-(\d+)-(\d+)$")
+
+
+def parse_gtid(text) -> dict:
+    """'0-1-120,1-2-7' → {domain: (seq, server_id)}. 형식이 틀린 조각은 버립니다."""
+    pos = {}
+    for part in (text or "").split(","):
+        m = _GTID_RE.match(part.strip())
+        if m:
+            domain, server, seq = (int(x) for x in m.groups())
+            if seq >= pos.get(domain, (-1,))[0]:
+                pos[domain] = (seq, server)
+    return pos
+
+
+def format_gtid(pos: dict) -> str:
+    return ",".join(f"{d}-{server}-{seq}" for d, (seq, server) in sorted(pos.items()))
+
+
+def gtid_covers(pos: dict, watermark: dict) -> bool:
+    """복제본 위치 pos 가 워터마크의 모든 도메인 seq 이상이면 True."""
+    return all(pos.get(d, (-1,))[0] >= seq for d, (seq, _) in watermark.items())
+
+
+class Replica:
+    def __init__(self, name, conf):
+        self.name = name
+        self.conf = conf
+        self.pool = ConnectionPool(conf, size=REPLICA_POOL_SIZE, timeout=REPLICA_POOL_TIMEOUT)
+        self._check_conn = None   # 점검 전용 연결 (풀이 가득 차도 점검은 막히지 않게)
+        self.healthy = False      # 첫 점검 전에는 주 DB 로 보낸다
+        self.pos = {}
+        self.lag = None
+        self.error = "not checked"
+
+    def load(self):
+        s = self.pool.stats()
+        return s["in_use"] / s["size"]
+
+    def usable(self, watermark=None):
+        if not self.healthy:
+            return False
+        if self.lag is None or self.lag > REPLICA_MAX_LAG:
+            return False
+        return watermark is None or gtid_covers(self.pos, watermark)
+
+    def mark_down(self, error):
+        self.healthy = False
+        self.error = str(error)
+        metrics.DB_REPLICA_HEALTHY.set(0, replica=self.name)
+
+    def check(self):
+        try:
+            if self._check_conn is None or not self._check_conn.open:
+                self._check_conn = pymysql.connect(**self.conf)
+            with self._check_conn.cursor() as cur:
+                cur.execute("SELECT @@gtid_slave_pos AS pos")
+                pos = parse_gtid(cur.fetchone()["pos"])
+                try:
+                    cur.execute("SHOW SLAVE STATUS")
+                    status = cur.fetchone()
+                    if status is None:
+                        raise RuntimeError("복제 설정이 없는 서버입니다.")
+                except pymysql.err.OperationalError as e:
+                    # REPLICATION CLIENT(SLAVE MONITOR) 권한이 없으면 지연은 모른 채 GTID 위치로만 판단
+                    if e.args[0] != 1227:
+                        raise
+                    status = None
+        except Exception as e:
+            conn, self._check_conn = self._check_conn, None
+            if conn is not None and conn.open:
+                conn.close()
+            self.mark_down(e)
+            return
+        if status is not None:
+            if status.get("Slave_SQL_Running") != "Yes":
+                self.mark_down(f"SQL 스레드 중단: {status.get('Last_SQL_Error') or status.get('Slave_SQL_Running')}")
+                return
+            if status.get("Slave_IO_Running") != "Yes":
+                # IO 스레드가 멈추면 Seconds_Behind_Master 는 NULL 이고 새 쓰기를 더 받지 못한다
+                self.mark_down(f"IO 스레드 중단: {status.get('Last_IO_Error') or status.get('Slave_IO_Running')}")
+                return
+        lag = status.get("Seconds_Behind_Master") if status is not None else None
+        if lag is None:
+            lag = _gtid_lag(pos)
+        if lag is None:
+            self.mark_down("복제 지연을 알 수 없습니다 (최근 주 DB GTID 위치를 따라잡지 못함)")
+            return
+        self.pos = pos
+        self.lag = lag
+        self.healthy, self.error = True, None
+        metrics.DB_REPLICA_HEALTHY.set(1 if self.usable() else 0, replica=self.name)
+        metrics.DB_REPLICA_LAG.set(self.lag, replica=self.name)
+
+    def describe(self):
+        return dict(name=self.name, healthy=self.healthy, usable=self.usable(), lag=self.lag,
+                    pos=format_gtid(self.pos), error=self.error, pool=self.pool.stats())
+
+
+def _replica_conf(host):
+    host, _, port = host.partition(":")
+    conf = dict(DB_CONF, host=host, port=int(port or DB_CONF["port"]), connect_timeout=REPLICA_CONNECT_TIMEOUT)
+    conf["user"] = os.getenv("DB_REPLICA_USER", conf["user"])
+    conf["password"] = os.getenv("DB_REPLICA_PASSWORD", conf["password"])
+    return conf
+
+
+_replicas = None
+_primary_samples = deque()   # (monotonic, 주 DB @@gtid_binlog_pos) — 점검 스레드만 쓴다
+_primary_check_conn = None
+
+
+def _sample_primary():
+    global _primary_check_conn
+    try:
+        if _primary_check_conn is None or not _primary_check_conn.open:
+            _primary_check_conn = pymysql.connect(**dict(DB_CONF, connect_timeout=REPLICA_CONNECT_TIMEOUT))
+        with _primary_check_conn.cursor() as cur:
+            cur.execute("SELECT @@gtid_binlog_pos AS pos")
+            pos = parse_gtid(cur.fetchone()["pos"])
+    except Exception:
+        conn, _primary_check_conn = _primary_check_conn, None
+        if conn is not None and conn.open:
+            conn.close()
+        return
+    now = time.monotonic()
+    _primary_samples.append((now, pos))
+    # REPLICA_MAX_LAG 보다 오래된 표본만 따라잡은 복제본은 어차피 후보가 아니다
+    while now - _primary_samples[0][0] > REPLICA_MAX_LAG + REPLICA_CHECK_INTERVAL:
+        _primary_samples.popleft()
+
+
+def _gtid_lag(pos):
+    """복제본 위치 pos 가 따라잡은 가장 최근 주 DB 표본의 나이(초). 알 수 없으면 None."""
+    now = time.monotonic()
+    for sampled, primary in reversed(_primary_samples):
+        if primary and gtid_covers(pos, primary):
+            return round(now - sampled, 3)
+    return None
+
+
+def _check_loop(replicas):
+    while True:
+        _sample_primary()
+        for r in replicas:
+            r.check()
+        time.sleep(REPLICA_CHECK_INTERVAL)
+
+
+def get_replicas():
+    global _replicas
+    if _replicas is None:
+        with _pool_lock:
+            if _replicas is None:
+                replicas = [Replica(h, _replica_conf(h)) for h in REPLICAS]
+                if replicas:
+                    threading.Thread(target=_check_loop, args=(replicas,), daemon=True,
+                                     name="db-replica-check").start()
+                _replicas = replicas
+    return _replicas
+
+
+# user_pk → (워터마크 dict 또는 None(GTID 를 모름 → 주 DB 만), 만료 시각)
+_pins = {}
+_pins_lock = threading.Lock()
+
+
+def _pin(user_pk, watermark):
+    now = time.monotonic()
+    with _pins_lock:
+        old = _pins.get(user_pk)
+        if old is not None and old[1] > now and watermark is not None:
+            if old[0] is None:
+                watermark = None
+            else:
+                merged = dict(old[0])
+                for d, (seq, server) in watermark.items():
+                    if seq > merged.get(d, (-1,))[0]:
+                        merged[d] = (seq, server)
+                watermark = merged
+        _pins[user_pk] = (watermark, now + PIN_SECONDS)
+        if len(_pins) > 10000:
+            for k in [k for k, (_, exp) in _pins.items() if exp <= now]:
+                del _pins[k]
+    return watermark
+
+
+def _pin_of(user_pk):
+    """(고정 여부, 워터마크)"""
+    if user_pk is None:
+        return False, None
+    item = _pins.get(user_pk)
+    if item is None or item[1] <= time.monotonic():
+        return False, None
+    return True, item[0]
+
+
+def note_write(cur, user_pk):
+    """쓰기 트랜잭션 커밋 직후 같은 연결에서 호출합니다. 복제본이 있을 때만 @@last_gtid 를 한 번 읽습니다."""
+    if not get_replicas():
+        return
+    cur.execute("SELECT @@last_gtid AS gtid")
+    watermark = parse_gtid((cur.fetchone() or {}).get("gtid"))
+    # 바이너리 로그가 꺼져 GTID 가 없으면 시간 창 동안 주 DB 로만 읽는다
+    _pin(user_pk, watermark or None)
+
+
+def pin_token(user_pk):
+    """응답 헤더로 내려줄 워터마크 토큰. 고정돼 있지 않거나 GTID 를 모르면 None."""
+    pinned, watermark = _pin_of(user_pk)
+    return format_gtid(watermark) if pinned and watermark else None
+
+
+def accept_token(user_pk, token):
+    """클라이언트가 돌려보낸 토큰을 워터마크로 받아들입니다 (다른 프로세스에서 쓴 경우)."""
+    if not get_replicas():
+        return
+    watermark = parse_gtid(token)
+    if watermark:
+        _pin(user_pk, watermark)
+
+
+def get_read_conn(user_pk=None):
+    """읽기 전용 조회용 연결. 쓰기/FOR UPDATE/트랜잭션에는 get_conn() 을 쓰세요."""
+    replicas = get_replicas()
+    if not replicas:
+        return get_conn()
+    pinned, watermark = _pin_of(user_pk)
+    if pinned and watermark is None:
+        metrics.DB_READ_ROUTE.inc(target="primary_pinned")
+        return get_conn()
+    candidates = [r for r in replicas if r.usable(watermark)]
+    while candidates:
+        best = min(r.load() for r in candidates)
+        r = random.choice([c for c in candidates if c.load() == best])
+        try:
+            conn = r.pool.acquire()
+        except PoolTimeout:
+            candidates.remove(r)
+            continue
+        except pymysql.err.MySQLError as e:
+            r.mark_down(e)
+            candidates.remove(r)
+            continue
+        metrics.DB_READ_ROUTE.inc(target="replica")
+        return conn
+    metrics.DB_READ_ROUTE.inc(target="primary_pinned" if pinned else "primary_fallback")
+    return get_conn()
+
+
+def replica_status():
+    return [r.describe() for r in get_replicas()]
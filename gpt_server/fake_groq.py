@@ -0,0 +1,142 @@
+# fake_groq.py
+#  벤치마크용 가짜 Groq(OpenAI 호환) 서버. POST .../chat/completions 만 흉내냅니다.
+#  사용법: python fake_groq.py [--port 8089] [--latency-ms 300] [--tokens-per-sec 200] [--tokens 80]
+#          → 앱은 GROQ_BASE_URL=http://127.0.0.1:8089 GROQ_API_KEY=fake 로 실행
+#  - latency-ms    : 첫 토큰까지의 지연 (TTFT)
+#  - tokens-per-sec: 이후 토큰 생성 속도 (stream=true 면 토큰마다 SSE 청크)
+#  - error-rate    : 이 비율로 503 을 돌려줘 재시도/폴백/서킷 브레이커 경로도 부하에 섞는다
+#  response_format=json_object 요청(감정 분석 워커)에는 일기 id 별 결과 JSON 을 돌려줍니다.
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ["오늘", "하루", "마음이", "조금", "편안해", "지길", "바라요.", "천천히", "숨을", "쉬어", "보세요.", "괜찮아요."]
+
+
+class FakeGroq:
+    def __init__(self, latency_ms=300.0, tokens_per_sec=200.0, tokens=80, error_rate=0.0, seed=None):
+        self.latency = latency_ms / 1000.0
+        self.token_interval = 1.0 / tokens_per_sec if tokens_per_sec > 0 else 0.0
+        self.tokens = tokens
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def _roll_error(self) -> bool:
+        with self._lock:
+            self.requests += 1
+            return self.rng.random() < self.error_rate
+
+    def _text(self, n):
+        return [WORDS[i % len(WORDS)] + " " for i in range(n)]
+
+    def _json_content(self, body):
+        user = next((m.get("content") or "" for m in body.get("messages", []) if m.get("role") == "user"), "")
+        ids = re.findall(r"\[일기 (\d+)\]", user)
+        return json.dumps({"results": [
+            {"id": int(i), "emotion": "평온", "feedback": "".join(self._text(12)).strip()} for i in ids
+        ]}, ensure_ascii=False)
+
+    def handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status, payload):
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _chunk(self, text):
+                data = text.encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                if not self.path.endswith("/chat/completions"):
+                    return self._send_json(404, {"error": {"message": "not found"}})
+                if fake._roll_error():
+                    return self._send_json(503, {"error": {"message": "fake overload", "type": "service_unavailable"}})
+
+                model = body.get("model", "fake")
+                cid = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+                created = int(time.time())
+                max_tokens = int(body.get("max_tokens") or fake.tokens)
+                time.sleep(fake.latency)
+
+                if (body.get("response_format") or {}).get("type") == "json_object":
+                    pieces = [fake._json_content(body)]
+                else:
+                    pieces = fake._text(min(fake.tokens, max_tokens))
+
+                if body.get("stream"):
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.end_headers()
+                    for piece in pieces:
+                        chunk = {"id": cid, "object": "chat.completion.chunk", "created": created, "model": model,
+                                 "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                        self._chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n")
+                        time.sleep(fake.token_interval)
+                    last = {"id": cid, "object": "chat.completion.chunk", "created": created, "model": model,
+                            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+                    self._chunk(f"data: {json.dumps(last)}\n\n")
+                    self._chunk("data: [DONE]\n\n")
+                    self.wfile.write(b"0\r\n\r\n")
+                    return
+
+                time.sleep(fake.token_interval * len(pieces))
+                self._send_json(200, {
+                    "id": cid, "object": "chat.completion", "created": created, "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(pieces)},
+                                 "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": len(pieces), "total_tokens": len(pieces)},
+                })
+
+        return Handler
+
+
+def serve(port=8089, host="127.0.0.1", **kwargs):
+    """백그라운드 스레드로 띄우고 (server, fake) 를 돌려줍니다. 끝낼 때 server.shutdown()."""
+    fake = FakeGroq(**kwargs)
+    server = ThreadingHTTPServer((host, port), fake.handler())
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="fake-groq").start()
+    return server, fake
+
+
+def main():
+    ap = argparse.ArgumentParser(description="가짜 Groq 서버")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8089)
+    ap.add_argument("--latency-ms", type=float, default=300.0)
+    ap.add_argument("--tokens-per-sec", type=float, default=200.0)
+    ap.add_argument("--tokens", type=int, default=80)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    args = ap.parse_args()
+    server, _ = serve(args.port, args.host, latency_ms=args.latency_ms, tokens_per_sec=args.tokens_per_sec,
+                      tokens=args.tokens, error_rate=args.error_rate)
+    print(f"fake groq: http://{args.host}:{args.port}  (GROQ_BASE_URL 로 지정)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,118 +1,118 @@
+import logging
+import math
 import os
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from typing import Optional
-import base64, hashlib, hmac
-from db import get_conn
+import base64, csv, io, json
+from db import accept_token, get_conn, get_read_conn, insert_returning, note_write, pin_token
 import pymysql
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 from flask_jwt_extended import (
     JWTManager, jwt_required, get_jwt_identity, verify_jwt_in_request
 )
-from werkzeug.security import check_password_hash, generate_password_hash
-from dotenv import load_dotenv
-from groq import Groq
 from routes.auth import auth_bp
+from routes.chat import chat_bp
+from routes.diary import diary_bp
+from services import (
+    admission, chat_cache, conversation, diary_archive, diary_search, diary_sync, diary_vectors, emotion_analysis, http_cache,
+    llm_client, metrics, mood_rollup, profiler,
+)
+from services.rate_limiter import rate_limited
+from services.password_hasher import verify_password_compat  # noqa: F401 (기존 import 경로 호환)
 # -------------------------------
 # App & Env
+#  - .env 는 config 모듈(db 가 import)에서 한 번만 읽는다
+#  - 모듈 import 시에는 앱/DB 풀/Groq 클라이언트를 만들지 않는다 → create_app() 참고
 # -------------------------------
-load_dotenv()
-
-app = Flask(__name__)
-app.url_map.strict_slashes = False
-
-# JWT
-app.config["JWT_SECRET_KEY"] = os.getenv("JWT_SECRET_KEY", "change_me_to_strong_secret")
-app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(
-    hours=int(os.getenv("JWT_EXPIRE_HOURS", "24"))
-)
-jwt = JWTManager(app)
-
-# CORS
-origins_env = os.getenv("FRONTEND_ORIGIN", "*")
-origin_list = [o.strip() for o in origins_env.split(",") if o.strip()]
-_allow_all = (len(origin_list) == 1 and origin_list[0] == "*")
-CORS(
-    app,
-    resources={r"/api/*": {"origins": "*" if _allow_all else origin_list}},
-    supports_credentials=False if _allow_all else True,
-    allow_headers=["Content-Type", "Authorization"],
-    methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-)
-
-app.register_blueprint(auth_bp)
+api_bp = Blueprint("api", __name__)
 
 # -------------------------------
-# LLM (Groq)
+# LLM (Groq) — 클라이언트는 services.llm_client 가 첫 호출 때 만든다
 # -------------------------------
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-MODEL_NAME = os.getenv("GPT_MODEL", "llama-3.1-70b-versatile")
+MODEL_NAME = llm_client.PRIMARY_MODEL
 SYSTEM_PROMPT = os.getenv("SYSTEM_PROMPT", "너는 마음을 어루만지는 챗봇이야.")
-if not GROQ_API_KEY:
-    raise RuntimeError("GROQ_API_KEY 환경변수가 설정되지 않았습니다.")
-gclient = Groq(api_key=GROQ_API_KEY)
-
-# -------------------------------
-# DB
-# -------------------------------
-DB_CONF = dict(
-    host=os.getenv("DB_HOST", "127.0.0.1"),
-    user=os.getenv("DB_USER", "root"),
-    password=os.getenv("DB_PASSWORD", "aaaa"),
-    database=os.getenv("DB_NAME", "gpt_app"),
-    port=int(os.getenv("DB_PORT", "3306")),
-    charset="utf8mb4",
-    cursorclass=pymysql.cursors.DictCursor,
-    autocommit=True,
-)
 
 # -------------------------------
 # Utils
 # -------------------------------
-def _b64decode_with_padding(s: str) -> bytes:
-    pad = "=" * (-len(s) % 4)
-    return base64.b64decode(s + pad)
-
-def verify_password_compat(stored_hash: str, password: str) -> bool:
-    try:
-        if check_password_hash(stored_hash, password):
-            return True
-    except Exception:
-        pass
-
-    if stored_hash.startswith("scrypt:"):
-        try:
-            header, salt, hex_digest = stored_hash.split("$", 2)
-            _, n_s, r_s, p_s = header.split(":")
-            n, r, p = int(n_s), int(r_s), int(p_s)
-
-            salt_bytes = _b64decode_with_padding(salt)
-            dk = hashlib.scrypt(
-                password.encode("utf-8"),
-                salt=salt_bytes,
-                n=n, r=r, p=p,
-                maxmem=0,
-                dklen=len(bytes.fromhex(hex_digest)),
-            )
-            return hmac.compare_digest(dk, bytes.fromhex(hex_digest))
-        except Exception:
-            return False
-    return False
-
 def parse_dt(s: Optional[str]) -> Optional[str]:
     if not s:
         return None
     s = s.strip()
-    for fmt in ("%Y-%m-%d %H:%M", "%Y-%m-%d"):
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
         try:
             return datetime.strptime(s, fmt).strftime("%Y-%m-%d %H:%M:%S")
         except ValueError:
             continue
     return None
+
+def _format_item(r) -> dict:
+    return {
+        "id": r["id"],
+        "mood": (r.get("mood") or ""),
+        "notes": (r.get("notes") or ""),
+        "createdAt": r["created_at"].strftime("%Y-%m-%d %H:%M:%S") if r.get("created_at") else None,
+        "updatedAt": r["updated_at"].strftime("%Y-%m-%d %H:%M:%S") if r.get("updated_at") else None,
+    }
+
+def _parse_day(s: Optional[str]) -> Optional[date]:
+    if not s:
+        return None
+    try:
+        return datetime.strptime(s.strip()[:10], "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+def _flag(v: Optional[str], default: bool = False) -> bool:
+    if v is None or v == "":
+        return default
+    return v.strip().lower() in ("1", "true", "yes")
+
+def encode_cursor(row) -> str:
+    raw = f"{row['created_at'].isoformat(' ')}|{row['id']}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        created_at, diary_id = raw.rsplit("|", 1)
+        datetime.fromisoformat(created_at)
+        return created_at, int(diary_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+def build_messages(history, user_message: str) -> list:
+    # 클라이언트 history 는 CHAT_CONTEXT_TOKENS 예산 안에서 최신 턴만 사용
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    user_message = conversation.clip(user_message, conversation.message_budget(SYSTEM_PROMPT))
+    messages += conversation.budget_history(SYSTEM_PROMPT, history, user_message)
+    messages.append({"role": "user", "content": user_message})
+    return messages
+
+def open_chat_session(user_pk, data):
+    """session_id 가 있으면 그 세션, session=true 면 새 세션. 둘 다 없으면 None (기존 history 방식)."""
+    session_id = data.get("session_id")
+    if not session_id and data.get("session") is not True:
+        return None
+    return conversation.open_session(user_pk or 0, str(session_id) if session_id else None)
+
+def summarize_complete(messages) -> str:
+    completion = llm_client.llm.complete(messages, path="summary", temperature=0.3, max_tokens=400)
+    return completion.choices[0].message.content
+
+def llm_error(e):
+    logging.warning(f"Groq 호출 실패: {type(e).__name__}: {e}")
+    if isinstance(e, llm_client.LLMUnavailable):
+        resp = jsonify(error=str(e))
+        resp.headers["Retry-After"] = str(max(1, math.ceil(e.retry_after)))
+        return resp, 503
+    return jsonify(error=str(e)), 500
 # -------------------------------
 # Chat (선택 인증: 게스트 허용)
 # -------------------------------
-@app.post("/api/chat")
+@api_bp.post("/api/chat")
+@rate_limited("chat")
 def chat():
     verify_jwt_in_request(optional=True)
     ident = get_jwt_identity()
@@ -127,27 +127,108 @@ def chat():
     if not user_message:
         return jsonify(error="message가 필요합니다."), 400
 
-    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
-    for turn in history:
-        r = turn.get("role")
-        c = (turn.get("content") or "").strip()
-        if r in ("user", "assistant") and c:
-            messages.append({"role": r, "content": c})
-    messages.append({"role": "user", "content": user_message})
+    try:
+        session = open_chat_session(uid["user_pk"], data)
+    except conversation.SessionNotFound:
+        return jsonify(error="대화 세션을 찾을 수 없습니다."), 404
+    if session is None:
+        messages = build_messages(history, user_message)
+    else:
+        messages, dropped = conversation.assemble(SYSTEM_PROMPT, session, user_message)
+        conversation.maybe_summarize(session, dropped, summarize_complete)
+    # 관련 일기 top-k 만 프롬프트에 (diary_context=false 로 끌 수 있음)
+    messages = diary_vectors.attach_context(messages, uid["user_pk"], user_message,
+                                            enabled=data.get("diary_context") is not False)
+
+    if _wants_stream(data):
+        return _chat_stream(messages, session, user_message)
+
+    cache_key = None
+    if chat_cache.cache is not None:
+        if session is not None or chat_cache.bypass_requested(request.headers, data):
+            cache_status = "BYPASS"
+        else:
+            cache_key = chat_cache.make_key(MODEL_NAME, messages, 0.8)
+            cached = chat_cache.cache.get(cache_key)
+            if cached is not None:
+                return jsonify(reply=cached), 200, {"X-Cache": "HIT"}
+            cache_status = "MISS"
 
     try:
-        completion = gclient.chat.completions.create(
-            model=MODEL_NAME,
-            messages=messages,
-            temperature=0.8,
-            max_tokens=1024,
-        )
+        completion = llm_client.llm.complete(messages, path="/api/chat")
         reply = completion.choices[0].message.content
-        return jsonify(reply=reply)
     except Exception as e:
-        return jsonify(error=str(e)), 500
+        return llm_error(e)
+
+    body = {"reply": reply}
+    if session is not None:
+        conversation.record_turn(session, user_message, reply)
+        body["session_id"] = session.id
+
+    if chat_cache.cache is None:
+        return jsonify(body)
+    if cache_key is not None:
+        chat_cache.cache.put(cache_key, reply)
+    return jsonify(body), 200, {"X-Cache": cache_status}
+
+def _wants_stream(data) -> bool:
+    flag = data.get("stream", request.args.get("stream"))
+    if isinstance(flag, str):
+        flag = flag.strip().lower() in ("1", "true", "yes")
+    if flag:
+        return True
+    return "text/event-stream" in (request.headers.get("Accept") or "")
+
+def _sse(event: Optional[str], payload) -> str:
+    body = json.dumps(payload, ensure_ascii=False)
+    return (f"event: {event}\n" if event else "") + f"data: {body}\n\n"
+
+def _chat_stream(messages, session=None, user_message=""):
+    # 업스트림 연결은 응답 시작 전에 열어 두어야 오류를 일반 JSON 으로 돌려줄 수 있다
+    try:
+        upstream = llm_client.llm.open_stream(messages, path="/api/chat")
+    except Exception as e:
+        return llm_error(e)
+
+    def generate():
+        # 클라이언트가 끊으면 WSGI 서버가 generator.close() 를 호출 → GeneratorExit
+        # → finally 에서 Groq 스트림도 닫아 토큰 생성을 멈춘다.
+        parts = []
+        try:
+            for delta in upstream:
+                parts.append(delta)
+                yield _sse(None, {"delta": delta})
+            done = {"done": True}
+            if session is not None:
+                # 끝까지 받은 답변만 대화에 남긴다
+                conversation.record_turn(session, user_message, "".join(parts))
+                done["session_id"] = session.id
+            yield _sse("done", done)
+        except GeneratorExit:
+            raise
+        except Exception as e:
+            yield _sse("error", {"error": str(e)})
+        finally:
+            upstream.close()
+
+    resp = Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    # generator 가 한 번도 돌지 않고 닫혀도 업스트림/지표가 정리되도록 (close 는 한 번만 실행됨)
+    resp.call_on_close(upstream.close)
+    return resp
+
+@api_bp.get("/metrics")
+def metrics_endpoint():
+    # METRICS_TOKEN 이 설정돼 있으면 Authorization: Bearer <token> 필요
+    token = os.getenv("METRICS_TOKEN")
+    if token and request.headers.get("Authorization", "") != f"Bearer {token}":
+        return jsonify(error="unauthorized"), 401
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
-@app.route("/api/chat", methods=["OPTIONS"])
+@api_bp.route("/api/chat", methods=["OPTIONS"])
 def _chat_options():
     return ("", 204)
 
@@ -156,7 +237,7 @@ def _chat_options():
 #  - auth.py 로그인 토큰은 identity=정수(사용자 PK) 입니다.
 #  - 따라서 get_jwt_identity() → int 를 user_pk로 사용하세요.
 # -------------------------------
-@app.get("/api/history")
+@api_bp.get("/api/history")
 @jwt_required()
 def diary_list():
     user_pk = get_jwt_identity()  # int
@@ -165,16 +246,36 @@ def diary_list():
     dt_from = parse_dt(request.args.get("from"))
     dt_to = parse_dt(request.args.get("to"))
 
-    page = max(1, int(request.args.get("page", "1")))
     size_param = request.args.get("size", request.args.get("page_size", "20"))
     size = min(100, max(1, int(size_param)))
+
+    # cursor 파라미터가 있으면(빈 값 = 첫 페이지) keyset 모드, 없으면 기존 page/OFFSET 모드
+    cursor_mode = "cursor" in request.args
+    after = None
+    if cursor_mode and request.args.get("cursor"):
+        after = decode_cursor(request.args["cursor"])
+        if after is None:
+            return jsonify(error="잘못된 cursor 입니다."), 400
+    page = 1 if cursor_mode else max(1, int(request.args.get("page", "1")))
     offset = (page - 1) * size
+    with_total = _flag(request.args.get("with_total"), default=not cursor_mode)
+    highlight = _flag(request.args.get("highlight"))
+    with_analysis = _flag(request.args.get("analysis"))
+
+    # 검색: 2-gram 역색인 JOIN (한 글자 검색어만 LIKE 로 대체)
+    join_sql, join_params = "", []
+    match = diary_search.match_clause(user_pk, q) if q else None
+    if match:
+        join_sql, join_params = match
+    relevance = bool(match) and request.args.get("sort") == "relevance"
+    if relevance and cursor_mode:
+        return jsonify(error="sort=relevance 는 page 모드에서만 지원합니다."), 400
 
     where = ["user_pk=%s", "deleted_at IS NULL"]
     params = [user_pk]
     if mood:
         where.append("mood=%s"); params.append(mood)
-    if q:
+    if q and not match:
         where.append("(notes LIKE %s)"); params.append(f"%{q}%")
     if dt_from:
         where.append("created_at >= %s"); params.append(dt_from)
@@ -182,40 +283,210 @@ def diary_list():
         where.append("created_at <= %s"); params.append(dt_to)
 
     where_sql = " AND ".join(where)
-    sql = f"""
-        SELECT id, mood, notes, created_at, updated_at
-        FROM emotion_diary
-        WHERE {where_sql}
-        ORDER BY created_at DESC
-        LIMIT %s OFFSET %s
-    """
-
-    with get_conn() as conn, conn.cursor() as cur:
-        cur.execute(sql, (*params, size, offset))
+    seek_sql, seek_params = "", []
+    if after:
+        seek_sql = " AND (created_at < %s OR (created_at = %s AND id < %s))"
+        seek_params = [after[0], after[0], after[1]]
+
+    # 한 건 더 읽어서 다음 페이지 존재 여부를 COUNT 없이 판단
+    order_sql = "s.score DESC, created_at DESC, id DESC" if relevance else "created_at DESC, id DESC"
+
+    # 조건부 GET: 쓰기마다 오르는 사용자 버전(PK 한 행)과 URL 로 태그를 만들고, 같으면 목록/COUNT 없이 304
+    # analysis=1 은 워커가 분석 결과를 쓸 때 버전이 오르지 않으므로 제외
+    conditional = not with_analysis
+    total = None
+    # 읽기 전용 → 복제본 (방금 쓴 사용자는 그 쓰기를 따라온 복제본 또는 주 DB, db.get_read_conn 참고)
+    with get_read_conn(user_pk) as conn, conn.cursor() as cur:
+        if conditional:
+            etag = http_cache.make_etag(
+                "history", user_pk, diary_sync.current_version(cur, user_pk), request.full_path)
+            cached = http_cache.not_modified(etag)
+            if cached is not None:
+                return cached
+        # 보관된(오래된) 일기는 from 이 그 기간에 걸칠 때만 함께 읽는다 (services/diary_archive.py)
+        source = diary_archive.source(diary_archive.needs_archive(cur, user_pk, dt_from))
+        cur.execute(f"""
+            SELECT id, mood, notes, created_at, updated_at
+            FROM {source} {join_sql}
+            WHERE {where_sql}{seek_sql}
+            ORDER BY {order_sql}
+            LIMIT %s OFFSET %s
+        """, (*join_params, *params, *seek_params, size + 1, offset))
         rows = cur.fetchall()
 
-        cur.execute(f"SELECT COUNT(*) AS cnt FROM emotion_diary WHERE {where_sql}", params)
-        total = cur.fetchone()["cnt"]
+        if with_total:
+            cur.execute(
+                f"SELECT COUNT(*) AS cnt FROM {source} {join_sql} WHERE {where_sql}",
+                (*join_params, *params),
+            )
+            total = cur.fetchone()["cnt"]
+
+    has_more = len(rows) > size
+    rows = rows[:size]
+    next_cursor = encode_cursor(rows[-1]) if has_more and rows and not relevance else None
+
+    analyses = {}
+    if with_analysis and rows:
+        with get_read_conn(user_pk) as conn, conn.cursor() as cur:
+            analyses = emotion_analysis.fetch_status(cur, user_pk, [r["id"] for r in rows])
 
     safe_items = []
-    for r in rows:
-        safe_items.append({
-            "id": r["id"],
-            "mood": (r.get("mood") or ""),
-            "notes": (r.get("notes") or ""),
-            "createdAt": r["created_at"].strftime("%Y-%m-%d %H:%M:%S") if r.get("created_at") else None,
-            "updatedAt": r["updated_at"].strftime("%Y-%m-%d %H:%M:%S") if r.get("updated_at") else None,
-        })
-
-    return jsonify(
-        items=safe_items,
-        page=page,
-        size=size,
-        total=total,
-        pages=(total + size - 1) // size
-    ), 200
-
-@app.post("/api/history")
+    with profiler.span("format", items=len(rows)):
+        for r in rows:
+            safe_items.append(_format_item(r))
+            if highlight and q:
+                safe_items[-1]["highlights"] = diary_search.highlights(r.get("notes"), q)
+            if with_analysis:
+                safe_items[-1]["analysis"] = analyses.get(r["id"])
+
+    if cursor_mode:
+        body = dict(items=safe_items, size=size, next_cursor=next_cursor)
+        if total is not None:
+            body["total"] = total
+    else:
+        body = dict(items=safe_items, page=page, size=size, next_cursor=next_cursor)
+        if total is not None:
+            body.update(total=total, pages=(total + size - 1) // size)
+    with profiler.span("json"):
+        resp = jsonify(body)
+    if conditional:
+        http_cache.tag(resp, etag)
+    return resp, 200
+
+@api_bp.get("/api/history/stats")
+@jwt_required()
+def diary_stats():
+    user_pk = get_jwt_identity()
+    today = date.today()
+    day_to = _parse_day(request.args.get("to")) or today
+    day_from = _parse_day(request.args.get("from")) or (day_to - timedelta(days=365))
+    if day_from > day_to:
+        return jsonify(error="from 은 to 보다 이후일 수 없습니다."), 400
+
+    with get_read_conn(user_pk) as conn, conn.cursor() as cur:
+        rows = mood_rollup.fetch_days(cur, user_pk, day_from, day_to)
+
+    stats = mood_rollup.summarize(rows, today)
+    return jsonify(**{"from": day_from.isoformat(), "to": day_to.isoformat()}, **stats), 200
+
+EXPORT_FIELDS = ["id", "mood", "notes", "createdAt", "updatedAt"]
+IMPORT_BATCH = int(os.getenv("IMPORT_BATCH", "500"))
+
+@api_bp.get("/api/history/export")
+@jwt_required()
+def diary_export():
+    user_pk = get_jwt_identity()
+    fmt = (request.args.get("format") or "ndjson").lower()
+    if fmt not in ("ndjson", "csv"):
+        return jsonify(error="format 은 ndjson 또는 csv 입니다."), 400
+
+    def generate():
+        # SSDictCursor: 결과를 서버에서 한 행씩 읽어 메모리 사용이 일기 수와 무관
+        conn = get_read_conn(user_pk)
+        finished = False
+        try:
+            with conn.cursor(pymysql.cursors.SSDictCursor) as cur:
+                # 내보내기는 보관된 일기까지 전부
+                cur.execute(
+                    f"SELECT id, mood, notes, created_at, updated_at FROM {diary_archive.source(True)} "
+                    f"WHERE user_pk=%s AND deleted_at IS NULL ORDER BY created_at DESC, id DESC",
+                    (user_pk,),
+                )
+                if fmt == "csv":
+                    buf = io.StringIO()
+                    writer = csv.DictWriter(buf, fieldnames=EXPORT_FIELDS)
+                    writer.writeheader()
+                    for r in cur:
+                        writer.writerow(_format_item(r))
+                        yield buf.getvalue()
+                        buf.seek(0); buf.truncate()
+                else:
+                    for r in cur:
+                        yield json.dumps(_format_item(r), ensure_ascii=False) + "\n"
+            finished = True
+        finally:
+            # 중간에 끊기면 남은 결과를 읽어 버리는 대신 연결을 폐기
+            if finished:
+                conn.close()
+            else:
+                conn.discard()
+
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    return Response(generate(), mimetype=mimetype, headers={
+        "Content-Disposition": f"attachment; filename=history.{fmt}",
+    })
+
+def _import_records(stream, content_type: str):
+    """(줄 번호, dict 또는 오류 메시지) 를 하나씩 돌려줍니다."""
+    lines = (raw.decode("utf-8-sig") if isinstance(raw, bytes) else raw for raw in stream)
+    if "csv" in content_type:
+        reader = csv.DictReader(lines)
+        for lineno, rec in enumerate(reader, start=2):
+            yield lineno, rec
+        return
+    for lineno, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            rec = json.loads(line)
+        except ValueError as e:
+            yield lineno, f"JSON 파싱 실패: {e}"
+            continue
+        yield lineno, rec if isinstance(rec, dict) else "객체가 아닙니다."
+
+def _import_flush(conn, cur, user_pk, batch):
+    conn.begin()
+    version = diary_sync.bump(cur, user_pk)
+    # 새 행의 id 는 RETURNING 으로 받는다 (lastrowid / 연속 id 가정은 문장이 나뉘면 틀린다)
+    new_rows = insert_returning(
+        cur,
+        "INSERT INTO emotion_diary (user_pk, mood, notes, created_at, change_version) VALUES",
+        [(user_pk, mood, notes, created_at, version) for mood, notes, created_at in batch],
+        "id, mood, notes",
+    )
+    diary_search.index_many(cur, user_pk, new_rows)
+    mood_rollup.apply_many(cur, user_pk, [r["id"] for r in new_rows], +1)
+    emotion_analysis.enqueue_many(cur, user_pk, new_rows)
+    conn.commit()
+    note_write(cur, user_pk)
+    diary_vectors.upsert_many(user_pk, new_rows)
+
+@api_bp.post("/api/history/import")
+@jwt_required()
+def diary_import():
+    user_pk = get_jwt_identity()
+    content_type = request.content_type or ""
+    imported, errors, batch = 0, [], []
+
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute("SELECT NOW() AS now")
+        now = cur.fetchone()["now"].strftime("%Y-%m-%d %H:%M:%S")
+        for lineno, rec in _import_records(request.stream, content_type):
+            if isinstance(rec, str):
+                errors.append({"line": lineno, "error": rec})
+                continue
+            mood = (rec.get("mood") or "").strip()
+            notes = rec.get("notes") or None
+            created_raw = rec.get("createdAt") or rec.get("created_at")
+            created_at = parse_dt(created_raw if isinstance(created_raw, str) else None)
+            if created_raw and not created_at:
+                errors.append({"line": lineno, "error": "createdAt 형식이 올바르지 않습니다."})
+                continue
+            if not mood and not notes:
+                errors.append({"line": lineno, "error": "mood 또는 notes 가 필요합니다."})
+                continue
+            batch.append((mood, notes, created_at or now))
+            if len(batch) >= IMPORT_BATCH:
+                _import_flush(conn, cur, user_pk, batch)
+                imported += len(batch)
+                batch = []
+        if batch:
+            _import_flush(conn, cur, user_pk, batch)
+            imported += len(batch)
+
+    return jsonify(ok=not errors, imported=imported, errors=errors), 200
+
+@api_bp.post("/api/history")
 @jwt_required()
 def diary_create():
     user_pk = get_jwt_identity()
@@ -224,22 +495,27 @@ def diary_create():
     notes = (data.get("notes") or None)
 
     with get_conn() as conn, conn.cursor() as cur:
+        conn.begin()
+        version = diary_sync.bump(cur, user_pk)
+        # RETURNING(MariaDB 10.5+): 삽입과 함께 id 와 서버 기본값(created_at/updated_at)을 받아
+        # LAST_INSERT_ID()/재조회 왕복 없이 응답을 만든다
         cur.execute(
-            "INSERT INTO emotion_diary (user_pk, mood, notes) VALUES (%s,%s,%s)",
-            (user_pk, mood, notes),
-        )
-        cur.execute("SELECT LAST_INSERT_ID() AS id")
-        new_id = cur.fetchone()["id"]
-
-        cur.execute(
-            "SELECT id, mood, notes, created_at, updated_at FROM emotion_diary WHERE id=%s",
-            (new_id,),
+            "INSERT INTO emotion_diary (user_pk, mood, notes, change_version) VALUES (%s,%s,%s,%s) "
+            "RETURNING id, mood, notes, created_at, updated_at",
+            (user_pk, mood, notes, version),
         )
         row = cur.fetchone()
+        diary_search.index_many(cur, user_pk, [row])
+        mood_rollup.add(cur, user_pk, [(row["created_at"].date(), row["mood"], +1)])
+        # 감정 분석은 백그라운드 워커가 처리 (services/emotion_analysis.py) → 응답은 기다리지 않는다
+        emotion_analysis.enqueue(cur, user_pk, row["id"], row["mood"], row["notes"])
+        conn.commit()
+        note_write(cur, user_pk)
+    diary_vectors.upsert(user_pk, row["id"], row["mood"], row["notes"])
 
-    return jsonify(item=row), 201
+    return jsonify(item=row, analysis={"status": "pending"}), 201
 
-@app.put("/api/history/<int:diary_id>")
+@api_bp.put("/api/history/<int:diary_id>")
 @jwt_required()
 def diary_update(diary_id: int):
     user_pk = get_jwt_identity()
@@ -248,70 +524,270 @@ def diary_update(diary_id: int):
     notes = (data.get("notes") or None)
 
     with get_conn() as conn, conn.cursor() as cur:
-        cur.execute(
-            "UPDATE emotion_diary SET mood=%s, notes=%s WHERE id=%s AND user_pk=%s AND deleted_at IS NULL",
-            (mood, notes, diary_id, user_pk),
-        )
-        if cur.rowcount == 0:
+        conn.begin()
+        # 버전 행을 먼저 잠근다 (모든 일기 쓰기가 버전 행 → 일기 행 순서, 교착 방지)
+        version = diary_sync.bump(cur, user_pk)
+        # 기존 행을 잠그며 한 번 읽어 404 판정, 롤업/색인 변경분, 응답을 모두 만든다 (수정 후 재조회 없음)
+        # NOW() 는 DB 서버 시각 → updated_at 도 서버에서 정한 값
+        lock_sql = ("SELECT mood, notes, created_at, NOW() AS now FROM emotion_diary "
+                    "WHERE id=%s AND user_pk=%s AND deleted_at IS NULL FOR UPDATE")
+        cur.execute(lock_sql, (diary_id, user_pk))
+        old = cur.fetchone()
+        if old is None and diary_archive.restore_many(cur, user_pk, [diary_id]):
+            cur.execute(lock_sql, (diary_id, user_pk))
+            old = cur.fetchone()
+        if old is None:
             return jsonify(error="수정할 항목이 없거나 권한이 없습니다."), 404
-
         cur.execute(
-            "SELECT id, mood, notes, created_at, updated_at FROM emotion_diary WHERE id=%s",
-            (diary_id,),
+            "UPDATE emotion_diary SET mood=%s, notes=%s, updated_at=%s, change_version=%s WHERE id=%s",
+            (mood, notes, old["now"], version, diary_id),
         )
-        row = cur.fetchone()
-
+        if notes != old["notes"]:
+            diary_search.index_entry(cur, user_pk, diary_id, notes)
+        # 롤업: 기존 (일자, mood) 칸에서 빼고 수정 후 칸에 더한다 (mood 가 같으면 쿼리 없음)
+        day = old["created_at"].date()
+        mood_rollup.add(cur, user_pk, [(day, old["mood"], -1), (day, mood, +1)])
+        changed = mood != old["mood"] or notes != old["notes"]
+        if changed:
+            emotion_analysis.enqueue(cur, user_pk, diary_id, mood, notes)
+        conn.commit()
+        note_write(cur, user_pk)
+    if changed:
+        diary_vectors.upsert(user_pk, diary_id, mood, notes)
+
+    row = {"id": diary_id, "mood": mood, "notes": notes,
+           "created_at": old["created_at"], "updated_at": old["now"]}
+    if changed:
+        return jsonify(item=row, analysis={"status": "pending"})
     return jsonify(item=row)
 
-@app.delete("/api/history/<int:diary_id>")
+@api_bp.get("/api/history/<int:diary_id>/analysis")
 @jwt_required()
-def diary_delete(diary_id: int):
+def diary_analysis(diary_id: int):
+    # 클라이언트 폴링용: status 가 pending/running 이면 잠시 후 다시 조회
     user_pk = get_jwt_identity()
-    with get_conn() as conn, conn.cursor() as cur:
+    with get_read_conn(user_pk) as conn, conn.cursor() as cur:
         cur.execute(
-            "UPDATE emotion_diary SET deleted_at=NOW() WHERE id=%s AND user_pk=%s AND deleted_at IS NULL",
+            "SELECT a.status, a.emotion, a.feedback, a.updated_at "
+            "FROM emotion_diary e LEFT JOIN diary_analysis a ON a.diary_id = e.id "
+            "WHERE e.id=%s AND e.user_pk=%s AND e.deleted_at IS NULL",
             (diary_id, user_pk),
         )
-        if cur.rowcount == 0:
+        row = cur.fetchone()
+    if row is None:
+        return jsonify(error="일기를 찾을 수 없습니다."), 404
+    if row["status"] is None:
+        # 분석 기능 도입 전 일기: python -m services.emotion_analysis --backfill 로 큐에 넣는다
+        return jsonify(id=diary_id, status="none", emotion=None, feedback=None, updatedAt=None)
+    return jsonify(id=diary_id, **emotion_analysis.format_status(row))
+
+@api_bp.delete("/api/history/<int:diary_id>")
+@jwt_required()
+def diary_delete(diary_id: int):
+    user_pk = get_jwt_identity()
+    with get_conn() as conn, conn.cursor() as cur:
+        conn.begin()
+        version = diary_sync.bump(cur, user_pk)
+        for attempt in (1, 2):
+            mood_rollup.apply(cur, diary_id, -1, user_pk)
+            # 행은 남기고(tombstone) 버전을 올려 /api/history/changes 에 삭제로 나오게 한다
+            cur.execute(
+                "UPDATE emotion_diary SET deleted_at=NOW(), change_version=%s "
+                "WHERE id=%s AND user_pk=%s AND deleted_at IS NULL",
+                (version, diary_id, user_pk),
+            )
+            deleted = cur.rowcount
+            # 없으면 보관된 일기인지 보고 되돌린 뒤 한 번 더
+            if deleted or attempt == 2 or not diary_archive.restore_many(cur, user_pk, [diary_id]):
+                break
+        if deleted == 0:
             return jsonify(error="삭제할 항목이 없거나 권한이 없습니다."), 404
+        diary_search.remove_entry(cur, diary_id)
+        conn.commit()
+        note_write(cur, user_pk)
+    diary_vectors.remove(user_pk, diary_id)
 
     return jsonify(ok=True)
 
-@app.route("/api/history", methods=["OPTIONS"])
-@app.route("/api/history/", methods=["OPTIONS"])
+# -------------------------------
+# 오프라인 동기화 (services/diary_sync.py)
+# -------------------------------
+@api_bp.post("/api/history/batch")
+@jwt_required()
+def diary_batch():
+    # body: {"ops": [{"key", "op": "create"|"update"|"delete", "id" | "ref", "mood", "notes", "createdAt"}]}
+    # 전체를 한 트랜잭션으로 적용하고 op 별 결과를 순서대로 돌려준다. 이미 처리된 key 는 replayed=true
+    user_pk = get_jwt_identity()
+    data = request.get_json(silent=True) or {}
+    try:
+        ops = diary_sync.validate_ops(data.get("ops"))
+    except diary_sync.BatchError as e:
+        return jsonify(error=str(e)), 400
+
+    for attempt in (1, 2):
+        try:
+            with get_conn() as conn, conn.cursor() as cur:
+                conn.begin()
+                results, version = diary_sync.apply_batch(cur, user_pk, ops, _format_item)
+                conn.commit()
+                note_write(cur, user_pk)
+            break
+        except pymysql.err.IntegrityError:
+            # 같은 key 로 동시에 재전송된 배치와 op 기록이 충돌 → 롤백됐으니 다시 돌면 저장된 결과를 재생
+            if attempt == 2:
+                raise
+    # 벡터 색인은 커밋 후 (재생된 op 는 이미 반영됨)
+    applied = [r for r in results if not r.get("replayed") and r["status"] in (200, 201)]
+    diary_vectors.upsert_many(user_pk, [{"id": r["id"], "mood": r["item"]["mood"], "notes": r["item"]["notes"]}
+                                        for r in applied if "item" in r])
+    diary_vectors.remove_many(user_pk, [r["id"] for r in applied if "item" not in r])
+    return jsonify(results=results, version=version), 200
+
+@api_bp.get("/api/history/changes")
+@jwt_required()
+def diary_changes():
+    # since 생략 = 전체(삭제 제외), 이후엔 응답의 since 를 그대로 다음 요청에 넘긴다
+    user_pk = get_jwt_identity()
+    try:
+        since = diary_sync.parse_since(request.args.get("since"))
+    except ValueError:
+        return jsonify(error="since 형식이 올바르지 않습니다."), 400
+    limit = min(max(int(request.args.get("limit", diary_sync.SYNC_CHANGES_LIMIT)), 1), diary_sync.SYNC_CHANGES_LIMIT)
+
+    with get_read_conn(user_pk) as conn, conn.cursor() as cur:
+        rows, next_since, has_more, reset = diary_sync.fetch_changes(cur, user_pk, since, limit)
+
+    changes = []
+    for r in rows:
+        if r["deleted_at"] is not None:
+            changes.append({"op": "delete", "id": r["id"], "version": r["change_version"]})
+        else:
+            changes.append({"op": "upsert", "id": r["id"], "version": r["change_version"], "item": _format_item(r)})
+    body = dict(changes=changes, since=next_since, has_more=has_more)
+    if reset:
+        # since 이후 삭제 기록 일부가 정리됨 → 전체 목록(페이지)으로 응답. 로컬을 이 목록으로 교체
+        body["reset"] = True
+    return jsonify(body), 200
+
+@api_bp.route("/api/history", methods=["OPTIONS"])
+@api_bp.route("/api/history/", methods=["OPTIONS"])
 def diary_options():
     return ("", 204)
 
-@app.route("/api/history/<int:_id>", methods=["OPTIONS"])
+@api_bp.route("/api/history/<int:_id>", methods=["OPTIONS"])
 def diary_item_options(_id):
     return ("", 204)
 
-@app.after_request
 def _add_cors_headers(resp):
     if request.path.startswith("/api/"):
         origin = request.headers.get("Origin", "")
         resp.headers.setdefault("Access-Control-Allow-Origin", "*")
-        resp.headers.setdefault("Vary", "Origin")
+        resp.vary.add("Origin")
         resp.headers.setdefault("Access-Control-Allow-Methods", "GET, POST, PUT, DELETE, OPTIONS")
         resp.headers.setdefault("Access-Control-Allow-Headers", "Authorization, Content-Type")
     return resp
-app.config["JWT_TOKEN_LOCATION"] = ["headers"]
-app.config["JWT_HEADER_NAME"] = "Authorization"
-app.config["JWT_HEADER_TYPE"] = "Bearer"
 
-@jwt.unauthorized_loader
+# 읽기 복제본 (db.get_read_conn): 일기 쓰기 응답에 워터마크 토큰을 싣고,
+# 클라이언트가 다음 요청에 돌려보내면 다른 프로세스가 받아도 그 쓰기를 본 복제본/주 DB 에서 읽는다
+READ_TOKEN_HEADER = "X-Read-After"
+
+def _accept_read_token():
+    token = request.headers.get(READ_TOKEN_HEADER)
+    if not token:
+        return None
+    try:
+        verify_jwt_in_request(optional=True)
+        user_pk = get_jwt_identity()
+    except Exception:
+        return None  # 잘못된 JWT 는 라우트의 jwt_required 가 401 로 처리
+    if user_pk:
+        accept_token(user_pk, token)
+    return None
+
+def _add_read_token(resp):
+    if request.method in ("POST", "PUT", "DELETE") and request.path.startswith(("/api/history", "/api/diary")):
+        try:
+            user_pk = get_jwt_identity()
+        except RuntimeError:  # jwt_required 전에 끝난 요청
+            return resp
+        token = pin_token(user_pk) if user_pk else None
+        if token:
+            resp.headers[READ_TOKEN_HEADER] = token
+    return resp
+
 def _unauth_loader(reason):
     return jsonify(error="unauthorized", reason=reason), 401
 
-@jwt.invalid_token_loader
 def _invalid_loader(reason):
     return jsonify(error="invalid_token", reason=reason), 401
 
-@jwt.expired_token_loader
 def _expired_loader(jwt_header, jwt_payload):
     return jsonify(error="token_expired"), 401
+
+# -------------------------------
+# App factory
+#  - 모든 엔트리포인트(gpt_server.py, app.py, asgi.py, flask --app gpt_server)가 이 함수로 앱을 만든다
+#  - 블루프린트는 여기서 한 번만 등록: /api/auth/*, /api/chat·/api/history(api), /chat, /api/diary
+# -------------------------------
+def create_app(config: Optional[dict] = None) -> Flask:
+    app = Flask(__name__)
+    app.url_map.strict_slashes = False
+
+    # JWT
+    app.config["JWT_SECRET_KEY"] = os.getenv("JWT_SECRET_KEY", "change_me_to_strong_secret")
+    app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(
+        hours=int(os.getenv("JWT_EXPIRE_HOURS", "24"))
+    )
+    app.config["JWT_TOKEN_LOCATION"] = ["headers"]
+    app.config["JWT_HEADER_NAME"] = "Authorization"
+    app.config["JWT_HEADER_TYPE"] = "Bearer"
+    if config:
+        app.config.update(config)
+    jwt = JWTManager(app)
+    jwt.unauthorized_loader(_unauth_loader)
+    jwt.invalid_token_loader(_invalid_loader)
+    jwt.expired_token_loader(_expired_loader)
+
+    # CORS
+    origins_env = os.getenv("FRONTEND_ORIGIN", "*")
+    origin_list = [o.strip() for o in origins_env.split(",") if o.strip()]
+    _allow_all = (len(origin_list) == 1 and origin_list[0] == "*")
+    CORS(
+        app,
+        resources={r"/api/*": {"origins": "*" if _allow_all else origin_list}},
+        supports_credentials=False if _allow_all else True,
+        allow_headers=["Content-Type", "Authorization", "Cache-Control", "X-Chat-Cache", "If-None-Match",
+                       READ_TOKEN_HEADER, profiler.HEADER],
+        expose_headers=["X-Cache", "ETag", READ_TOKEN_HEADER, "Server-Timing", "X-Profile-Id"],
+        methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+    )
+
+    # 프로파일러가 가장 먼저 시작해 수용 제어 대기까지 포함하고, after_request 는 가장 늦게 돈다
+    profiler.install(app)
+    admission.install(app)
+    app.before_request(_accept_read_token)
+    app.register_blueprint(auth_bp)
+    app.register_blueprint(api_bp)
+    app.register_blueprint(chat_bp)
+    app.register_blueprint(diary_bp, url_prefix="/api/diary")
+    app.after_request(_add_cors_headers)
+    app.after_request(_add_read_token)
+    app.after_request(http_cache.compress)
+    return app
+
+_app = None
+
+def __getattr__(name):
+    # `from gpt_server import app` 호환: 처음 접근할 때 한 번만 만든다
+    global _app
+    if name == "app":
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 # -------------------------------
 # Run
 # -------------------------------
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000)
+    create_app().run(host="0.0.0.0", port=5000)
@@ -0,0 +1,71 @@
+# loadtest_chat.py
+#  채팅이 포화된 상태에서도 일기 조회(/api/history) 지연이 유지되는지 확인하는 부하 테스트
+#  사용법:
+#    BASE_URL=http://127.0.0.1:5000 TOKEN=<로그인 토큰> python loadtest_chat.py
+#    CHAT_CONCURRENCY(기본 200) 개의 채팅을 동시에 띄워 두고, 전/중 두 구간의 조회 지연을 비교합니다.
+import json
+import os
+import statistics
+import threading
+import time
+import urllib.request
+
+BASE_URL = os.getenv("BASE_URL", "http://127.0.0.1:5000").rstrip("/")
+TOKEN = os.getenv("TOKEN", "")
+CHAT_CONCURRENCY = int(os.getenv("CHAT_CONCURRENCY", "200"))
+HISTORY_SAMPLES = int(os.getenv("HISTORY_SAMPLES", "50"))
+
+
+def _request(method, path, body=None):
+    req = urllib.request.Request(BASE_URL + path, method=method)
+    req.add_header("Content-Type", "application/json")
+    if TOKEN:
+        req.add_header("Authorization", f"Bearer {TOKEN}")
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    with urllib.request.urlopen(req, data=data, timeout=120) as resp:
+        resp.read()
+        return resp.status
+
+
+def measure_history(n):
+    lat = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        _request("GET", "/api/history?page=1&size=20")
+        lat.append((time.perf_counter() - t0) * 1000)
+    return lat
+
+
+def _report(label, lat):
+    lat = sorted(lat)
+    p95 = lat[int(len(lat) * 0.95) - 1] if lat else 0
+    print(f"{label:<16} p50={statistics.median(lat):7.1f}ms  p95={p95:7.1f}ms  max={lat[-1]:7.1f}ms")
+
+
+def main():
+    baseline = measure_history(HISTORY_SAMPLES)
+
+    stop = threading.Event()
+    done = []
+
+    def chat_loop():
+        while not stop.is_set():
+            try:
+                done.append(_request("POST", "/api/chat", {"message": "오늘 너무 불안해요"}))
+            except Exception as e:
+                done.append(str(e))
+
+    threads = [threading.Thread(target=chat_loop, daemon=True) for _ in range(CHAT_CONCURRENCY)]
+    for t in threads:
+        t.start()
+    time.sleep(2)  # 채팅이 업스트림을 점유할 때까지 대기
+    saturated = measure_history(HISTORY_SAMPLES)
+    stop.set()
+
+    _report("history (idle)", baseline)
+    _report("history (chat)", saturated)
+    print(f"chat requests completed during run: {len(done)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# migrate.py
+#  migrations/NNNN_*.sql 을 번호 순서대로 한 번씩 적용합니다.
+#  적용 이력은 schema_migrations 테이블에 남습니다.
+#  사용법: python migrate.py            (미적용 마이그레이션 적용)
+#          python migrate.py --status   (적용 여부만 출력)
+import os
+import re
+import sys
+
+from db import get_conn
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+_FILE_RE = re.compile(r"^(\d{4})_[\w\-]+\.sql$")
+
+
+def list_migrations():
+    out = []
+    for name in sorted(os.listdir(MIGRATIONS_DIR)):
+        m = _FILE_RE.match(name)
+        if m:
+            out.append((m.group(1), name))
+    return out
+
+
+def split_statements(sql: str):
+    lines = [ln for ln in sql.splitlines() if not ln.strip().startswith("--")]
+    return [s.strip() for s in "\n".join(lines).split(";") if s.strip()]
+
+
+def applied_versions(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version    CHAR(4)      NOT NULL PRIMARY KEY,
+            name       VARCHAR(255) NOT NULL,
+            applied_at DATETIME     NOT NULL DEFAULT CURRENT_TIMESTAMP
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """)
+    cur.execute("SELECT version FROM schema_migrations")
+    return {r["version"] for r in cur.fetchall()}
+
+
+def migrate(status_only=False):
+    with get_conn() as conn, conn.cursor() as cur:
+        done = applied_versions(cur)
+        for version, name in list_migrations():
+            if version in done:
+                print(f"[x] {name}")
+                continue
+            if status_only:
+                print(f"[ ] {name}")
+                continue
+            with open(os.path.join(MIGRATIONS_DIR, name), encoding="utf-8") as f:
+                statements = split_statements(f.read())
+            # DDL 은 MariaDB 에서 암묵적으로 커밋되므로 파일 단위 롤백은 불가 → IF NOT EXISTS 로 재실행 안전하게 작성
+            for stmt in statements:
+                cur.execute(stmt)
+            cur.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+            print(f"[+] {name}")
+
+
+if __name__ == "__main__":
+    migrate(status_only="--status" in sys.argv[1:])
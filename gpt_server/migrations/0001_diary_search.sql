@@ -0,0 +1,10 @@
+-- 0001_diary_search.sql
+-- 일기 본문 검색용 2-gram 역색인 (services/diary_search.py 가 유지)
+CREATE TABLE IF NOT EXISTS diary_ngram (
+    user_pk   INT          NOT NULL,
+    gram      VARCHAR(2)   CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL,
+    diary_id  INT          NOT NULL,
+    tf        SMALLINT UNSIGNED NOT NULL DEFAULT 1,
+    PRIMARY KEY (user_pk, gram, diary_id),
+    KEY idx_diary_ngram_diary (diary_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
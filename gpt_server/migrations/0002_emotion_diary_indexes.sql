@@ -0,0 +1,10 @@
+-- 0002_emotion_diary_indexes.sql
+-- 일기 조회 패턴: user_pk = ? AND deleted_at IS NULL [AND mood (IN) ...] [AND created_at 범위]
+--               ORDER BY created_at DESC, id DESC
+-- InnoDB 보조 인덱스는 PK(id)를 포함하므로 (…, created_at, id) 순서로 정렬까지 인덱스로 처리된다.
+CREATE INDEX IF NOT EXISTS idx_diary_user_live_created
+    ON emotion_diary (user_pk, deleted_at, created_at, id);
+
+-- mood 필터가 있을 때: 등치/IN 조건 뒤에 created_at 이 오도록
+CREATE INDEX IF NOT EXISTS idx_diary_user_live_mood_created
+    ON emotion_diary (user_pk, deleted_at, mood, created_at, id);
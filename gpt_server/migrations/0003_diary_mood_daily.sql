@@ -0,0 +1,9 @@
+-- 0003_diary_mood_daily.sql
+-- 사용자별 일자·감정별 일기 수 롤업 (services/mood_rollup.py 가 쓰기 트랜잭션 안에서 유지)
+CREATE TABLE IF NOT EXISTS diary_mood_daily (
+    user_pk  INT          NOT NULL,
+    day      DATE         NOT NULL,
+    mood     VARCHAR(50)  NOT NULL DEFAULT '',
+    cnt      INT          NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_pk, day, mood)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
@@ -0,0 +1,21 @@
+-- 0004_chat_sessions.sql
+-- 서버 측 대화 세션 (services/conversation.py)
+CREATE TABLE IF NOT EXISTS chat_session (
+    id            CHAR(32)     NOT NULL PRIMARY KEY,
+    user_pk       INT          NOT NULL,
+    summary       TEXT         NULL,
+    summary_upto  BIGINT       NOT NULL DEFAULT 0,
+    created_at    DATETIME     NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at    DATETIME     NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    KEY idx_chat_session_user (user_pk, updated_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS chat_message (
+    id          BIGINT       NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    session_id  CHAR(32)     NOT NULL,
+    role        VARCHAR(16)  NOT NULL,
+    content     TEXT         NOT NULL,
+    tokens      INT          NOT NULL,
+    created_at  DATETIME     NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    KEY idx_chat_message_session (session_id, id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
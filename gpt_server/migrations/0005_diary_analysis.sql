@@ -0,0 +1,20 @@
+-- 0005_diary_analysis.sql
+-- 일기 감정 분석 결과 + 작업 큐 (services/emotion_analysis.py)
+--  - 일기 1건당 1행. status: pending → running → done | failed
+--  - visible_at: pending 은 처리 가능 시각(재시도 백오프), running 은 임대 만료 시각
+--  - content_hash: 분석 대상(mood+notes)의 해시. 같으면 다시 넣어도 재분석하지 않는다
+CREATE TABLE IF NOT EXISTS diary_analysis (
+    diary_id      INT          NOT NULL PRIMARY KEY,
+    user_pk       INT          NOT NULL,
+    status        VARCHAR(16)  NOT NULL DEFAULT 'pending',
+    content_hash  CHAR(40)     NOT NULL,
+    attempts      INT          NOT NULL DEFAULT 0,
+    visible_at    DATETIME     NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    locked_by     VARCHAR(64)  NULL,
+    emotion       VARCHAR(32)  NULL,
+    feedback      TEXT         NULL,
+    error         VARCHAR(255) NULL,
+    updated_at    DATETIME     NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    KEY idx_diary_analysis_queue (status, visible_at),
+    KEY idx_diary_analysis_lock (locked_by)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
@@ -0,0 +1,25 @@
+-- 0006_diary_sync.sql
+-- 오프라인 동기화 (services/diary_sync.py)
+--  - diary_user_version: 사용자별 쓰기 버전. 일기 쓰기 트랜잭션마다 +1 (행 잠금으로 사용자 단위 직렬화)
+--  - emotion_diary.change_version: 그 행을 마지막으로 바꾼 버전 → GET /api/history/changes?since=
+--    (기존 행은 0 이라 since 없이 받는 전체 동기화에만 포함된다)
+--  - diary_op_log: POST /api/history/batch 의 클라이언트 멱등 키별 결과
+CREATE TABLE IF NOT EXISTS diary_user_version (
+    user_pk  INT     NOT NULL PRIMARY KEY,
+    version  BIGINT  NOT NULL DEFAULT 0
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+ALTER TABLE emotion_diary ADD COLUMN IF NOT EXISTS change_version BIGINT NOT NULL DEFAULT 0;
+
+CREATE INDEX IF NOT EXISTS idx_diary_user_changes
+    ON emotion_diary (user_pk, change_version, id);
+
+CREATE TABLE IF NOT EXISTS diary_op_log (
+    user_pk     INT          NOT NULL,
+    op_key      VARCHAR(64)  NOT NULL,
+    diary_id    INT          NULL,
+    response    TEXT         NOT NULL,
+    created_at  DATETIME     NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_pk, op_key),
+    KEY idx_diary_op_log_created (created_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
@@ -0,0 +1,27 @@
+-- 0007_diary_archive.sql
+-- 일기 정리 작업 (services/diary_archive.py)
+--  - idx_diary_deleted_created: 보존 기간이 지난 tombstone(deleted_at < ?) 과
+--    보관 대상(deleted_at IS NULL AND created_at < ?) 을 사용자와 무관하게 작은 배치로 찾는다
+--  - diary_user_version.purged_version: 지운 tombstone 중 가장 큰 change_version.
+--    since 가 이보다 작으면 놓친 삭제가 있을 수 있으므로 변경분 피드가 전체 동기화(reset)로 응답한다
+--  - emotion_diary_archive: 오래된 일기의 압축 보관 테이블. 목록 API 는 from 이 보관분 기간에 걸칠 때만 읽는다
+--    (emotion_diary 는 users FK 가 있어 MariaDB 파티셔닝을 쓸 수 없다)
+CREATE INDEX IF NOT EXISTS idx_diary_deleted_created
+    ON emotion_diary (deleted_at, created_at);
+
+ALTER TABLE diary_user_version ADD COLUMN IF NOT EXISTS purged_version BIGINT NOT NULL DEFAULT 0;
+
+CREATE TABLE IF NOT EXISTS emotion_diary_archive (
+    id              INT          NOT NULL PRIMARY KEY,
+    user_pk         INT          NOT NULL,
+    mood            VARCHAR(50),
+    notes           TEXT,
+    created_at      DATETIME,
+    updated_at      DATETIME,
+    deleted_at      DATETIME     NULL,
+    change_version  BIGINT       NOT NULL DEFAULT 0,
+    archived_at     DATETIME     NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    KEY idx_diary_archive_user_created (user_pk, created_at, id),
+    CONSTRAINT fk_diary_archive_user
+        FOREIGN KEY (user_pk) REFERENCES users(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 ROW_FORMAT=COMPRESSED KEY_BLOCK_SIZE=8;
@@ -0,0 +1,6 @@
+-- 0008_diary_archive_changes.sql
+-- 변경분 피드(GET /api/history/changes)가 보관분도 함께 읽는다 (services/diary_sync.fetch_changes)
+--  - 오래된 일기가 since 이후에 수정된 뒤 보관되면 emotion_diary 만 봐서는 그 변경을 놓친다
+--  - emotion_diary 의 idx_diary_user_changes 와 같은 모양의 인덱스를 보관 테이블에도 둔다
+CREATE INDEX IF NOT EXISTS idx_diary_archive_user_changes
+    ON emotion_diary_archive (user_pk, change_version, id);
@@ -1,11 +1,14 @@
 # routes/auth.py
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask_jwt_extended import create_access_token, jwt_required
 from datetime import timedelta
 from flask_cors import cross_origin
 import re, pymysql
 from db import get_conn
+from services.rate_limiter import rate_limited
+from services.password_hasher import hasher, needs_rehash, HasherBusy
+from services import http_cache
+from services.user_context import current_user, profiles
 
 auth_bp = Blueprint("auth", __name__, url_prefix="/api/auth")
 NAME_RE = re.compile(r'^[A-Za-z가-힣\s\-]{2,30}$')
@@ -13,6 +16,21 @@ NAME_RE = re.compile(r'^[A-Za-z가-힣\s\-]{2,30}$')
 def _json():
     return request.get_json(silent=True) or {}
 
+def _busy():
+    resp = jsonify(ok=False, message="요청이 많습니다. 잠시 후 다시 시도해주세요.")
+    resp.headers["Retry-After"] = "1"
+    return resp, 503
+
+def _store_rehash(uid: int, old_hash: str):
+    def _save(new_hash):
+        # 그 사이 비밀번호가 바뀌었으면 덮어쓰지 않도록 이전 해시를 조건에 건다
+        with get_conn() as conn, conn.cursor() as cur:
+            cur.execute(
+                "UPDATE users SET password_hash=%s WHERE id=%s AND password_hash=%s",
+                (new_hash, uid, old_hash),
+            )
+    return _save
+
 def _success_payload(uid: int, user_id: str, user_name: str, status=200):
     access = create_access_token(
         identity=uid,
@@ -49,36 +67,40 @@ def signup():
     if len(password) < 8:
         return jsonify(ok=False, message="비밀번호는 8자 이상이어야 합니다."), 400
 
-    pwd_hash = generate_password_hash(password, method="scrypt")
+    try:
+        pwd_hash = hasher.hash(password)
+    except HasherBusy:
+        return _busy()
 
     conn = get_conn()
     try:
         with conn.cursor() as cur:
-            cur.execute("SELECT id FROM users WHERE user_id=%s", (user_id,))
-            if cur.fetchone():
-                return jsonify(ok=False, message="이미 사용 중인 아이디입니다."), 409
+            # 중복 아이디는 UNIQUE 제약으로 판별 (사전 SELECT 없이 한 번의 왕복)
             cur.execute(
-                "INSERT INTO users (user_id, user_name, password_hash) VALUES (%s,%s,%s)",
+                "INSERT INTO users (user_id, user_name, password_hash) VALUES (%s,%s,%s) "
+                "RETURNING id, user_id, user_name, created_at",
                 (user_id, user_name, pwd_hash)
             )
-            cur.execute("SELECT LAST_INSERT_ID() AS id")
-            new_id = cur.fetchone()["id"]
+            row = cur.fetchone()
+            new_id = row["id"]
         conn.commit()
-    except pymysql.err.IntegrityError as e:
+    except pymysql.err.IntegrityError:
         if conn: conn.rollback()
-        return jsonify(ok=False, message=f"회원가입 실패(중복): {e}"), 409
+        return jsonify(ok=False, message="이미 사용 중인 아이디입니다."), 409
     except Exception as e:
         if conn: conn.rollback()
         return jsonify(ok=False, message=f"회원가입 실패: {e}"), 500
     finally:
         conn.close()
 
+    profiles.put(new_id, row)
     return _success_payload(new_id, user_id, user_name, status=201)
 
 @auth_bp.post("/login")
 @cross_origin(origins="*",
               allow_headers=["Content-Type", "Authorization"],
               methods=["GET","POST","PUT","DELETE","OPTIONS"])
+@rate_limited("login")
 def login():
     d = _json()
     user_id  = (d.get("user_id") or "").strip()
@@ -90,16 +112,25 @@ def login():
     try:
         with conn.cursor() as cur:
             cur.execute(
-                "SELECT id, user_id, user_name, password_hash FROM users WHERE user_id=%s",
+                "SELECT id, user_id, user_name, password_hash, created_at FROM users WHERE user_id=%s",
                 (user_id,)
             )
             row = cur.fetchone()
     finally:
         conn.close()
 
-    if not row or not check_password_hash(row["password_hash"], password):
+    try:
+        ok = bool(row) and hasher.verify(row["password_hash"], password)
+    except HasherBusy:
+        return _busy()
+    if not ok:
         return jsonify(ok=False, message="아이디 또는 비밀번호가 잘못되었습니다."), 401
 
+    if needs_rehash(row["password_hash"]):
+        hasher.rehash_later(password, _store_rehash(row["id"], row["password_hash"]))
+
+    # 같은 조회로 /me 프로필 캐시도 채워 둔다
+    profiles.put(row["id"], {k: row[k] for k in ("id", "user_id", "user_name", "created_at")})
     return _success_payload(row["id"], row["user_id"], row["user_name"], status=200)
 
 @auth_bp.post("/guest")
@@ -114,19 +145,24 @@ def guest():
 @auth_bp.get("/me")
 @jwt_required()
 def me():
-    uid = get_jwt_identity()
-    if not isinstance(uid, int):
+    ctx = current_user()
+    if not isinstance(ctx.user_pk, int):
         return jsonify(ok=False, message="게스트는 사용자 정보가 없습니다."), 403
+    if ctx.is_guest:
+        # 게스트(0)는 users 행이 없으므로 조회 없이 기존 응답(user=null)과 같게
+        return jsonify(ok=True, user=None), 200
 
-    conn = get_conn()
-    try:
-        with conn.cursor() as cur:
-            cur.execute(
-                "SELECT id, user_id, user_name, created_at FROM users WHERE id=%s",
-                (uid,)
-            )
-            row = cur.fetchone()
-    finally:
-        conn.close()
+    # 응답은 토큰 클레임 + 바뀌지 않는 created_at 뿐이므로 클레임으로 태그를 만든다 (일치하면 캐시/DB 조회 없음)
+    etag = http_cache.make_etag("me", ctx.user_pk, ctx.user_id, ctx.user_name)
+    cached = http_cache.not_modified(etag)
+    if cached is not None:
+        return cached
 
-    return jsonify(ok=True, user=row), 200
+    # id/user_id/user_name 은 토큰 클레임, created_at 만 TTL 캐시(없으면 1회 조회)
+    row = profiles.get(ctx.user_pk)
+    if row is None:
+        return jsonify(ok=True, user=None), 200
+    user = dict(row)
+    if ctx.user_id:
+        user.update(user_id=ctx.user_id, user_name=ctx.user_name)
+    return http_cache.tag(jsonify(ok=True, user=user), etag), 200
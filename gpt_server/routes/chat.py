@@ -1,24 +1,17 @@
 # chat.py
 from flask import Blueprint, request, jsonify
 from services.openai_service import get_chat_response
+from services.llm_client import LLMUnavailable
+from services.rate_limiter import rate_limited
 import logging
-import time
+import math
 
 chat_bp = Blueprint("chat", __name__)
-last_request_time = {}
 
 @chat_bp.route("/chat", methods=["POST"])
+@rate_limited("chat")
 def chat():
     try:
-        user_ip = request.remote_addr
-        now = time.time()
-        gap = now - last_request_time.get(user_ip, 0)
-        if gap < 2:
-            logging.warning(f"429 제한: IP {user_ip}가 {gap:.2f}s 만에 다시 요청")
-            return jsonify({"error": "요청이 너무 빠릅니다. 2초 후 다시 시도해주세요."}), 429
-
-        last_request_time[user_ip] = now
-
         data = request.get_json()
         user_message = data.get("message")
         if not user_message:
@@ -28,8 +21,12 @@ def chat():
         reply = get_chat_response(user_message)
         return jsonify({"response": reply})
 
-    except Exception as e:
+    except LLMUnavailable as e:
+        logging.warning(f"Groq 일시 장애: {e}")
+        resp = jsonify({"error": "서버가 바쁩니다. 잠시 후 다시 시도해주세요."})
+        resp.headers["Retry-After"] = str(max(1, math.ceil(e.retry_after)))
+        return resp, 503
+
+    except Exception:
         logging.exception("서버 오류")
-        msg = str(e)
-        status = 429 if "rate" in msg.lower() else 500
-        return jsonify({"error": "서버 오류가 발생했습니다. 잠시 후 다시 시도해주세요."}), status
+        return jsonify({"error": "서버 오류가 발생했습니다. 잠시 후 다시 시도해주세요."}), 500
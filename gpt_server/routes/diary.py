@@ -1,17 +1,19 @@
 # routes/diary.py
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from db import get_db_connection
+from db import get_conn, get_read_conn, note_write
+from services import diary_archive, diary_search, diary_sync, diary_vectors, emotion_analysis, mood_rollup
 
-diary_bp = Blueprint("diary", __name__, strict_slashes=False)
+diary_bp = Blueprint("diary", __name__)
 def _row_to_dict(row):
+    # DB_CONF 의 커서는 DictCursor → 컬럼명으로 접근
     return {
-        "id": row[0],
-        "user_pk": row[1],
-        "mood": row[2],
-        "notes": row[3],
-        "created_at": row[4].isoformat() if row[4] else None,
-        "updated_at": row[5].isoformat() if row[5] else None,
+        "id": row["id"],
+        "user_pk": row["user_pk"],
+        "mood": row["mood"],
+        "notes": row["notes"],
+        "created_at": row["created_at"].isoformat() if row["created_at"] else None,
+        "updated_at": row["updated_at"].isoformat() if row["updated_at"] else None,
     }
 
 @diary_bp.route("",  methods=["GET", "POST", "OPTIONS"])
@@ -28,22 +30,25 @@ def diary_collection():
         mood  = (data.get("mood")  or None)
         notes = (data.get("notes") or None)
 
-        conn = get_db_connection()
+        conn = get_conn()
         try:
             with conn.cursor() as cur:
+                conn.begin()
+                version = diary_sync.bump(cur, user_pk)
+                # RETURNING: 삽입 결과(id, 서버 기본 시각)를 같은 왕복으로 받는다
                 cur.execute("""
-                    INSERT INTO emotion_diary (user_pk, mood, notes)
-                    VALUES (%s, %s, %s)
-                """, (user_pk, mood, notes))
-                diary_id = cur.lastrowid
+                    INSERT INTO emotion_diary (user_pk, mood, notes, change_version)
+                    VALUES (%s, %s, %s, %s)
+                    RETURNING id, user_pk, mood, notes, created_at, updated_at
+                """, (user_pk, mood, notes, version))
+                row = cur.fetchone()
+                diary_search.index_many(cur, user_pk, [row])
+                mood_rollup.add(cur, user_pk, [(row["created_at"].date(), row["mood"], +1)])
+                emotion_analysis.enqueue(cur, user_pk, row["id"], row["mood"], row["notes"])
                 conn.commit()
-
-                cur.execute("""
-                    SELECT id, user_pk, mood, notes, created_at, updated_at
-                    FROM emotion_diary
-                    WHERE id=%s
-                """, (diary_id,))
-                created = _row_to_dict(cur.fetchone())
+                note_write(cur, user_pk)
+                created = _row_to_dict(row)
+            diary_vectors.upsert(user_pk, row["id"], row["mood"], row["notes"])
             return jsonify(created), 201
         finally:
             conn.close()
@@ -59,19 +64,21 @@ def diary_collection():
     where = ["user_pk=%s", "deleted_at IS NULL"]
     params = [user_pk]
 
-    if from_ and to_:
-        where.append("DATE(created_at) BETWEEN %s AND %s")
-        params += [from_, to_]
-    elif from_:
-        where.append("DATE(created_at) >= %s"); params.append(from_)
-    elif to_:
-        where.append("DATE(created_at) <= %s"); params.append(to_)
+    # DATE(created_at) 로 감싸면 인덱스를 못 타므로 반열린 구간 [from, to + 1일) 로 비교
+    if from_:
+        where.append("created_at >= %s"); params.append(from_)
+    if to_:
+        where.append("created_at < DATE(%s) + INTERVAL 1 DAY"); params.append(to_)
 
     if moods:
         where.append(f"mood IN ({', '.join(['%s']*len(moods))})")
         params += moods
 
-    if q:
+    join_sql, join_params = "", []
+    match = diary_search.match_clause(user_pk, q) if q else None
+    if match:
+        join_sql, join_params = match
+    elif q:
         where.append("notes LIKE %s")
         params.append(f"%{q}%")
 
@@ -79,16 +86,17 @@ def diary_collection():
     limit = page_size
     offset = (page - 1) * page_size
 
-    conn = get_db_connection()
+    conn = get_read_conn(user_pk)
     try:
         with conn.cursor() as cur:
+            source = diary_archive.source(diary_archive.needs_archive(cur, user_pk, from_))
             cur.execute(f"""
                 SELECT id, user_pk, mood, notes, created_at, updated_at
-                FROM emotion_diary
+                FROM {source} {join_sql}
                 WHERE {where_sql}
                 ORDER BY created_at DESC, id DESC
                 LIMIT %s OFFSET %s
-            """, (*params, limit, offset))
+            """, (*join_params, *params, limit, offset))
             items = [_row_to_dict(r) for r in cur.fetchall()]
         return jsonify({"items": items}), 200
     finally:
@@ -101,15 +109,28 @@ def diary_delete(diary_id):
         return ("", 200)
 
     user_pk = get_jwt_identity()
-    conn = get_db_connection()
+    conn = get_conn()
     try:
         with conn.cursor() as cur:
-            cur.execute("""
-                UPDATE emotion_diary
-                SET deleted_at = NOW()
-                WHERE id=%s AND user_pk=%s AND deleted_at IS NULL
-            """, (diary_id, user_pk))
+            conn.begin()
+            version = diary_sync.bump(cur, user_pk)
+            for attempt in (1, 2):
+                mood_rollup.apply(cur, diary_id, -1, user_pk)
+                cur.execute("""
+                    UPDATE emotion_diary
+                    SET deleted_at = NOW(), change_version = %s
+                    WHERE id=%s AND user_pk=%s AND deleted_at IS NULL
+                """, (version, diary_id, user_pk))
+                deleted = cur.rowcount
+                # 보관된 일기면 되돌린 뒤 한 번 더
+                if deleted or attempt == 2 or not diary_archive.restore_many(cur, user_pk, [diary_id]):
+                    break
+            if deleted == 0:
+                return jsonify(error="삭제할 항목이 없거나 권한이 없습니다."), 404
+            diary_search.remove_entry(cur, diary_id)
             conn.commit()
+            note_write(cur, user_pk)
+        diary_vectors.remove(user_pk, diary_id)
         return ("", 204)
     finally:
         conn.close()
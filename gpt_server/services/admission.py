@@ -0,0 +1,274 @@
+# services/admission.py
+#  요청 수용 제어(admission control) + 우선순위 대기열
+#  - 경로를 등급(chat / diary / auth / default)으로 나누고 등급마다 동시 처리 수, 대기열 길이, 대기 SLO 를 둔다
+#    → Groq 가 느려져 채팅이 쌓여도 일기/인증 요청은 자기 자리를 그대로 쓴다
+#  - 예상 대기 시간(앞선 대기 수 / 동시 처리 수 × 최근 처리 시간 EWMA)이 SLO 를 넘으면 줄 세우지 않고 바로 503 + Retry-After
+#  - 로그인 사용자(priority 0)가 게스트/비로그인(priority 1)보다 먼저 자리를 받는다.
+#    대기열이 가득 차면 로그인 사용자는 맨 뒤의 게스트를 밀어내고 들어간다
+#  - 설정: ADMISSION_<등급> = "<동시 처리>/<대기열>/<SLO 초>"  예) ADMISSION_CHAT=16/64/5
+#  - Flask 는 install(app) 의 before_request / 응답 종료 훅, ASGI 채팅은 Gate.aacquire 를 쓴다
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import deque
+
+from services import metrics, profiler
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1").lower() in ("1", "true", "yes")
+
+USER, GUEST = 0, 1
+_PRIORITY_LABEL = {USER: "user", GUEST: "guest"}
+
+# 처리 시간 EWMA 가중치 (최근 요청 비중)
+_EWMA_ALPHA = 0.2
+
+
+def parse_spec(spec: str):
+    limit, queue, slo = (spec.split("/") + ["", ""])[:3]
+    return int(limit), int(queue or 0), float(slo or 1)
+
+
+DEFAULTS = {
+    "chat": os.getenv("ADMISSION_CHAT", f"{os.getenv('LLM_MAX_CONCURRENCY', '64')}/256/"
+                                        f"{os.getenv('LLM_QUEUE_TIMEOUT', '10')}"),
+    "diary": os.getenv("ADMISSION_DIARY", "32/128/1"),
+    "auth": os.getenv("ADMISSION_AUTH", "8/64/2"),
+    "default": os.getenv("ADMISSION_DEFAULT", "32/128/2"),
+}
+
+
+class Shed(Exception):
+    def __init__(self, route_class, reason, retry_after):
+        super().__init__(f"{route_class}: {reason}")
+        self.route_class = route_class
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class _Waiter:
+    __slots__ = ("priority", "granted", "shed", "event", "loop", "future")
+
+    def __init__(self, priority):
+        self.priority = priority
+        self.granted = False
+        self.shed = False
+        self.event = None
+        self.loop = None
+        self.future = None
+
+    def wake(self):
+        if self.event is not None:
+            self.event.set()
+        elif self.loop is not None:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class Gate:
+    def __init__(self, name, limit, queue_size, slo):
+        self.name = name
+        self.limit = max(1, limit)
+        self.queue_size = max(0, queue_size)
+        self.slo = slo
+        self.active = 0
+        self.queues = (deque(), deque())    # 우선순위별 대기열
+        self.service_time = slo / 2 or 0.1  # 처리 시간 EWMA (초), 첫 값은 보수적으로
+        self._lock = threading.Lock()
+
+    # ---- 내부 (잠금 안에서 호출) ----
+    def _waiting(self):
+        return len(self.queues[USER]) + len(self.queues[GUEST])
+
+    def _expected_wait(self, priority):
+        ahead = len(self.queues[USER]) + (len(self.queues[GUEST]) if priority == GUEST else 0)
+        return (ahead + 1) / self.limit * self.service_time
+
+    def _publish(self):
+        for p, q in enumerate(self.queues):
+            metrics.ADMISSION_QUEUE.set(len(q), route_class=self.name, priority=_PRIORITY_LABEL[p])
+        metrics.ADMISSION_ACTIVE.set(self.active, route_class=self.name)
+
+    def _shed(self, priority, reason, retry_after):
+        metrics.ADMISSION_SHED.inc(route_class=self.name, priority=_PRIORITY_LABEL[priority], reason=reason)
+        return Shed(self.name, reason, retry_after)
+
+    def _enter(self, waiter):
+        """바로 들어가면 None, 줄 서면 waiter, 거절이면 Shed 를 돌려준다."""
+        p = waiter.priority
+        with self._lock:
+            if self.active < self.limit and not self._waiting():
+                self.active += 1
+                self._publish()
+                return None
+            expected = self._expected_wait(p)
+            if expected > self.slo:
+                return self._shed(p, "slo", expected)
+            if self._waiting() >= self.queue_size:
+                if p == USER and self.queues[GUEST]:
+                    victim = self.queues[GUEST].pop()
+                    victim.shed = True
+                    victim.wake()
+                    metrics.ADMISSION_SHED.inc(route_class=self.name, priority="guest", reason="evicted")
+                else:
+                    return self._shed(p, "queue_full", expected)
+            self.queues[p].append(waiter)
+            self._publish()
+            return waiter
+
+    def _settle(self, waiter, waited):
+        """대기가 끝난 뒤: 자리를 받았으면 True, 아니면 대기열에서 빼고 Shed."""
+        p = waiter.priority
+        with self._lock:
+            if waiter.granted:
+                metrics.ADMISSION_WAIT.observe(waited, route_class=self.name, priority=_PRIORITY_LABEL[p])
+                return True
+            if not waiter.shed:
+                try:
+                    self.queues[p].remove(waiter)
+                except ValueError:
+                    pass
+            self._publish()
+            reason = "evicted" if waiter.shed else "timeout"
+            retry = self._expected_wait(p)
+        if reason == "timeout":
+            metrics.ADMISSION_SHED.inc(route_class=self.name, priority=_PRIORITY_LABEL[p], reason=reason)
+        return Shed(self.name, reason, retry)
+
+    # ---- 공개 API ----
+    def acquire(self, priority=GUEST):
+        """자리를 받을 때까지(최대 SLO) 기다립니다. 거절되면 Shed. 받으면 시작 시각을 돌려준다 → release()."""
+        waiter = _Waiter(priority)
+        waiter.event = threading.Event()
+        start = time.monotonic()
+        res = self._enter(waiter)
+        if isinstance(res, Shed):
+            raise res
+        if res is not None:
+            waiter.event.wait(self.slo)
+            settled = self._settle(waiter, time.monotonic() - start)
+            if settled is not True:
+                raise settled
+        return time.monotonic()
+
+    async def aacquire(self, priority=GUEST):
+        waiter = _Waiter(priority)
+        waiter.loop = asyncio.get_running_loop()
+        waiter.future = waiter.loop.create_future()
+        start = time.monotonic()
+        res = self._enter(waiter)
+        if isinstance(res, Shed):
+            raise res
+        if res is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), timeout=self.slo)
+            except asyncio.TimeoutError:
+                pass
+            settled = self._settle(waiter, time.monotonic() - start)
+            if settled is not True:
+                raise settled
+        return time.monotonic()
+
+    def release(self, started=None):
+        with self._lock:
+            if started is not None:
+                self.service_time += _EWMA_ALPHA * ((time.monotonic() - started) - self.service_time)
+            # 자리를 반납하지 않고 다음 대기자에게 넘긴다 (로그인 사용자 먼저)
+            for q in self.queues:
+                if q:
+                    nxt = q.popleft()
+                    nxt.granted = True
+                    nxt.wake()
+                    break
+            else:
+                self.active -= 1
+            self._publish()
+
+
+_gates = {}
+_gates_lock = threading.Lock()
+
+
+def gate(route_class) -> Gate:
+    g = _gates.get(route_class)
+    if g is None:
+        with _gates_lock:
+            g = _gates.get(route_class)
+            if g is None:
+                g = _gates[route_class] = Gate(route_class, *parse_spec(DEFAULTS.get(route_class, DEFAULTS["default"])))
+    return g
+
+
+def classify(path: str):
+    """경로 → 등급. 수용 제어 대상이 아니면 None."""
+    if path == "/metrics":
+        return None
+    if path.startswith(("/api/chat", "/chat")):
+        return "chat"
+    if path.startswith(("/api/history", "/api/diary")):
+        return "diary"
+    if path.startswith("/api/auth"):
+        return "auth"
+    return "default"
+
+
+def priority_of(identity) -> int:
+    # 게스트 토큰(/api/auth/guest)은 identity 0, 비로그인은 None
+    return USER if isinstance(identity, int) and identity > 0 else GUEST
+
+
+# -------------------------------
+# Flask 연동
+# -------------------------------
+def install(app):
+    if not ADMISSION_ENABLED:
+        return
+    from flask import g, jsonify, request
+    from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+
+    def _before():
+        route_class = classify(request.path)
+        if route_class is None or request.method == "OPTIONS":
+            return None
+        try:
+            verify_jwt_in_request(optional=True)
+            priority = priority_of(get_jwt_identity())
+        except Exception:
+            # 잘못된/만료된 토큰은 라우트에서 401 — 여기서는 우선순위만 낮춘다
+            priority = GUEST
+        gt = gate(route_class)
+        try:
+            with profiler.span("admission", route_class=route_class):
+                started = gt.acquire(priority)
+        except Shed as e:
+            resp = jsonify(error="요청이 많습니다. 잠시 후 다시 시도해주세요.")
+            resp.status_code = 503
+            resp.headers["Retry-After"] = str(e.retry_after)
+            return resp
+        g.admission = [gt, started]
+        return None
+
+    def _release():
+        ticket = g.pop("admission", None)
+        if ticket is not None:
+            ticket[0].release(ticket[1])
+
+    def _after(resp):
+        # 스트리밍 응답은 본문을 다 보낸 뒤(close) 자리를 돌려준다
+        ticket = g.pop("admission", None)
+        if ticket is not None:
+            resp.call_on_close(lambda: ticket[0].release(ticket[1]))
+        return resp
+
+    def _teardown(exc):
+        # 예외로 after_request 를 건너뛴 경우
+        _release()
+
+    app.before_request(_before)
+    app.after_request(_after)
+    app.teardown_request(_teardown)
@@ -0,0 +1,132 @@
+# services/chat_cache.py
+#  동일한 채팅 프롬프트에 대한 응답 캐시
+#  - 키: (model, system prompt + history + message, temperature) 를 정규화한 해시
+#  - 프로세스 내 LRU + TTL, CHAT_CACHE_REDIS_URL 이 있으면 Redis 를 공유 저장소로 사용
+#  - CHAT_CACHE_VARIANTS > 1 이면 키당 여러 답변을 모아 두고 무작위로 돌려줌 (temperature 0.8 답변이 판에 박히지 않도록)
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+CHAT_CACHE_ENABLED = os.getenv("CHAT_CACHE_ENABLED", "0").lower() in ("1", "true", "yes")
+CHAT_CACHE_SIZE = int(os.getenv("CHAT_CACHE_SIZE", "1024"))
+CHAT_CACHE_TTL = float(os.getenv("CHAT_CACHE_TTL", "3600"))
+CHAT_CACHE_VARIANTS = max(1, int(os.getenv("CHAT_CACHE_VARIANTS", "1")))
+CHAT_CACHE_REDIS_URL = os.getenv("CHAT_CACHE_REDIS_URL")
+
+_WS_RE = re.compile(r"\s+")
+
+
+def _norm(text: str) -> str:
+    return _WS_RE.sub(" ", (text or "").strip())
+
+
+def make_key(model: str, messages: list, temperature: float) -> str:
+    norm = [[m.get("role"), _norm(m.get("content"))] for m in messages]
+    raw = json.dumps([model, norm, round(float(temperature), 3)], ensure_ascii=False)
+    return "chat:" + hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def bypass_requested(headers, data) -> bool:
+    if data.get("cache") is False:
+        return True
+    if (headers.get("X-Chat-Cache") or "").lower() == "bypass":
+        return True
+    return "no-cache" in (headers.get("Cache-Control") or "").lower()
+
+
+class LRUCache:
+    def __init__(self, size: int, ttl: float):
+        self.size = max(1, size)
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, [variants])
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            if item[0] < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return item[1]
+
+    def add(self, key, value, max_variants):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] < time.monotonic():
+                variants = []
+                expires = time.monotonic() + self.ttl
+            else:
+                expires, variants = item
+            if len(variants) < max_variants:
+                variants = variants + [value]
+            self._data[key] = (expires, variants)
+            self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+
+class RedisBackend:
+    def __init__(self, url: str, ttl: float):
+        import redis  # 선택 의존성
+        self.client = redis.Redis.from_url(url, socket_timeout=0.2)
+        self.ttl = int(ttl)
+
+    def get(self, key):
+        raw = self.client.get(key)
+        return json.loads(raw) if raw else None
+
+    def add(self, key, value, max_variants):
+        variants = self.get(key) or []
+        if len(variants) < max_variants:
+            self.client.set(key, json.dumps(variants + [value], ensure_ascii=False), ex=self.ttl)
+
+
+class ChatCache:
+    def __init__(self, size=CHAT_CACHE_SIZE, ttl=CHAT_CACHE_TTL,
+                 variants=CHAT_CACHE_VARIANTS, redis_url=CHAT_CACHE_REDIS_URL):
+        self.local = LRUCache(size, ttl)
+        self.variants = variants
+        self.shared = None
+        if redis_url:
+            try:
+                self.shared = RedisBackend(redis_url, ttl)
+            except Exception as e:
+                logging.warning(f"채팅 캐시 Redis 사용 불가, 로컬 캐시만 사용: {e}")
+
+    def get(self, key) -> Optional[str]:
+        variants = self.local.get(key)
+        if variants is None and self.shared is not None:
+            try:
+                variants = self.shared.get(key)
+            except Exception as e:
+                logging.warning(f"채팅 캐시 조회 실패: {e}")
+            if variants:
+                for v in variants:
+                    self.local.add(key, v, self.variants)
+        # 변형이 목표 개수만큼 모이기 전까지는 miss 로 처리해 새 답변을 채운다
+        if not variants or len(variants) < self.variants:
+            return None
+        return random.choice(variants)
+
+    def put(self, key, reply: str):
+        if not reply:
+            return
+        self.local.add(key, reply, self.variants)
+        if self.shared is not None:
+            try:
+                self.shared.add(key, reply, self.variants)
+            except Exception as e:
+                logging.warning(f"채팅 캐시 저장 실패: {e}")
+
+
+cache = ChatCache() if CHAT_CACHE_ENABLED else None
@@ -0,0 +1,213 @@
+# services/conversation.py
+#  서버 측 대화 세션 저장 + 토큰 예산 안에서 프롬프트 조립
+#  - 클라이언트는 session_id 와 새 메시지만 보낸다 (history 배열 전체를 매번 보내지 않음)
+#  - 대화는 chat_session / chat_message 테이블(migrations/0004_chat_sessions.sql)에 저장
+#  - CHAT_CONTEXT_TOKENS 를 넘는 오래된 턴은 잘라내고, CHAT_SUMMARY_ENABLED=1 이면
+#    잘려 나간 턴을 LLM 으로 요약해 chat_session.summary 에 누적한다 (백그라운드)
+#  - 세션별로 조립에 필요한 턴(토큰 수 포함)을 프로세스 내 LRU 에 두고, 매 턴 새 행만 읽어 덧붙인다
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+from db import get_conn
+
+CHAT_CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS", "3000"))
+CHAT_SESSION_CACHE = int(os.getenv("CHAT_SESSION_CACHE", "1000"))
+CHAT_SUMMARY_ENABLED = os.getenv("CHAT_SUMMARY_ENABLED", "0").lower() in ("1", "true", "yes")
+CHAT_SUMMARY_MIN_TURNS = int(os.getenv("CHAT_SUMMARY_MIN_TURNS", "6"))
+CHAT_MAX_MESSAGE_CHARS = int(os.getenv("CHAT_MAX_MESSAGE_CHARS", "4000"))
+# 턴 하나는 최소 5토큰(estimate_tokens) → 예산에 들어갈 수 있는 턴 수의 상한. 그보다 오래된 행은 읽지 않는다
+_MAX_TURNS = CHAT_CONTEXT_TOKENS // 5 + 1
+
+
+class SessionNotFound(Exception):
+    pass
+
+
+def estimate_tokens(text: str) -> int:
+    # 토크나이저 없이 보수적으로 추정: UTF-8 3바이트 ≈ 1토큰 (한글 1자 ≈ 1토큰, 영어 ~3자/토큰)
+    return max(1, len((text or "").encode("utf-8")) // 3) + 4  # +4: 메시지당 역할/구분자 오버헤드
+
+
+def clip(text: str, max_tokens=None) -> str:
+    """메시지 한 개 길이 상한. max_tokens 를 주면 estimate_tokens 기준으로 그 안에 들어가게 더 자른다
+    (CHAT_MAX_MESSAGE_CHARS 자 한글은 CHAT_CONTEXT_TOKENS 보다 클 수 있다)."""
+    text = (text or "")[:CHAT_MAX_MESSAGE_CHARS]
+    if max_tokens is not None and estimate_tokens(text) > max_tokens:
+        text = text.encode("utf-8")[:max(0, max_tokens - 4) * 3].decode("utf-8", "ignore")
+    return text
+
+
+def message_budget(*head: str, budget=CHAT_CONTEXT_TOKENS) -> int:
+    """시스템 프롬프트/요약을 넣고 남는 토큰 — 새 메시지는 이 안으로 자른다."""
+    return max(0, budget - sum(estimate_tokens(h) for h in head))
+
+
+def fit_turns(turns, budget: int):
+    """최신 턴부터 budget 안에 들어가는 만큼 고른다. (남길 턴, 잘린 턴) — 둘 다 시간순."""
+    used = 0
+    for i in range(len(turns) - 1, -1, -1):
+        used += turns[i]["tokens"]
+        if used > budget:
+            return turns[i + 1:], turns[:i + 1]
+    return turns, []
+
+
+def budget_history(system_prompt: str, history, user_message: str, budget=CHAT_CONTEXT_TOKENS):
+    """클라이언트가 보낸 history 도 같은 예산으로 자른다 (거대한 history 방지)."""
+    user_message = clip(user_message, message_budget(system_prompt, budget=budget))
+    turns = []
+    for turn in history if isinstance(history, list) else []:
+        if not isinstance(turn, dict):
+            continue
+        r = turn.get("role")
+        c = clip((turn.get("content") or "").strip())
+        if r in ("user", "assistant") and c:
+            turns.append({"role": r, "content": c, "tokens": estimate_tokens(c)})
+    remaining = budget - estimate_tokens(system_prompt) - estimate_tokens(user_message)
+    kept, _ = fit_turns(turns, max(0, remaining))
+    return [{"role": t["role"], "content": t["content"]} for t in kept]
+
+
+class Session:
+    def __init__(self, session_id, user_pk):
+        self.id = session_id
+        self.user_pk = user_pk
+        self.turns = []        # [{"id", "role", "content", "tokens"}] (요약에 포함된 턴 제외)
+        self.last_id = 0
+        self.summary = ""
+        self.summary_upto = 0
+        self.summarizing = False
+        self.lock = threading.Lock()
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _cache_get(session_id):
+    with _cache_lock:
+        s = _cache.get(session_id)
+        if s is not None:
+            _cache.move_to_end(session_id)
+        return s
+
+
+def _cache_put(session):
+    with _cache_lock:
+        _cache[session.id] = session
+        _cache.move_to_end(session.id)
+        while len(_cache) > CHAT_SESSION_CACHE:
+            _cache.popitem(last=False)
+
+
+def _refresh(cur, session):
+    # 다른 워커가 덧붙인 턴/요약까지 반영: 새 행만 읽는다
+    cur.execute(
+        "SELECT summary, summary_upto FROM chat_session WHERE id=%s AND user_pk=%s",
+        (session.id, session.user_pk),
+    )
+    row = cur.fetchone()
+    if not row:
+        raise SessionNotFound(session.id)
+    # 최신 행부터 _MAX_TURNS 개만 (처음 여는 긴 세션도 전체 기록을 읽지 않음)
+    cur.execute(
+        "SELECT id, role, content, tokens FROM chat_message "
+        "WHERE session_id=%s AND id > %s ORDER BY id DESC LIMIT %s",
+        (session.id, max(session.last_id, row["summary_upto"]), _MAX_TURNS),
+    )
+    rows = [dict(r) for r in reversed(cur.fetchall())]
+    if len(rows) == _MAX_TURNS:
+        session.turns = []  # 캐시에 있던 턴은 이보다 오래돼 어차피 예산에 못 들어간다
+    session.turns.extend(rows)
+    if rows:
+        session.last_id = rows[-1]["id"]
+    if row["summary_upto"] > session.summary_upto:
+        session.summary, session.summary_upto = row["summary"] or "", row["summary_upto"]
+    session.turns = [t for t in session.turns if t["id"] > session.summary_upto]
+
+
+def open_session(user_pk, session_id=None) -> Session:
+    with get_conn() as conn, conn.cursor() as cur:
+        if not session_id:
+            session = Session(uuid.uuid4().hex, user_pk)
+            cur.execute("INSERT INTO chat_session (id, user_pk) VALUES (%s, %s)", (session.id, user_pk))
+            _cache_put(session)
+            return session
+
+        session = _cache_get(session_id)
+        if session is None or session.user_pk != user_pk:
+            session = Session(session_id, user_pk)
+        with session.lock:
+            _refresh(cur, session)
+        _cache_put(session)
+        return session
+
+
+def assemble(system_prompt: str, session: Session, user_message: str, budget=CHAT_CONTEXT_TOKENS):
+    """(messages, 잘린 턴 목록)"""
+    head = [{"role": "system", "content": system_prompt}]
+    if session.summary:
+        head.append({"role": "system", "content": f"이전 대화 요약: {session.summary}"})
+    room = message_budget(*(m["content"] for m in head), budget=budget)
+    user_message = clip(user_message, room)
+    remaining = room - estimate_tokens(user_message)
+    with session.lock:
+        kept, dropped = fit_turns(list(session.turns), max(0, remaining))
+        if not CHAT_SUMMARY_ENABLED:
+            # 빈 메시지로도 예산에 못 들어가는 턴은 캐시에서 버린다 (DB 에는 남음).
+            # 요약을 켜면 요약이 끝난 턴을 maybe_summarize 가 치운다
+            session.turns = fit_turns(session.turns, room)[0]
+    messages = head + [{"role": t["role"], "content": t["content"]} for t in kept]
+    messages.append({"role": "user", "content": user_message})
+    return messages, dropped
+
+
+def record_turn(session: Session, user_message: str, reply: str):
+    rows = [("user", clip(user_message)), ("assistant", reply or "")]
+    with get_conn() as conn, conn.cursor() as cur:
+        conn.begin()
+        cur.executemany(
+            "INSERT INTO chat_message (session_id, role, content, tokens) VALUES (%s,%s,%s,%s)",
+            [(session.id, role, content, estimate_tokens(content)) for role, content in rows],
+        )
+        cur.execute("UPDATE chat_session SET updated_at=NOW() WHERE id=%s", (session.id,))
+        conn.commit()
+    # 캐시(session.turns/last_id)는 건드리지 않는다: 같은 세션에 다른 워커가 그 사이 넣은 행이 있으면
+    # 여기서 last_id 를 올릴 때 그 행을 영영 건너뛴다. 다음 open_session 의 _refresh 가 이 두 행까지 읽는다
+
+
+def maybe_summarize(session: Session, dropped, complete):
+    """잘린 턴이 충분히 쌓였으면 백그라운드에서 요약. complete(messages) -> str 은 LLM 호출."""
+    if not CHAT_SUMMARY_ENABLED or len(dropped) < CHAT_SUMMARY_MIN_TURNS:
+        return
+    with session.lock:
+        if session.summarizing:
+            return
+        session.summarizing = True
+    upto = dropped[-1]["id"]
+    transcript = "\n".join(f"{t['role']}: {t['content']}" for t in dropped)
+    prompt = [
+        {"role": "system", "content": "다음 상담 대화를 이후 대화에 필요한 사실과 감정 위주로 5문장 이내 한국어로 요약해줘."},
+        {"role": "user", "content": (f"기존 요약: {session.summary}\n\n" if session.summary else "") + transcript},
+    ]
+
+    def _run():
+        try:
+            summary = complete(prompt)
+            with get_conn() as conn, conn.cursor() as cur:
+                cur.execute(
+                    "UPDATE chat_session SET summary=%s, summary_upto=%s WHERE id=%s AND summary_upto < %s",
+                    (summary, upto, session.id, upto),
+                )
+            with session.lock:
+                session.summary, session.summary_upto = summary, upto
+                session.turns = [t for t in session.turns if t["id"] > upto]
+        except Exception as e:
+            logging.warning(f"대화 요약 실패 (session={session.id}): {e}")
+        finally:
+            session.summarizing = False
+
+    threading.Thread(target=_run, daemon=True).start()
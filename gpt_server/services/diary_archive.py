@@ -0,0 +1,273 @@
+# services/diary_archive.py
+#  일기 정리 작업: tombstone 삭제 + 오래된 일기 보관 (migrations/0007_diary_archive.sql)
+#  - purge  : deleted_at 이 DIARY_TOMBSTONE_RETENTION_DAYS 일보다 오래된 tombstone 을 지운다.
+#             사용자별 purged_version 을 올려, 그보다 옛 since 로 오는 변경분 피드는 전체 동기화(reset)로 응답
+#  - archive: DIARY_ARCHIVE_MONTHS(0 = 끔)개월보다 오래된 일기를 압축 테이블 emotion_diary_archive 로 옮긴다.
+#             롤업(통계)·검색 색인·벡터 색인은 그대로 두고, 목록은 from 이 보관분에 걸칠 때만 함께 읽는다 (source())
+#             from 없는 목록의 내용이 바뀌므로 배치마다 해당 사용자의 diary_user_version 을 올린다 (ETag 무효화)
+#             보관된 일기를 수정/삭제하면 restore_many() 로 먼저 되돌린 뒤 처리한다
+#  - 오래된 diary_op_log(일괄 쓰기 멱등 키)도 SYNC_OPLOG_RETENTION_DAYS 일이 지나면 지운다
+#  - 모든 단계는 DIARY_MAINT_BATCH 행씩 PK 로 지우는 짧은 트랜잭션이고, 배치 사이에 DIARY_MAINT_PAUSE 초 쉰다
+#  실행: python -m services.diary_archive [--dry-run] [--skip-purge] [--skip-archive] [--optimize]
+import calendar
+import os
+import time
+from datetime import datetime, timedelta
+
+import config  # noqa: F401 (.env 로드 — 아래 설정을 읽기 전에)
+
+DIARY_TOMBSTONE_RETENTION_DAYS = int(os.getenv("DIARY_TOMBSTONE_RETENTION_DAYS", "30"))
+DIARY_ARCHIVE_MONTHS = int(os.getenv("DIARY_ARCHIVE_MONTHS", "0"))
+SYNC_OPLOG_RETENTION_DAYS = int(os.getenv("SYNC_OPLOG_RETENTION_DAYS", "30"))
+DIARY_MAINT_BATCH = int(os.getenv("DIARY_MAINT_BATCH", "500"))
+DIARY_MAINT_PAUSE = float(os.getenv("DIARY_MAINT_PAUSE", "0.2"))
+
+COLUMNS = "id, user_pk, mood, notes, created_at, updated_at, deleted_at, change_version"
+TABLES = ("emotion_diary", "emotion_diary_archive")
+_SIZED_TABLES = ("emotion_diary", "emotion_diary_archive", "diary_analysis", "diary_ngram", "diary_op_log")
+
+
+def _marks(n):
+    return ", ".join(["%s"] * n)
+
+
+# -------------------------------
+# 조회 쪽
+# -------------------------------
+def source(include_archive=False) -> str:
+    """FROM 절의 emotion_diary 자리에 넣을 테이블 식.
+    보관분을 포함하면 같은 이름의 UNION ALL 파생 테이블 → WHERE 조건은 양쪽 테이블로 내려가(pushdown) 인덱스를 탄다."""
+    if not include_archive:
+        return "emotion_diary"
+    return (f"(SELECT {COLUMNS} FROM emotion_diary "
+            f"UNION ALL SELECT {COLUMNS} FROM emotion_diary_archive) emotion_diary")
+
+
+def needs_archive(cur, user_pk, dt_from) -> bool:
+    """목록의 from 이 이 사용자의 보관분 기간에 걸치면 True (from 이 없으면 최근 일기만 본다)."""
+    if not dt_from:
+        return False
+    cur.execute(
+        "SELECT 1 FROM emotion_diary_archive WHERE user_pk=%s AND created_at >= %s LIMIT 1",
+        (user_pk, dt_from),
+    )
+    return cur.fetchone() is not None
+
+
+def restore_many(cur, user_pk, ids):
+    """보관된 일기를 emotion_diary 로 되돌립니다 (수정/삭제 전에, 같은 트랜잭션에서). 되돌린 id 목록."""
+    ids = list(ids)
+    if not ids:
+        return []
+    cur.execute(
+        f"SELECT id FROM emotion_diary_archive WHERE user_pk=%s AND id IN ({_marks(len(ids))}) FOR UPDATE",
+        (user_pk, *ids),
+    )
+    found = [r["id"] for r in cur.fetchall()]
+    if found:
+        cur.execute(
+            f"INSERT INTO emotion_diary ({COLUMNS}) SELECT {COLUMNS} FROM emotion_diary_archive "
+            f"WHERE id IN ({_marks(len(found))})",
+            found,
+        )
+        cur.execute(f"DELETE FROM emotion_diary_archive WHERE id IN ({_marks(len(found))})", found)
+    return found
+
+
+# -------------------------------
+# 정리 작업
+# -------------------------------
+def table_sizes(cur):
+    cur.execute(
+        f"SELECT table_name AS name, data_length + index_length AS used, data_free AS free "
+        f"FROM information_schema.tables WHERE table_schema = DATABASE() "
+        f"AND table_name IN ({_marks(len(_SIZED_TABLES))})",
+        _SIZED_TABLES,
+    )
+    return {r["name"]: {"used": int(r["used"] or 0), "free": int(r["free"] or 0)} for r in cur.fetchall()}
+
+
+def _pause():
+    if DIARY_MAINT_PAUSE > 0:
+        time.sleep(DIARY_MAINT_PAUSE)
+
+
+def _count(cur, where, params):
+    cur.execute(
+        f"SELECT COUNT(*) AS cnt, "
+        f"       COALESCE(SUM(COALESCE(LENGTH(mood), 0) + COALESCE(LENGTH(notes), 0)), 0) AS payload "
+        f"FROM emotion_diary WHERE {where}",
+        params,
+    )
+    row = cur.fetchone()
+    return int(row["cnt"]), int(row["payload"])
+
+
+def purge_tombstones(conn, cur, cutoff, batch=DIARY_MAINT_BATCH, dry_run=False):
+    """cutoff 이전에 삭제된 tombstone 과 그 감정 분석 행을 지웁니다. (행 수, mood+notes 바이트)"""
+    if dry_run:
+        return _count(cur, "deleted_at < %s", (cutoff,))
+    rows_total, bytes_total = 0, 0
+    while True:
+        # 잠금 없이 후보만 읽는다: tombstone 은 되살아나지 않고 change_version 도 바뀌지 않는다
+        cur.execute(
+            "SELECT id, user_pk, change_version, "
+            "       COALESCE(LENGTH(mood), 0) + COALESCE(LENGTH(notes), 0) AS payload "
+            "FROM emotion_diary WHERE deleted_at < %s ORDER BY deleted_at, id LIMIT %s",
+            (cutoff, batch),
+        )
+        rows = cur.fetchall()
+        if not rows:
+            return rows_total, bytes_total
+        ids = [r["id"] for r in rows]
+        purged = {}
+        for r in rows:
+            purged[r["user_pk"]] = max(purged.get(r["user_pk"], 0), r["change_version"])
+
+        conn.begin()
+        cur.executemany(
+            "INSERT INTO diary_user_version (user_pk, version, purged_version) VALUES (%s, %s, %s) "
+            "ON DUPLICATE KEY UPDATE purged_version = GREATEST(purged_version, VALUES(purged_version))",
+            [(pk, v, v) for pk, v in purged.items()],
+        )
+        cur.execute(f"DELETE FROM diary_analysis WHERE diary_id IN ({_marks(len(ids))})", ids)
+        cur.execute(f"DELETE FROM diary_ngram WHERE diary_id IN ({_marks(len(ids))})", ids)
+        cur.execute(
+            f"DELETE FROM emotion_diary WHERE id IN ({_marks(len(ids))}) AND deleted_at < %s",
+            (*ids, cutoff),
+        )
+        conn.commit()
+        rows_total += cur.rowcount
+        bytes_total += sum(r["payload"] for r in rows)
+        if len(rows) < batch:
+            return rows_total, bytes_total
+        _pause()
+
+
+def archive_old(conn, cur, cutoff, batch=DIARY_MAINT_BATCH, dry_run=False):
+    """cutoff 이전에 쓴 일기를 emotion_diary_archive 로 옮깁니다. (행 수, mood+notes 바이트)"""
+    if dry_run:
+        return _count(cur, "deleted_at IS NULL AND created_at < %s", (cutoff,))
+    rows_total, bytes_total = 0, 0
+    while True:
+        cur.execute(
+            "SELECT id, user_pk, COALESCE(LENGTH(mood), 0) + COALESCE(LENGTH(notes), 0) AS payload "
+            "FROM emotion_diary WHERE deleted_at IS NULL AND created_at < %s ORDER BY created_at, id LIMIT %s",
+            (cutoff, batch),
+        )
+        rows = cur.fetchall()
+        if not rows:
+            return rows_total, bytes_total
+        ids = [r["id"] for r in rows]
+
+        conn.begin()
+        # 보관으로 최근 목록이 바뀐다 → 버전을 올려 목록 ETag 를 무효화. 일기 쓰기와 같은 순서(버전 행 → 일기 행)로 잠근다
+        cur.executemany(
+            "INSERT INTO diary_user_version (user_pk, version) VALUES (%s, 1) "
+            "ON DUPLICATE KEY UPDATE version = version + 1",
+            [(pk,) for pk in sorted({r["user_pk"] for r in rows})],
+        )
+        # INSERT ... SELECT 가 원본 행에 공유 잠금을 걸어, 옮기는 사이의 수정/삭제는 커밋 뒤로 밀린다
+        cur.execute(
+            f"INSERT INTO emotion_diary_archive ({COLUMNS}) SELECT {COLUMNS} FROM emotion_diary "
+            f"WHERE id IN ({_marks(len(ids))}) AND deleted_at IS NULL",
+            ids,
+        )
+        cur.execute(f"DELETE FROM emotion_diary WHERE id IN ({_marks(len(ids))}) AND deleted_at IS NULL", ids)
+        conn.commit()
+        rows_total += cur.rowcount
+        bytes_total += sum(r["payload"] for r in rows)
+        if len(rows) < batch:
+            return rows_total, bytes_total
+        _pause()
+
+
+def purge_op_log(conn, cur, cutoff, batch=DIARY_MAINT_BATCH, dry_run=False):
+    if dry_run:
+        cur.execute("SELECT COUNT(*) AS cnt FROM diary_op_log WHERE created_at < %s", (cutoff,))
+        return cur.fetchone()["cnt"]
+    total = 0
+    while True:
+        cur.execute("DELETE FROM diary_op_log WHERE created_at < %s ORDER BY created_at LIMIT %s", (cutoff, batch))
+        total += cur.rowcount
+        if cur.rowcount < batch:
+            return total
+        _pause()
+
+
+def run(dry_run=False, purge=True, archive=True, optimize=False):
+    """정리 작업 한 번. 지운/옮긴 행 수와 테이블 크기 변화를 돌려줍니다."""
+    from db import get_conn
+
+    report = {"dry_run": dry_run}
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute("SELECT NOW() AS now")
+        now = cur.fetchone()["now"]
+        before = table_sizes(cur)
+
+        if purge:
+            cutoff = now - timedelta(days=DIARY_TOMBSTONE_RETENTION_DAYS)
+            rows, payload = purge_tombstones(conn, cur, cutoff, dry_run=dry_run)
+            report["tombstones"] = {"cutoff": str(cutoff), "rows": rows, "payload_bytes": payload}
+            cutoff = now - timedelta(days=SYNC_OPLOG_RETENTION_DAYS)
+            report["op_log"] = {"cutoff": str(cutoff), "rows": purge_op_log(conn, cur, cutoff, dry_run=dry_run)}
+        if archive and DIARY_ARCHIVE_MONTHS > 0:
+            cutoff = _months_ago(now, DIARY_ARCHIVE_MONTHS)
+            rows, payload = archive_old(conn, cur, cutoff, dry_run=dry_run)
+            report["archived"] = {"cutoff": str(cutoff), "rows": rows, "payload_bytes": payload}
+
+        if not dry_run:
+            # InnoDB 는 지운 공간을 data_free 로 돌려두고 파일은 줄이지 않는다 → --optimize 로 재구성(온라인)
+            for name in _SIZED_TABLES:
+                cur.execute(f"{'OPTIMIZE' if optimize else 'ANALYZE'} TABLE {name}")
+                cur.fetchall()
+        after = table_sizes(cur)
+
+    report["tables"] = {name: {"before": before.get(name), "after": after.get(name)} for name in _SIZED_TABLES}
+    hot = [n for n in _SIZED_TABLES if n != "emotion_diary_archive"]
+    report["reclaimed_bytes"] = sum(before.get(n, {}).get("used", 0) - after.get(n, {}).get("used", 0) for n in hot)
+    report["archive_growth_bytes"] = (after.get("emotion_diary_archive", {}).get("used", 0)
+                                      - before.get("emotion_diary_archive", {}).get("used", 0))
+    return report
+
+
+def _months_ago(dt: datetime, months: int) -> datetime:
+    year, month = divmod(dt.year * 12 + dt.month - 1 - months, 12)
+    month += 1
+    return dt.replace(year=year, month=month, day=min(dt.day, calendar.monthrange(year, month)[1]))
+
+
+def _print_report(report):
+    label = " (dry run)" if report["dry_run"] else ""
+    for key, title in (("tombstones", "tombstones purged"), ("archived", "entries archived")):
+        if key in report:
+            r = report[key]
+            print(f"{title + label:<28} {r['rows']:>8} rows  {r['payload_bytes']:>12} payload bytes  (before {r['cutoff']})")
+    if "op_log" in report:
+        print(f"{'op log keys purged' + label:<28} {report['op_log']['rows']:>8} rows  (before {report['op_log']['cutoff']})")
+    for name, t in report["tables"].items():
+        if t["before"] is None:
+            continue
+        print(f"  {name:<24} used {t['before']['used']:>12} → {t['after']['used']:>12}   "
+              f"free {t['before']['free']:>12} → {t['after']['free']:>12}")
+    print(f"reclaimed (hot tables)       {report['reclaimed_bytes']:>12} bytes")
+    print(f"archive growth               {report['archive_growth_bytes']:>12} bytes")
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="일기 tombstone 삭제 / 오래된 일기 보관")
+    parser.add_argument("--dry-run", action="store_true", help="대상 행 수만 세고 바꾸지 않음")
+    parser.add_argument("--skip-purge", action="store_true", help="tombstone / op log 삭제를 건너뜀")
+    parser.add_argument("--skip-archive", action="store_true", help="보관 이동을 건너뜀")
+    parser.add_argument("--optimize", action="store_true", help="끝나고 OPTIMIZE TABLE 로 파일 공간까지 돌려받음")
+    parser.add_argument("--json", action="store_true", help="보고서를 JSON 으로 출력")
+    args = parser.parse_args()
+    result = run(dry_run=args.dry_run, purge=not args.skip_purge, archive=not args.skip_archive,
+                 optimize=args.optimize)
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        _print_report(result)
@@ -0,0 +1,127 @@
+# services/diary_search.py
+#  일기 본문(notes) 검색용 2-gram 역색인
+#  - `notes LIKE '%q%'` 는 사용자 행 전체를 스캔하고 한국어 어절 분리도 못 한다.
+#  - MariaDB FULLTEXT 는 ngram 파서가 없어 "불안해요" 안의 "불안" 을 찾지 못하므로,
+#    어절별 2-gram 을 diary_ngram 테이블(migrations/0001_diary_search.sql)에 직접 유지한다.
+#  - 일기 생성/수정/삭제 시 같은 커서(같은 트랜잭션)에서 index_entry / remove_entry 를 호출한다.
+#  백필: python -m services.diary_search
+import re
+from collections import Counter
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def grams(text: str) -> Counter:
+    out = Counter()
+    for word in _WORD_RE.findall((text or "").lower()):
+        if len(word) == 1:
+            out[word] += 1
+            continue
+        for i in range(len(word) - 1):
+            out[word[i:i + 2]] += 1
+    return out
+
+
+def index_entry(cur, user_pk, diary_id, notes):
+    cur.execute("DELETE FROM diary_ngram WHERE diary_id=%s", (diary_id,))
+    counts = grams(notes)
+    if counts:
+        cur.executemany(
+            "INSERT INTO diary_ngram (user_pk, gram, diary_id, tf) VALUES (%s,%s,%s,%s)",
+            [(user_pk, g, diary_id, tf) for g, tf in counts.items()],
+        )
+
+
+def index_many(cur, user_pk, rows):
+    """rows: [{"id", "notes"}, ...] — 새로 삽입된 행들을 한 번의 executemany 로 색인."""
+    values = []
+    for r in rows:
+        values += [(user_pk, g, r["id"], tf) for g, tf in grams(r["notes"]).items()]
+    if values:
+        cur.executemany(
+            "INSERT INTO diary_ngram (user_pk, gram, diary_id, tf) VALUES (%s,%s,%s,%s)",
+            values,
+        )
+
+
+def remove_entry(cur, diary_id):
+    cur.execute("DELETE FROM diary_ngram WHERE diary_id=%s", (diary_id,))
+
+
+def remove_many(cur, diary_ids):
+    if diary_ids:
+        cur.execute(
+            f"DELETE FROM diary_ngram WHERE diary_id IN ({', '.join(['%s'] * len(diary_ids))})",
+            tuple(diary_ids),
+        )
+
+
+def match_clause(user_pk, q: str):
+    """q 에 대한 검색 조건을 돌려줍니다.
+
+    반환값 (join_sql, join_params) 은 `FROM emotion_diary JOIN (...) s ON s.diary_id = id`
+    형태로 붙이며, s.score 로 관련도 정렬을 할 수 있습니다. q 에서 2-gram 을 만들 수 없으면
+    (예: 한 글자) None 을 돌려주므로 호출 측에서 LIKE 로 대체합니다.
+
+    2-gram 조건만으로는 gram 이 다른 순서로 있거나 단어들이 떨어져 있어도 걸리고, 여러 단어 중
+    한 글자 단어는 gram 이 없어 빠진다. 그래서 색인은 후보를 줄이는 데만 쓰고, 후보 행에
+    `notes LIKE '%q%'` 를 다시 걸어 결과는 LIKE 와 같게 만든다.
+    """
+    qg = sorted(grams(q))
+    if not qg or all(len(g) == 1 for g in qg):
+        return None
+    qg = [g for g in qg if len(g) > 1]
+    marks = ", ".join(["%s"] * len(qg))
+    # 모든 2-gram 이 있는 일기만 후보 (LIKE 결과를 모두 포함), score = 일치 gram 빈도 합
+    sql = f"""
+        JOIN (
+            SELECT diary_id, SUM(tf) AS score
+            FROM diary_ngram
+            WHERE user_pk=%s AND gram IN ({marks})
+            GROUP BY diary_id
+            HAVING COUNT(*) = %s
+        ) s ON s.diary_id = emotion_diary.id AND emotion_diary.notes LIKE %s
+    """
+    return sql, [user_pk, *qg, len(qg), f"%{q}%"]
+
+
+def highlights(notes: str, q: str):
+    """notes 안에서 q 의 각 단어가 나타나는 [start, end) 위치 목록."""
+    spans = []
+    lower = (notes or "").lower()
+    for word in set(_WORD_RE.findall((q or "").lower())):
+        start = lower.find(word)
+        while start != -1:
+            spans.append([start, start + len(word)])
+            start = lower.find(word, start + len(word))
+    return sorted(spans)
+
+
+def rebuild(batch_size=500):
+    from db import get_conn
+    from services import diary_archive
+
+    total = 0
+    with get_conn() as conn, conn.cursor() as cur:
+        # 보관된 일기도 기간 검색 대상이므로 두 테이블을 차례로
+        for table in diary_archive.TABLES:
+            last_id = 0
+            while True:
+                cur.execute(
+                    f"SELECT id, user_pk, notes FROM {table} "
+                    f"WHERE id > %s AND deleted_at IS NULL ORDER BY id LIMIT %s",
+                    (last_id, batch_size),
+                )
+                rows = cur.fetchall()
+                if not rows:
+                    break
+                for r in rows:
+                    index_entry(cur, r["user_pk"], r["id"], r["notes"])
+                last_id = rows[-1]["id"]
+                total += len(rows)
+                print(f"indexed {total} entries ({table}, last id={last_id})")
+    return total
+
+
+if __name__ == "__main__":
+    rebuild()
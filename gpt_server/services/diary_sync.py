@@ -0,0 +1,292 @@
+# services/diary_sync.py
+#  오프라인 우선(Flutter) 동기화: 사용자별 변경 버전, 변경분 피드, 일괄 쓰기
+#  - bump(): 일기 쓰기 트랜잭션마다 사용자 버전 +1. 같은 행을 잠그므로 한 사용자의 쓰기는
+#    버전 순서대로 커밋된다 → "change_version > since" 로 빠짐없이 변경분을 읽을 수 있다
+#    잠금 순서: 모든 쓰기 경로는 bump() 로 버전 행을 먼저 잠근 뒤 일기 행을 잠근다 (순서가 엇갈리면 교착 1213)
+#  - 삭제는 deleted_at + change_version 으로 남으므로(tombstone) 변경분 피드에 delete 로 나온다
+#    정리 작업(services/diary_archive.py)이 오래된 tombstone 을 지우면 purged_version 이 오르고,
+#    그보다 옛 since 는 놓친 삭제가 있을 수 있으므로 전체 동기화(reset)로 응답한다
+#  - apply_batch(): 생성/수정/삭제를 메모리에서 순서대로 합친 뒤 한 트랜잭션에서 다중 행 문장으로 반영
+#    클라이언트가 보낸 op key 별 결과를 diary_op_log 에 남겨, 재전송되면 적용 없이 같은 결과를 돌려준다
+import json
+import os
+from datetime import datetime
+
+from db import insert_returning
+from services import diary_archive, diary_search, emotion_analysis, mood_rollup
+
+SYNC_BATCH_MAX_OPS = int(os.getenv("SYNC_BATCH_MAX_OPS", "200"))
+SYNC_CHANGES_LIMIT = int(os.getenv("SYNC_CHANGES_LIMIT", "500"))
+
+
+class BatchError(ValueError):
+    """요청 전체가 잘못됨 → 400"""
+
+
+# -------------------------------
+# 버전
+# -------------------------------
+def bump(cur, user_pk) -> int:
+    # LAST_INSERT_ID(expr): 새 버전을 OK 패킷의 insert id 로 돌려받아 추가 SELECT 없이 한 번에
+    cur.execute(
+        "INSERT INTO diary_user_version (user_pk, version) VALUES (%s, LAST_INSERT_ID(1)) "
+        "ON DUPLICATE KEY UPDATE version = LAST_INSERT_ID(version + 1)",
+        (user_pk,),
+    )
+    return cur.lastrowid
+
+
+def current_version(cur, user_pk) -> int:
+    cur.execute("SELECT version FROM diary_user_version WHERE user_pk=%s", (user_pk,))
+    row = cur.fetchone()
+    return row["version"] if row else 0
+
+
+# -------------------------------
+# 변경분 피드
+# -------------------------------
+def parse_since(raw):
+    """"V"(버전 V 까지 받음) 또는 "V.I"(버전 V 의 id I 까지 받음). 생략 = 전체 → (None, None)"""
+    if raw is None or raw == "":
+        return None, None
+    version, _, last_id = str(raw).partition(".")
+    return int(version), (int(last_id) if last_id else None)
+
+
+def fetch_changes(cur, user_pk, since, limit=SYNC_CHANGES_LIMIT):
+    """(rows, next_since, has_more, reset). rows 에는 deleted_at 이 있는 tombstone 도 포함된다.
+    reset=True 면 since 이후의 tombstone 일부가 이미 지워져 전체 목록으로 응답한 것 → 클라이언트는 로컬을 교체
+    보관분(emotion_diary_archive)도 함께 읽는다: 전체 목록에서 빠지면 reset 때 기기에서 지워지고,
+    since 이후에 수정된 뒤 보관된 일기는 변경분에서 빠진다"""
+    version, last_id = since
+    # 버전을 먼저 읽는다: 이후 커밋된 변경은 행 조회에 보이거나 다음 since 로 다시 읽힌다
+    cur.execute("SELECT version, purged_version FROM diary_user_version WHERE user_pk=%s", (user_pk,))
+    row = cur.fetchone() or {"version": 0, "purged_version": 0}
+    latest = row["version"]
+    reset = version is not None and version < row["purged_version"]
+    if reset:
+        version, last_id = None, None
+    if version is None:
+        cond, params = "deleted_at IS NULL", []
+    elif last_id is None:
+        cond, params = "change_version > %s", [version]
+    else:
+        cond, params = "(change_version > %s OR (change_version = %s AND id > %s))", [version, version, last_id]
+    cur.execute(
+        f"SELECT id, mood, notes, created_at, updated_at, deleted_at, change_version "
+        f"FROM {diary_archive.source(True)} WHERE user_pk=%s AND {cond} "
+        f"ORDER BY change_version, id LIMIT %s",
+        (user_pk, *params, limit + 1),
+    )
+    rows = cur.fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if has_more:
+        # 한 트랜잭션(같은 버전)의 행이 페이지 경계에 걸칠 수 있으므로 id 까지 이어 받는다
+        next_since = f"{rows[-1]['change_version']}.{rows[-1]['id']}"
+    else:
+        seen = rows[-1]["change_version"] if rows else (version or 0)
+        next_since = str(max(latest, seen))
+    return rows, next_since, has_more, reset
+
+
+# -------------------------------
+# 일괄 쓰기
+# -------------------------------
+def _parse_created(raw):
+    if not raw:
+        return None
+    try:
+        dt = datetime.fromisoformat(str(raw).strip().replace("Z", "+00:00"))
+    except ValueError:
+        return False
+    return dt.replace(tzinfo=None, microsecond=0)
+
+
+def validate_ops(ops):
+    if not isinstance(ops, list) or not ops:
+        raise BatchError("ops 배열이 필요합니다.")
+    if len(ops) > SYNC_BATCH_MAX_OPS:
+        raise BatchError(f"ops 는 최대 {SYNC_BATCH_MAX_OPS}개까지 보낼 수 있습니다.")
+    keys, out = set(), []
+    for n, op in enumerate(ops):
+        if not isinstance(op, dict):
+            raise BatchError(f"ops[{n}]: 객체가 아닙니다.")
+        key = str(op.get("key") or "").strip()
+        if not key or len(key) > 64:
+            raise BatchError(f"ops[{n}]: key(1~64자)가 필요합니다.")
+        if key in keys:
+            raise BatchError(f"ops[{n}]: 같은 key 가 두 번 있습니다.")
+        keys.add(key)
+        kind = op.get("op")
+        if kind not in ("create", "update", "delete"):
+            raise BatchError(f"ops[{n}]: op 는 create/update/delete 중 하나입니다.")
+        target = op.get("id")
+        ref = str(op.get("ref") or "").strip() or None
+        if kind != "create" and not isinstance(target, int) and not ref:
+            raise BatchError(f"ops[{n}]: id 또는 ref(같은/이전 배치의 create key)가 필요합니다.")
+        out.append({
+            "key": key, "op": kind, "id": target if isinstance(target, int) else None, "ref": ref,
+            "mood": (op.get("mood") or "").strip() if kind == "create" else ((op.get("mood") or "").strip() or None),
+            "notes": op.get("notes") or None,
+            "created_at": _parse_created(op.get("createdAt") or op.get("created_at")) if kind == "create" else None,
+        })
+    return out
+
+
+def _marks(n):
+    return ", ".join(["%s"] * n)
+
+
+def apply_batch(cur, user_pk, ops, format_item):
+    """트랜잭션 안에서 호출. (op 별 결과 목록, 버전).
+
+    같은 일기에 대한 여러 op 는 순서대로 합쳐 최종 상태만 기록하고, 각 결과의 item 은 배치 적용 후 상태다.
+    create 의 id 는 INSERT ... RETURNING 이 돌려준 행 순서대로 붙인다 (db.insert_returning, auto-increment 연속성에 기대지 않음).
+    """
+    refs = {o["ref"] for o in ops if o["ref"]}
+    lookup = sorted({o["key"] for o in ops} | refs)
+    cur.execute(
+        f"SELECT op_key, diary_id, response FROM diary_op_log WHERE user_pk=%s AND op_key IN ({_marks(len(lookup))})",
+        (user_pk, *lookup),
+    )
+    logged = {r["op_key"]: r for r in cur.fetchall()}
+    pending = [o for o in ops if o["key"] not in logged]
+    if not pending:
+        return [dict(json.loads(logged[o["key"]]["response"]), replayed=True) for o in ops], current_version(cur, user_pk)
+
+    # 이전 배치에서 만든 일기를 ref 로 가리키는 경우 → 실제 id
+    for o in pending:
+        if o["ref"] and o["ref"] in logged and o["id"] is None:
+            o["id"] = logged[o["ref"]]["diary_id"]
+
+    # 버전 행을 먼저 잠근다 (다른 쓰기 경로와 같은 순서)
+    version = bump(cur, user_pk)
+    target_ids = sorted({o["id"] for o in pending if o["id"] is not None})
+    existing = {}
+    if target_ids:
+        cur.execute(
+            f"SELECT id, mood, notes, created_at FROM emotion_diary "
+            f"WHERE user_pk=%s AND deleted_at IS NULL AND id IN ({_marks(len(target_ids))}) FOR UPDATE",
+            (user_pk, *target_ids),
+        )
+        existing = {r["id"]: r for r in cur.fetchall()}
+        # 보관된 일기면 되돌린 뒤 다시 잠근다 (없는 id 일 때만 추가 조회)
+        restored = diary_archive.restore_many(cur, user_pk, [i for i in target_ids if i not in existing])
+        if restored:
+            cur.execute(
+                f"SELECT id, mood, notes, created_at FROM emotion_diary "
+                f"WHERE deleted_at IS NULL AND id IN ({_marks(len(restored))}) FOR UPDATE",
+                restored,
+            )
+            existing.update({r["id"]: r for r in cur.fetchall()})
+    cur.execute("SELECT NOW() AS now")
+    now = cur.fetchone()["now"]
+
+    # ---- 메모리에서 순서대로 적용 ----
+    creates, by_key = [], {}
+    touched = {}          # id -> {"id", "mood", "notes", "created_at", "deleted"} (기존 일기의 최종 상태)
+    outcomes = {}         # key -> (kind, 대상) | (404, 메시지) | (400, 메시지)
+    for o in pending:
+        kind = o["op"]
+        if kind == "create":
+            if o["created_at"] is False:
+                outcomes[o["key"]] = (400, "createdAt 형식이 올바르지 않습니다.")
+                continue
+            c = {"key": o["key"], "mood": o["mood"], "notes": o["notes"],
+                 "created_at": o["created_at"] or now, "deleted": False}
+            creates.append(c)
+            by_key[o["key"]] = c
+            outcomes[o["key"]] = ("create", c)
+            continue
+
+        if o["id"] is None and o["ref"] in by_key:
+            state = by_key[o["ref"]]
+        elif o["id"] in existing:
+            old = existing[o["id"]]
+            state = touched.setdefault(o["id"], {"id": o["id"], "mood": old["mood"], "notes": old["notes"],
+                                                 "created_at": old["created_at"], "deleted": False})
+        else:
+            state = None
+        if state is None or state["deleted"]:
+            outcomes[o["key"]] = (404, "수정/삭제할 항목이 없거나 권한이 없습니다.")
+            continue
+        if kind == "update":
+            state["mood"], state["notes"] = o["mood"], o["notes"]
+        else:
+            state["deleted"] = True
+        outcomes[o["key"]] = (kind, state)
+
+    # ---- 다중 행 문장으로 반영 ----
+    if creates:
+        # 긴 일기가 많으면 문장이 나뉘므로 lastrowid 대신 RETURNING 으로 행마다 id 를 받는다
+        new_ids = insert_returning(
+            cur,
+            "INSERT INTO emotion_diary (user_pk, mood, notes, created_at, updated_at, deleted_at, change_version) VALUES",
+            [(user_pk, c["mood"], c["notes"], c["created_at"], now, now if c["deleted"] else None, version)
+             for c in creates],
+        )
+        for c, r in zip(creates, new_ids):
+            c["id"] = r["id"]
+
+    updated = [i for i, s in touched.items() if not s["deleted"]]
+    deleted = [i for i, s in touched.items() if s["deleted"]]
+    if updated:
+        # 다중 행 UPDATE: 위에서 FOR UPDATE 로 잠근(= 존재하는) 이 사용자 행만 넣으므로 INSERT 로 떨어지지 않는다
+        cur.executemany(
+            "INSERT INTO emotion_diary (id, user_pk, mood, notes, updated_at, change_version) "
+            "VALUES (%s,%s,%s,%s,%s,%s) "
+            "ON DUPLICATE KEY UPDATE mood=VALUES(mood), notes=VALUES(notes), "
+            "updated_at=VALUES(updated_at), change_version=VALUES(change_version)",
+            [(i, user_pk, touched[i]["mood"], touched[i]["notes"], now, version) for i in updated],
+        )
+    if deleted:
+        cur.execute(
+            f"UPDATE emotion_diary SET deleted_at=%s, change_version=%s "
+            f"WHERE user_pk=%s AND id IN ({_marks(len(deleted))})",
+            (now, version, user_pk, *deleted),
+        )
+
+    # 검색 색인 / 롤업 / 감정 분석 큐
+    renotes = [i for i in updated if touched[i]["notes"] != existing[i]["notes"]]
+    diary_search.remove_many(cur, renotes + deleted)
+    live_creates = [c for c in creates if not c["deleted"]]
+    diary_search.index_many(cur, user_pk, [{"id": c["id"], "notes": c["notes"]} for c in live_creates]
+                            + [{"id": i, "notes": touched[i]["notes"]} for i in renotes])
+    cells = [(c["created_at"].date(), c["mood"], +1) for c in live_creates]
+    for i, s in touched.items():
+        day = existing[i]["created_at"].date()
+        cells.append((day, existing[i]["mood"], -1))
+        if not s["deleted"]:
+            cells.append((day, s["mood"], +1))
+    mood_rollup.add(cur, user_pk, cells)
+    changed = [{"id": i, "mood": touched[i]["mood"], "notes": touched[i]["notes"]} for i in updated
+               if (touched[i]["mood"], touched[i]["notes"]) != (existing[i]["mood"], existing[i]["notes"])]
+    emotion_analysis.enqueue_many(cur, user_pk, [{"id": c["id"], "mood": c["mood"], "notes": c["notes"]}
+                                                 for c in live_creates] + changed)
+
+    # ---- op 별 결과 + 멱등 기록 ----
+    results, log_rows = [], []
+    for o in ops:
+        if o["key"] in logged:
+            results.append(dict(json.loads(logged[o["key"]]["response"]), replayed=True))
+            continue
+        kind, target = outcomes[o["key"]]
+        if kind in (400, 404):
+            res = {"key": o["key"], "status": kind, "error": target}
+            results.append(res)
+            if kind == 404:
+                log_rows.append((user_pk, o["key"], None, json.dumps(res, ensure_ascii=False)))
+            continue
+        res = {"key": o["key"], "status": 201 if kind == "create" else 200, "id": target["id"]}
+        if not target["deleted"]:
+            res["item"] = format_item(dict(target, updated_at=now))
+        results.append(res)
+        log_rows.append((user_pk, o["key"], target["id"], json.dumps(res, ensure_ascii=False)))
+    if log_rows:
+        # 같은 key 의 배치가 동시에 들어오면 여기서 PK 충돌(IntegrityError) → 호출 측에서 롤백 후 재시도
+        cur.executemany(
+            "INSERT INTO diary_op_log (user_pk, op_key, diary_id, response) VALUES (%s,%s,%s,%s)",
+            log_rows,
+        )
+    return results, version
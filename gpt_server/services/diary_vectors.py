@@ -0,0 +1,391 @@
+# services/diary_vectors.py
+#  사용자별 일기 벡터 색인 → 채팅 프롬프트에 관련 일기 top-k 만 넣는다
+#  - 벡터: diary_search.grams 의 2-gram 을 DIARY_VECTOR_DIM 칸으로 해싱(부호 해싱)한 log-TF, L2 정규화
+#    IDF 는 사용자별 문서 빈도(df)로 조회 시점에 질의 쪽에만 곱한다 (점수 = cos(일기, 질의⊙idf²))
+#    → 일기가 늘어도 저장된 벡터를 다시 쓸 필요가 없고, 조회는 int8 행렬 × 벡터 한 번
+#  - 저장: DIARY_VECTOR_DIR/u<user_pk>/ 에 vectors.npy(int8 양자화, 행 = 일기) / ids.npy / meta.json
+#    numpy memmap 으로 열어 필요한 페이지만 읽고, 용량이 차면 두 배로 늘린다. 삭제된 행은 id=0 으로 비워 재사용
+#  - 일기 생성/수정/삭제가 커밋된 뒤 upsert / remove 를 호출한다 (파일은 트랜잭션 밖이므로 커밋 후)
+#    어긋나면 재구축: python -m services.diary_vectors [--user N]
+#  - 여러 프로세스가 같은 사용자 색인을 쓸 수 있으므로 쓰기는 파일 잠금, 읽기는 meta.json 변경 시각으로 다시 연다
+import json
+import logging
+import math
+import os
+import threading
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+from services import diary_search, profiler
+
+try:
+    import fcntl
+except ImportError:  # Windows 개발 환경: 프로세스 간 잠금 없이 스레드 잠금만
+    fcntl = None
+
+DIARY_VECTOR_DIR = os.getenv("DIARY_VECTOR_DIR", os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "data", "diary_vectors"))
+DIARY_VECTOR_DIM = int(os.getenv("DIARY_VECTOR_DIM", "256"))
+DIARY_VECTOR_CACHE = int(os.getenv("DIARY_VECTOR_CACHE", "64"))
+DIARY_CONTEXT_K = int(os.getenv("DIARY_CONTEXT_K", "3"))
+DIARY_CONTEXT_MIN_SCORE = float(os.getenv("DIARY_CONTEXT_MIN_SCORE", "0.1"))
+DIARY_CONTEXT_CHARS = int(os.getenv("DIARY_CONTEXT_CHARS", "300"))
+
+log = logging.getLogger(__name__)
+
+_INITIAL_CAPACITY = 64
+_SCALE = 127.0
+_CHUNK_ROWS = 4096
+
+
+# -------------------------------
+# 벡터화
+# -------------------------------
+def vectorize(mood, notes, dim=DIARY_VECTOR_DIM) -> np.ndarray:
+    v = np.zeros(dim, dtype=np.float32)
+    counts = diary_search.grams(notes)
+    if mood:
+        counts[f"mood:{mood.lower()}"] += 1
+    for gram, tf in counts.items():
+        h = zlib.crc32(gram.encode("utf-8"))
+        # 부호 해싱: 충돌한 특징이 서로 상쇄되도록 → 내적의 편향이 줄어든다
+        v[h % dim] += (1.0 + math.log(tf)) * (1.0 if h & 0x80000000 else -1.0)
+    norm = float(np.linalg.norm(v))
+    return v / norm if norm else v
+
+
+def quantize(v: np.ndarray) -> np.ndarray:
+    # 단위 벡터 성분([-1, 1])을 int8 로: float32 대비 1/4 크기, 조회 시 변환도 float16 보다 빠르다
+    return np.round(v * _SCALE).astype(np.int8)
+
+
+# -------------------------------
+# 사용자 색인
+# -------------------------------
+class UserIndex:
+    def __init__(self, path, dim=DIARY_VECTOR_DIM):
+        self.path = path
+        self.dim = dim
+        self.size = 0                      # 사용 중인 행 수 (빈 행 포함)
+        self.df = np.zeros(dim, dtype=np.float32)
+        self.live = 0
+        self.vectors = None
+        self.ids = None
+        self.rows = {}                     # diary_id → 행 번호
+        self.free = []
+        self.mtime = None
+
+    # ---- 파일 ----
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _meta_mtime(self):
+        try:
+            return os.stat(self._file("meta.json")).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def load(self):
+        self.mtime = self._meta_mtime()
+        if self.mtime is None:
+            self.size, self.live, self.rows, self.free = 0, 0, {}, []
+            self.df = np.zeros(self.dim, dtype=np.float32)
+            self.vectors = self.ids = None
+            return self
+        with open(self._file("meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta["dim"] != self.dim:
+            raise ValueError(f"색인 차원({meta['dim']})이 DIARY_VECTOR_DIM({self.dim})과 다릅니다 → 재구축 필요")
+        self.size, self.live = meta["size"], meta["live"]
+        self.df = np.asarray(meta["df"], dtype=np.float32)
+        self.vectors = np.load(self._file("vectors.npy"), mmap_mode="r+")
+        self.ids = np.load(self._file("ids.npy"), mmap_mode="r+")
+        ids = np.asarray(self.ids[:self.size])
+        self.rows = {int(d): i for i, d in enumerate(ids) if d}
+        self.free = np.flatnonzero(ids == 0).tolist()
+        return self
+
+    def fresh(self) -> bool:
+        return self.mtime == self._meta_mtime()
+
+    def _save_meta(self):
+        tmp = self._file("meta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "size": self.size, "live": self.live, "df": self.df.tolist()}, f)
+        os.replace(tmp, self._file("meta.json"))
+        self.mtime = self._meta_mtime()
+
+    def _grow(self, need):
+        capacity = 0 if self.vectors is None else self.vectors.shape[0]
+        if need <= capacity:
+            return
+        new_cap = max(_INITIAL_CAPACITY, capacity * 2, need)
+        os.makedirs(self.path, exist_ok=True)
+        vectors = np.lib.format.open_memmap(self._file("vectors.npy.tmp"), mode="w+",
+                                            dtype=np.int8, shape=(new_cap, self.dim))
+        ids = np.lib.format.open_memmap(self._file("ids.npy.tmp"), mode="w+", dtype=np.int64, shape=(new_cap,))
+        if capacity:
+            vectors[:self.size] = self.vectors[:self.size]
+            ids[:self.size] = self.ids[:self.size]
+        vectors.flush()
+        ids.flush()
+        del vectors, ids
+        os.replace(self._file("vectors.npy.tmp"), self._file("vectors.npy"))
+        os.replace(self._file("ids.npy.tmp"), self._file("ids.npy"))
+        self.vectors = np.load(self._file("vectors.npy"), mmap_mode="r+")
+        self.ids = np.load(self._file("ids.npy"), mmap_mode="r+")
+
+    # ---- 쓰기 (호출 측이 잠금) ----
+    def _clear_row(self, row):
+        self.df -= (np.asarray(self.vectors[row]) != 0)
+        self.vectors[row] = 0
+        self.ids[row] = 0
+        self.free.append(row)
+        self.live -= 1
+
+    def put_many(self, entries):
+        """entries: [(diary_id, mood, notes)]"""
+        entries = list(entries)
+        for diary_id, _, _ in entries:
+            row = self.rows.pop(diary_id, None)
+            if row is not None:
+                self._clear_row(row)
+        self.free.sort(reverse=True)
+        self._grow(self.size + max(0, len(entries) - len(self.free)))
+        for diary_id, mood, notes in entries:
+            v = quantize(vectorize(mood, notes, self.dim))
+            if self.free:
+                row = self.free.pop()
+            else:
+                row, self.size = self.size, self.size + 1
+            self.vectors[row] = v
+            self.ids[row] = diary_id
+            self.rows[diary_id] = row
+            self.df += (v != 0)
+            self.live += 1
+        self._flush()
+
+    def remove_many(self, diary_ids):
+        changed = False
+        for diary_id in diary_ids:
+            row = self.rows.pop(diary_id, None)
+            if row is not None:
+                self._clear_row(row)
+                changed = True
+        if changed:
+            self._flush()
+
+    def _flush(self):
+        if self.vectors is not None:
+            self.vectors.flush()
+            self.ids.flush()
+        os.makedirs(self.path, exist_ok=True)
+        self._save_meta()
+
+    # ---- 조회 ----
+    def search(self, mood, text, k):
+        """[(diary_id, score)] 점수 내림차순. score = cos(일기 벡터, 질의 ⊙ idf²) ∈ [-1, 1]"""
+        if not self.live or k <= 0:
+            return []
+        q = vectorize(mood, text, self.dim)
+        if not q.any():
+            return []
+        idf = np.log((1.0 + self.live) / (1.0 + self.df)) + 1.0
+        w = q * idf * idf
+        w /= float(np.linalg.norm(w)) * _SCALE
+        scores = np.empty(self.size, dtype=np.float32)
+        # 큰 색인에서 임시 float 행렬이 커지지 않도록 나눠서 계산
+        for start in range(0, self.size, _CHUNK_ROWS):
+            end = min(start + _CHUNK_ROWS, self.size)
+            scores[start:end] = self.vectors[start:end] @ w
+        scores[np.asarray(self.ids[:self.size]) == 0] = -1.0
+        k = min(k, self.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(self.ids[i]), float(scores[i])) for i in top if scores[i] > 0]
+
+
+# -------------------------------
+# 색인 캐시 / 잠금
+# -------------------------------
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_user_locks = {}
+
+
+def _path(user_pk):
+    return os.path.join(DIARY_VECTOR_DIR, f"u{int(user_pk)}")
+
+
+class _Locked:
+    """한 사용자 색인에 대한 쓰기 잠금 (스레드 + 프로세스)."""
+
+    def __init__(self, user_pk):
+        self.user_pk = user_pk
+        with _cache_lock:
+            self.lock = _user_locks.setdefault(user_pk, threading.Lock())
+        self.fd = None
+
+    def __enter__(self):
+        self.lock.acquire()
+        if fcntl is not None:
+            os.makedirs(_path(self.user_pk), exist_ok=True)
+            self.fd = os.open(os.path.join(_path(self.user_pk), ".lock"), os.O_CREAT | os.O_RDWR, 0o600)
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+        self.lock.release()
+
+
+def _index(user_pk) -> UserIndex:
+    with _cache_lock:
+        idx = _cache.get(user_pk)
+        if idx is not None:
+            _cache.move_to_end(user_pk)
+    if idx is None or not idx.fresh():
+        idx = UserIndex(_path(user_pk)).load()
+        with _cache_lock:
+            _cache[user_pk] = idx
+            _cache.move_to_end(user_pk)
+            while len(_cache) > DIARY_VECTOR_CACHE:
+                _cache.popitem(last=False)
+    return idx
+
+
+def upsert_many(user_pk, rows):
+    """rows: [{"id", "mood", "notes"}] — 커밋 후 호출. 색인 오류는 요청을 실패시키지 않고 로그만 (재구축으로 복구)."""
+    if not user_pk or not rows:
+        return
+    try:
+        with _Locked(user_pk):
+            _index(user_pk).put_many((r["id"], r.get("mood"), r.get("notes")) for r in rows)
+    except (OSError, ValueError) as e:
+        log.warning("diary vector upsert failed (user %s): %s", user_pk, e)
+
+
+def upsert(user_pk, diary_id, mood, notes):
+    upsert_many(user_pk, [{"id": diary_id, "mood": mood, "notes": notes}])
+
+
+def remove_many(user_pk, diary_ids):
+    if not user_pk or not diary_ids:
+        return
+    try:
+        with _Locked(user_pk):
+            _index(user_pk).remove_many(diary_ids)
+    except (OSError, ValueError) as e:
+        log.warning("diary vector remove failed (user %s): %s", user_pk, e)
+
+
+def remove(user_pk, diary_id):
+    remove_many(user_pk, [diary_id])
+
+
+def search(user_pk, text, k=DIARY_CONTEXT_K, min_score=DIARY_CONTEXT_MIN_SCORE):
+    if not user_pk or k <= 0:
+        return []
+    return [(d, s) for d, s in _index(user_pk).search(None, text, k) if s >= min_score]
+
+
+# -------------------------------
+# 채팅 프롬프트
+# -------------------------------
+def context_message(user_pk, user_message):
+    """관련 일기 top-k 를 system 메시지 하나로. 없으면 None."""
+    hits = search(user_pk, user_message)
+    if not hits:
+        return None
+    from db import get_conn
+    from services import diary_archive
+
+    ids = [d for d, _ in hits]
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute(
+            f"SELECT id, mood, notes, created_at FROM {diary_archive.source(True)} "
+            f"WHERE user_pk=%s AND deleted_at IS NULL AND id IN ({', '.join(['%s'] * len(ids))})",
+            (user_pk, *ids),
+        )
+        found = {r["id"]: r for r in cur.fetchall()}
+    lines = []
+    for diary_id in ids:
+        r = found.get(diary_id)
+        if r is None:
+            continue
+        notes = (r["notes"] or "").strip().replace("\n", " ")[:DIARY_CONTEXT_CHARS]
+        lines.append(f"- {r['created_at']:%Y-%m-%d} (기분: {r['mood'] or '없음'}) {notes}")
+    if not lines:
+        return None
+    return {"role": "system", "content": "참고: 사용자가 예전에 쓴 관련 일기입니다. 필요할 때만 자연스럽게 활용하세요.\n"
+                                         + "\n".join(lines)}
+
+
+def attach_context(messages, user_pk, user_message, enabled=True):
+    """첫 system 메시지 뒤에 관련 일기 메시지를 끼워 넣습니다 (로그인 사용자만). 실패해도 채팅은 그대로."""
+    if not enabled or not isinstance(user_pk, int) or user_pk <= 0 or DIARY_CONTEXT_K <= 0:
+        return messages
+    try:
+        with profiler.span("diary_context"):
+            msg = context_message(user_pk, user_message)
+    except Exception as e:
+        log.warning("diary context lookup failed (user %s): %s", user_pk, e)
+        return messages
+    if msg is None:
+        return messages
+    return messages[:1] + [msg] + messages[1:]
+
+
+# -------------------------------
+# 재구축
+# -------------------------------
+def rebuild(user_pk=None, batch_size=1000):
+    from db import get_conn
+    from services import diary_archive
+
+    total = 0
+    with get_conn() as conn, conn.cursor() as cur:
+        if user_pk is None:
+            cur.execute(f"SELECT DISTINCT user_pk FROM {diary_archive.source(True)} WHERE deleted_at IS NULL")
+            users = [r["user_pk"] for r in cur.fetchall()]
+        else:
+            users = [user_pk]
+        for pk in users:
+            with _Locked(pk):
+                for name in ("vectors.npy", "ids.npy", "meta.json"):
+                    path = os.path.join(_path(pk), name)
+                    if os.path.exists(path):
+                        os.remove(path)
+                with _cache_lock:
+                    _cache.pop(pk, None)
+                idx = UserIndex(_path(pk)).load()
+                # 보관된 일기도 채팅 맥락 후보 → 두 테이블을 차례로
+                for table in diary_archive.TABLES:
+                    last_id = 0
+                    while True:
+                        cur.execute(
+                            f"SELECT id, mood, notes FROM {table} "
+                            f"WHERE user_pk=%s AND id > %s AND deleted_at IS NULL ORDER BY id LIMIT %s",
+                            (pk, last_id, batch_size),
+                        )
+                        rows = cur.fetchall()
+                        if not rows:
+                            break
+                        idx.put_many((r["id"], r["mood"], r["notes"]) for r in rows)
+                        last_id = rows[-1]["id"]
+                        total += len(rows)
+            print(f"user {pk}: {idx.live} entries (total {total})")
+    return total
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="일기 벡터 색인 재구축")
+    parser.add_argument("--user", type=int, help="이 사용자만 재구축")
+    args = parser.parse_args()
+    rebuild(args.user)
@@ -0,0 +1,299 @@
+# services/emotion_analysis.py
+#  일기 감정 분석(감정 분류 + 위로 한마디) 백그라운드 작업
+#  - 큐는 diary_analysis 테이블(migrations/0005_diary_analysis.sql). 일기 생성/수정 트랜잭션에서
+#    enqueue() 로 한 줄만 넣으므로 POST /api/history 는 LLM 을 기다리지 않는다
+#  - 워커는 UPDATE ... LIMIT 로 작업을 임대(visible_at = 지금 + ANALYSIS_VISIBILITY 초)한다.
+#    처리 중 워커가 죽으면 임대가 끝난 뒤 다른 워커가 다시 가져간다
+#  - 일기 여러 건을 LLM 호출 한 번으로 분석(ANALYSIS_BATCH)하고 결과를 같은 행에 기록
+#  - 멱등: content_hash(mood+notes)가 같으면 다시 넣어도 재분석하지 않고,
+#    처리 도중 일기가 수정되면(해시 변경) 옛 내용의 결과는 버린다
+#  실행: python -m services.emotion_analysis [--workers N] [--backfill] [--requeue-failed]
+import hashlib
+import json
+import logging
+import os
+import socket
+import threading
+import uuid
+
+import config  # noqa: F401 (.env 로드 — 아래 설정을 읽기 전에)
+from services import metrics
+
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "2"))
+ANALYSIS_BATCH = int(os.getenv("ANALYSIS_BATCH", "8"))
+ANALYSIS_VISIBILITY = int(os.getenv("ANALYSIS_VISIBILITY", "120"))
+ANALYSIS_MAX_ATTEMPTS = int(os.getenv("ANALYSIS_MAX_ATTEMPTS", "5"))
+ANALYSIS_POLL = float(os.getenv("ANALYSIS_POLL", "2"))
+ANALYSIS_MAX_CHARS = int(os.getenv("ANALYSIS_MAX_CHARS", "2000"))
+EMOTIONS = [e.strip() for e in os.getenv(
+    "ANALYSIS_EMOTIONS", "기쁨,슬픔,분노,불안,평온,피곤,외로움,감사").split(",") if e.strip()]
+
+SYSTEM_PROMPT = (
+    "너는 감정일기를 읽는 따뜻한 상담가야. 각 일기의 주된 감정(emotion)을 "
+    f"[{', '.join(EMOTIONS)}] 중 하나로 고르고, 글쓴이에게 건넬 2~3문장의 위로(feedback)를 한국어로 써줘. "
+    '반드시 {"results": [{"id": 일기번호, "emotion": "...", "feedback": "..."}]} 형식의 JSON 으로만 답해.'
+)
+
+_ENQUEUE_SQL = """
+    INSERT INTO diary_analysis (diary_id, user_pk, content_hash, status, visible_at)
+    VALUES (%s, %s, %s, 'pending', NOW())
+    ON DUPLICATE KEY UPDATE
+        status     = IF(content_hash = VALUES(content_hash), status, 'pending'),
+        attempts   = IF(content_hash = VALUES(content_hash), attempts, 0),
+        visible_at = IF(content_hash = VALUES(content_hash), visible_at, NOW()),
+        locked_by  = IF(content_hash = VALUES(content_hash), locked_by, NULL),
+        content_hash = VALUES(content_hash)
+"""
+# ↑ MariaDB 는 SET 절을 왼쪽부터 적용하므로 content_hash 는 마지막에 바꾼다
+
+
+def content_hash(mood, notes) -> str:
+    return hashlib.sha1(f"{mood or ''}\x1f{notes or ''}".encode("utf-8")).hexdigest()
+
+
+def enqueue(cur, user_pk, diary_id, mood, notes):
+    """일기 쓰기 트랜잭션 안에서 호출. 내용이 그대로면 기존 결과/상태를 유지한다."""
+    cur.execute(_ENQUEUE_SQL, (diary_id, user_pk, content_hash(mood, notes)))
+
+
+def enqueue_many(cur, user_pk, rows):
+    """rows: [{"id", "mood", "notes"}, ...]"""
+    if rows:
+        cur.executemany(_ENQUEUE_SQL, [(r["id"], user_pk, content_hash(r["mood"], r["notes"])) for r in rows])
+
+
+def fetch_status(cur, user_pk, diary_ids):
+    """{diary_id: {"status", "emotion", "feedback", "updatedAt"}} — 큐에 없는 일기는 빠진다."""
+    if not diary_ids:
+        return {}
+    marks = ", ".join(["%s"] * len(diary_ids))
+    cur.execute(
+        f"SELECT diary_id, status, emotion, feedback, updated_at FROM diary_analysis "
+        f"WHERE user_pk=%s AND diary_id IN ({marks})",
+        (user_pk, *diary_ids),
+    )
+    return {r["diary_id"]: format_status(r) for r in cur.fetchall()}
+
+
+def format_status(r) -> dict:
+    done = r["status"] == "done"
+    return {
+        "status": r["status"],
+        "emotion": r["emotion"] if done else None,
+        "feedback": r["feedback"] if done else None,
+        "updatedAt": r["updated_at"].strftime("%Y-%m-%d %H:%M:%S") if r.get("updated_at") else None,
+    }
+
+
+# -------------------------------
+# 워커
+# -------------------------------
+def _claim(cur, token, limit):
+    # 임대가 끝났는데 시도 횟수를 다 쓴 running 행은 실패로 정리
+    cur.execute(
+        "UPDATE diary_analysis SET status='failed', locked_by=NULL, error='visibility timeout' "
+        "WHERE status='running' AND visible_at <= NOW() AND attempts >= %s",
+        (ANALYSIS_MAX_ATTEMPTS,),
+    )
+    cur.execute(
+        "UPDATE diary_analysis "
+        "SET status='running', locked_by=%s, attempts=attempts+1, "
+        "    visible_at = NOW() + INTERVAL %s SECOND "
+        "WHERE status IN ('pending', 'running') AND visible_at <= NOW() AND attempts < %s "
+        "ORDER BY visible_at LIMIT %s",
+        (token, ANALYSIS_VISIBILITY, ANALYSIS_MAX_ATTEMPTS, limit),
+    )
+    if cur.rowcount == 0:
+        return []
+    # 보관된 일기(emotion_diary_archive, services/diary_archive.py)도 살아 있는 일기다.
+    # 한 id 는 두 테이블 중 한 곳에만 있으므로 각각 PK 로 붙여 합친다 (UNION 파생 테이블은 조인 조건이 안 내려감)
+    cur.execute(
+        "SELECT a.diary_id, a.content_hash, a.attempts, COALESCE(e.id, r.id) AS live_id, "
+        "       COALESCE(e.mood, r.mood) AS mood, COALESCE(e.notes, r.notes) AS notes, "
+        "       COALESCE(e.deleted_at, r.deleted_at) AS deleted_at "
+        "FROM diary_analysis a "
+        "LEFT JOIN emotion_diary e ON e.id = a.diary_id "
+        "LEFT JOIN emotion_diary_archive r ON r.id = a.diary_id "
+        "WHERE a.locked_by=%s",
+        (token,),
+    )
+    return cur.fetchall()
+
+
+def _analyze(items):
+    """items: [{"diary_id", "mood", "notes"}] → {diary_id: (emotion, feedback)}"""
+    from services import llm_client
+
+    entries = "\n\n".join(
+        f"[일기 {it['diary_id']}] (기분: {it['mood'] or '없음'})\n{(it['notes'] or '')[:ANALYSIS_MAX_CHARS]}"
+        for it in items
+    )
+    completion = llm_client.llm.complete(
+        [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": entries}],
+        path="analysis",
+        temperature=0.3,
+        max_tokens=250 * len(items),
+        response_format={"type": "json_object"},
+    )
+    data = json.loads(completion.choices[0].message.content)
+    out = {}
+    for r in data.get("results") or []:
+        try:
+            diary_id = int(r.get("id"))
+        except (TypeError, ValueError):
+            continue
+        emotion = str(r.get("emotion") or "").strip()[:32]
+        feedback = str(r.get("feedback") or "").strip()
+        if emotion and feedback:
+            out[diary_id] = (emotion, feedback)
+    return out
+
+
+def _fail(cur, token, diary_ids, error):
+    # 지수 백오프로 다시 보이게 하고, 시도 횟수를 다 쓰면 failed
+    if not diary_ids:
+        return
+    marks = ", ".join(["%s"] * len(diary_ids))
+    cur.execute(
+        f"UPDATE diary_analysis "
+        f"SET status = IF(attempts >= %s, 'failed', 'pending'), locked_by=NULL, error=%s, "
+        f"    visible_at = NOW() + INTERVAL LEAST(600, 5 * POW(2, attempts)) SECOND "
+        f"WHERE locked_by=%s AND diary_id IN ({marks})",
+        (ANALYSIS_MAX_ATTEMPTS, str(error)[:255], token, *diary_ids),
+    )
+    metrics.ANALYSIS_JOBS.inc(len(diary_ids), result="retry")
+
+
+def run_once(limit=ANALYSIS_BATCH) -> int:
+    """작업을 한 묶음 처리합니다. 처리(시도)한 건수를 돌려줍니다."""
+    from db import get_conn
+
+    token = f"{socket.gethostname()[:30]}:{os.getpid()}:{uuid.uuid4().hex[:12]}"
+    with get_conn() as conn, conn.cursor() as cur:
+        claimed = _claim(cur, token, limit)
+    if not claimed:
+        return 0
+
+    # 삭제된 일기는 작업을 지우고, 임대 후 읽은 내용이 큐의 해시와 다르면(그 사이 수정) 다시 대기시킨다
+    gone, stale, live = [], [], []
+    for c in claimed:
+        if c["live_id"] is None or c["deleted_at"] is not None:
+            gone.append(c["diary_id"])
+        elif content_hash(c["mood"], c["notes"]) != c["content_hash"]:
+            stale.append(c["diary_id"])
+        else:
+            live.append(c)
+
+    results, error = {}, None
+    if live:
+        metrics.ANALYSIS_BATCH.observe(len(live))
+        try:
+            results = _analyze(live)
+        except Exception as e:
+            logging.warning(f"감정 분석 실패 ({len(live)}건): {type(e).__name__}: {e}")
+            error = f"{type(e).__name__}: {e}"
+
+    with get_conn() as conn, conn.cursor() as cur:
+        if gone:
+            marks = ", ".join(["%s"] * len(gone))
+            cur.execute(f"DELETE FROM diary_analysis WHERE locked_by=%s AND diary_id IN ({marks})",
+                        (token, *gone))
+        if stale:
+            marks = ", ".join(["%s"] * len(stale))
+            cur.execute(f"UPDATE diary_analysis SET status='pending', locked_by=NULL, visible_at=NOW() "
+                        f"WHERE locked_by=%s AND diary_id IN ({marks})", (token, *stale))
+        done = []
+        for c in live:
+            if c["diary_id"] in results:
+                emotion, feedback = results[c["diary_id"]]
+                done.append((emotion, feedback, c["diary_id"], token, c["content_hash"]))
+        if done:
+            # locked_by/content_hash 가 그대로일 때만 기록 (그 사이 재임대/수정되었으면 버림)
+            cur.executemany(
+                "UPDATE diary_analysis SET status='done', emotion=%s, feedback=%s, error=NULL, locked_by=NULL "
+                "WHERE diary_id=%s AND locked_by=%s AND content_hash=%s",
+                done,
+            )
+            metrics.ANALYSIS_JOBS.inc(len(done), result="done")
+        missing = [c["diary_id"] for c in live if c["diary_id"] not in results]
+        _fail(cur, token, missing, error or "응답에 결과가 없습니다.")
+    return len(claimed)
+
+
+def worker_loop(stop: threading.Event):
+    while not stop.is_set():
+        try:
+            n = run_once()
+        except Exception as e:
+            logging.warning(f"감정 분석 워커 오류: {type(e).__name__}: {e}")
+            n = 0
+        if n == 0:
+            stop.wait(ANALYSIS_POLL)
+
+
+def start_workers(n=ANALYSIS_WORKERS):
+    stop = threading.Event()
+    threads = [threading.Thread(target=worker_loop, args=(stop,), name=f"analysis-{i}", daemon=True)
+               for i in range(max(1, n))]
+    for t in threads:
+        t.start()
+    return stop, threads
+
+
+def backfill(batch_size=500):
+    """분석 행이 없는 일기를 큐에 넣습니다 (이미 있는 행은 해시가 같으면 그대로)."""
+    from db import get_conn
+
+    last_id, total = 0, 0
+    with get_conn() as conn, conn.cursor() as cur:
+        while True:
+            cur.execute(
+                "SELECT e.id, e.user_pk, e.mood, e.notes FROM emotion_diary e "
+                "LEFT JOIN diary_analysis a ON a.diary_id = e.id "
+                "WHERE e.id > %s AND e.deleted_at IS NULL AND a.diary_id IS NULL ORDER BY e.id LIMIT %s",
+                (last_id, batch_size),
+            )
+            rows = cur.fetchall()
+            if not rows:
+                break
+            cur.executemany(_ENQUEUE_SQL, [(r["id"], r["user_pk"], content_hash(r["mood"], r["notes"]))
+                                           for r in rows])
+            last_id = rows[-1]["id"]
+            total += len(rows)
+            print(f"queued {total} entries (last id={last_id})")
+    return total
+
+
+def requeue_failed():
+    from db import get_conn
+
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute("UPDATE diary_analysis SET status='pending', attempts=0, visible_at=NOW(), error=NULL "
+                    "WHERE status='failed'")
+        print(f"requeued {cur.rowcount} failed entries")
+        return cur.rowcount
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="일기 감정 분석 워커")
+    parser.add_argument("--workers", type=int, default=ANALYSIS_WORKERS)
+    parser.add_argument("--backfill", action="store_true", help="분석 행이 없는 기존 일기를 큐에 넣고 종료")
+    parser.add_argument("--requeue-failed", action="store_true", help="failed 작업을 다시 대기열로 돌리고 종료")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.backfill:
+        backfill()
+    elif args.requeue_failed:
+        requeue_failed()
+    else:
+        stop, threads = start_workers(args.workers)
+        print(f"emotion analysis workers={len(threads)} batch={ANALYSIS_BATCH}")
+        try:
+            while any(t.is_alive() for t in threads):
+                stop.wait(1)
+        except KeyboardInterrupt:
+            stop.set()
+            for t in threads:
+                t.join(timeout=ANALYSIS_VISIBILITY)
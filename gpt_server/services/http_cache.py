@@ -0,0 +1,67 @@
+# services/http_cache.py
+#  조건부 GET(ETag / If-None-Match)과 JSON 응답 압축
+#  - ETag 는 약한(weak) 태그: 사용자 쓰기 버전(diary_sync) 또는 토큰 클레임 + 요청 URL 로 만든다.
+#    본문을 만들어 해시하는 방식이 아니라서, 일치하면 본문 쿼리/포맷 없이 바로 304 를 돌려줄 수 있다
+#  - 압축은 after_request 훅: COMPRESS_MIN_BYTES 이상인 JSON 만, Accept-Encoding 에 따라 br(있으면) / gzip
+#    brotli 패키지는 선택 의존성 (없으면 gzip 만)
+import gzip
+import hashlib
+import os
+
+from flask import Response, request
+
+from services import profiler
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "6"))
+COMPRESS_BR_QUALITY = int(os.getenv("COMPRESS_BR_QUALITY", "5"))
+
+# 응답 모양이 바뀌면 올려서 클라이언트가 가진 태그를 무효화
+ETAG_SCHEMA = "1"
+
+
+def make_etag(*parts) -> str:
+    raw = "|".join(str(p) for p in (ETAG_SCHEMA, *parts))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20]
+
+
+def not_modified(etag: str):
+    """If-None-Match 가 etag 와 (약한 비교로) 같으면 304 응답, 아니면 None."""
+    if request.if_none_match.contains_weak(etag):
+        resp = Response(status=304)
+        tag(resp, etag)
+        return resp
+    return None
+
+
+def tag(resp, etag: str):
+    resp.set_etag(etag, weak=True)
+    # 브라우저/프록시가 저장은 하되 매번 재검증하도록
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
+
+
+def compress(resp):
+    if (resp.status_code < 200 or resp.status_code >= 300 or resp.direct_passthrough
+            or resp.is_streamed or resp.mimetype != "application/json"
+            or "Content-Encoding" in resp.headers):
+        return resp
+    body = resp.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return resp
+    resp.vary.add("Accept-Encoding")
+    encoding = request.accept_encodings.best_match(["br", "gzip"] if brotli else ["gzip"])
+    if encoding not in ("br", "gzip"):
+        return resp
+    with profiler.span("compress", encoding=encoding, size=len(body)):
+        if encoding == "br":
+            resp.set_data(brotli.compress(body, quality=COMPRESS_BR_QUALITY))
+        else:
+            resp.set_data(gzip.compress(body, compresslevel=COMPRESS_GZIP_LEVEL))
+    resp.headers["Content-Encoding"] = encoding
+    return resp
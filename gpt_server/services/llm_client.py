@@ -0,0 +1,463 @@
+# services/llm_client.py
+#  모든 채팅 경로가 함께 쓰는 Groq 호출 모듈
+#  - 재시도: 지수 백오프 + full jitter, 호출자가 준 timeout(마감 시각)을 절대 넘기지 않음
+#    비동기 경로(acomplete/aopen_stream)는 이벤트 루프에서 백오프 후 재시도한다.
+#    동기 경로(complete/open_stream)는 스레드를 재우지 않는다: 보조 모델로 바로 넘어갈 수 있으면 즉시 재시도,
+#    아니면 백오프 값을 retry_after 로 담은 LLMUnavailable → 라우트는 503 + Retry-After,
+#    감정 분석 큐는 자기 visible_at 백오프로 다시 시도한다
+#  - 서킷 브레이커: 모델별로 연속 실패가 LLM_BREAKER_FAILURES 번이면 LLM_BREAKER_COOLDOWN 초 동안 즉시 실패
+#  - 폴백: 주 모델(GPT_MODEL)이 과부하(429/503)거나 브레이커가 열리면 보조 모델(LLM_FALLBACK_MODEL/MODEL_NAME)
+#  - 헤지: LLM_HEDGE_AFTER 초 안에 응답이 없으면 같은 요청을 한 번 더 보낸다 (0 = 끔)
+#    비동기: 먼저 온 응답을 쓰고 진 쪽은 취소. 동기: 주 요청은 호출 스레드에서, 헤지만 타이머 스레드가
+#    LLM_HEDGE_WORKERS 크기 풀에 넘긴다 (자리가 없으면 헤지 생략, 대기열 없음). 주 요청이 실패하면 헤지 결과를 쓰고,
+#    주 요청이 성공하면 헤지 결과는 버린다
+#  - SDK 자체 재시도(max_retries)는 끄고 여기서만 재시도한다
+#  - groq SDK(httpx/pydantic)는 import 비용이 커서 첫 호출 때 불러온다 (워커 기동 시간 단축)
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import config  # noqa: F401 (.env 로드)
+from services import metrics
+
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+# 로컬 가짜 LLM(fake_groq.py) 등으로 보낼 때만 지정. 없으면 SDK 기본 주소
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL") or None
+PRIMARY_MODEL = os.getenv("GPT_MODEL", os.getenv("MODEL_NAME", "llama-3.1-70b-versatile"))
+FALLBACK_MODEL = os.getenv("LLM_FALLBACK_MODEL", os.getenv("MODEL_NAME", ""))
+if FALLBACK_MODEL == PRIMARY_MODEL:
+    FALLBACK_MODEL = ""
+
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "3"))
+LLM_RETRY_BASE = float(os.getenv("LLM_RETRY_BASE", "0.25"))
+LLM_RETRY_MAX = float(os.getenv("LLM_RETRY_MAX", "2"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+LLM_HEDGE_AFTER = float(os.getenv("LLM_HEDGE_AFTER", "0"))
+LLM_HEDGE_WORKERS = int(os.getenv("LLM_HEDGE_WORKERS", "32"))
+
+_RETRYABLE = None
+
+
+def _retryable():
+    """재시도할 예외 타입들 (연결/타임아웃, 429, 5xx). except 절에서 예외가 났을 때만 평가된다."""
+    global _RETRYABLE
+    if _RETRYABLE is None:
+        import groq
+        _RETRYABLE = (groq.APIConnectionError, groq.RateLimitError, groq.InternalServerError)
+    return _RETRYABLE
+
+
+class LLMUnavailable(Exception):
+    """브레이커가 열렸거나 마감 전에 성공하지 못함 → 호출 측에서 503"""
+
+    def __init__(self, message, retry_after=1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _overloaded(exc) -> bool:
+    return getattr(exc, "status_code", None) in (429, 503, 529)
+
+
+def _server_retry_after(exc):
+    response = getattr(exc, "response", None)
+    try:
+        return float(response.headers.get("retry-after")) if response is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    def __init__(self, name, failures=LLM_BREAKER_FAILURES, cooldown=LLM_BREAKER_COOLDOWN):
+        self.name = name
+        self.failures = failures
+        self.cooldown = cooldown
+        self._count = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            # half-open: 쿨다운이 지나면 시험 호출 하나만 통과시키고 쿨다운을 다시 건다
+            # (시험 호출이 결과를 보고하지 않아도 다음 쿨다운 뒤에 또 시도할 수 있음)
+            if time.monotonic() - self._opened_at >= self.cooldown:
+                self._opened_at = time.monotonic()
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self._count, self._opened_at = 0, None
+
+    def failure(self):
+        with self._lock:
+            self._count += 1
+            if self._count >= self.failures:
+                if self._opened_at is None:
+                    metrics.LLM_BREAKER_OPENED.inc(model=self.name)
+                    logging.warning(f"Groq 서킷 브레이커 열림: {self.name} ({self.cooldown:.0f}s)")
+                self._opened_at = time.monotonic()
+
+    def retry_after(self) -> float:
+        with self._lock:
+            if self._opened_at is None:
+                return 1.0
+            return max(1.0, self.cooldown - (time.monotonic() - self._opened_at))
+
+
+class LLMStream:
+    """델타 문자열을 내보내는 스트림. 지표 기록과 업스트림 close 를 책임진다."""
+
+    def __init__(self, upstream, call):
+        self.upstream = upstream
+        self.call = call
+        self.model = call.model
+        self._closed = False
+
+    def __iter__(self):
+        try:
+            for chunk in self.upstream:
+                self.call.usage = metrics.stream_usage(chunk) or self.call.usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    self.call.first_token()
+                    yield delta
+        except Exception as e:
+            self.call.error(e)
+            raise
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self.call.finish()
+        close = getattr(self.upstream, "close", None)
+        if close:
+            close()
+
+
+class AsyncLLMStream(LLMStream):
+    async def __aiter__(self):
+        try:
+            async for chunk in self.upstream:
+                self.call.usage = metrics.stream_usage(chunk) or self.call.usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    self.call.first_token()
+                    yield delta
+        except Exception as e:
+            self.call.error(e)
+            raise
+
+    async def aclose(self):
+        if self._closed:
+            return
+        self._closed = True
+        self.call.finish()
+        await self.upstream.close()
+
+
+class _RetryPlan:
+    """호출 한 번(재시도 포함)의 마감 시각과 모델 선택 상태"""
+
+    def __init__(self, client, timeout):
+        self.client = client
+        self.deadline = time.monotonic() + (timeout or LLM_TIMEOUT)
+        self.attempt = 0
+        self.prefer_fallback = False
+        self.last_exc = None
+
+    def next(self):
+        """(모델, 남은 초). 더 시도할 수 없으면 LLMUnavailable."""
+        model = self.client._pick_model(self.prefer_fallback)
+        remaining = self.deadline - time.monotonic()
+        if model is None or remaining <= 0:
+            self._give_up()
+        return model, remaining
+
+    def failed(self, model, exc, wait=True) -> float:
+        """실패를 기록하고 다음 시도 전 쉴 초를 돌려준다. 마감 안에 재시도할 수 없으면 LLMUnavailable.
+        wait=False(동기 경로)면 쉬어야 하는 재시도는 하지 않고 그 초를 retry_after 로 담아 LLMUnavailable."""
+        c = self.client
+        c.breakers[model].failure()
+        metrics.LLM_RETRIES.inc(model=model, error=type(exc).__name__)
+        self.last_exc = exc
+        self.attempt += 1
+        if _overloaded(exc) and c.fallback and model == c.primary:
+            self.prefer_fallback = True
+        if self.prefer_fallback and model == c.primary:
+            delay = 0.0  # 보조 모델로 바로 넘어갈 때는 기다릴 필요가 없다
+        else:
+            # full jitter: 0 ~ min(상한, base * 2^n) 사이 균등 분포
+            delay = random.uniform(0, min(LLM_RETRY_MAX, LLM_RETRY_BASE * (2 ** (self.attempt - 1))))
+            delay = max(delay, _server_retry_after(exc) or 0)
+        logging.warning(f"Groq 호출 실패 (시도 {self.attempt}/{LLM_MAX_ATTEMPTS}, {model}): {exc}")
+        if self.attempt >= LLM_MAX_ATTEMPTS or time.monotonic() + delay >= self.deadline:
+            self._give_up()
+        if delay > 0 and not wait:
+            self._give_up(delay)
+        return delay
+
+    def _give_up(self, retry_after=None):
+        if self.last_exc is None:
+            raise self.client._unavailable(retry_after)
+        raise self.client._unavailable(retry_after or _server_retry_after(self.last_exc)) from self.last_exc
+
+
+class _Hedge:
+    """동기 호출 하나의 예약된 헤지. 타이머 스레드가 fire(), 호출 스레드가 cancel()."""
+
+    def __init__(self, run, path):
+        self.run = run
+        self.path = path
+        self.cancelled = False
+        self.future = None
+        self._lock = threading.Lock()
+
+    def fire(self, hedger):
+        with self._lock:
+            if self.cancelled:
+                return
+            if not hedger.slots.acquire(blocking=False):
+                return  # 헤지 풀이 가득 차면 헤지하지 않는다 (주 요청은 계속 진행 중)
+            metrics.LLM_HEDGES.inc(path=self.path)
+            self.future = hedger.pool.submit(self._call, hedger)
+
+    def _call(self, hedger):
+        try:
+            return self.run()
+        finally:
+            hedger.slots.release()
+
+    def cancel(self):
+        """더 이상 헤지를 보내지 않는다. 이미 보냈다면 그 Future (결과는 호출 측이 쓰거나 버린다)."""
+        with self._lock:
+            self.cancelled = True
+            return self.future
+
+
+class _Hedger:
+    """지연 헤지 타이머(스레드 하나) + 헤지 전용 풀. 주 요청은 이 풀을 쓰지 않는다."""
+
+    def __init__(self, workers):
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="llm-hedge")
+        self.slots = threading.BoundedSemaphore(workers)
+        self._due = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        threading.Thread(target=self._loop, daemon=True, name="llm-hedge-timer").start()
+
+    def schedule(self, delay, hedge):
+        with self._cond:
+            heapq.heappush(self._due, (time.monotonic() + delay, next(self._seq), hedge))
+            self._cond.notify()
+        return hedge
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._due or self._due[0][0] > time.monotonic():
+                    self._cond.wait(self._due[0][0] - time.monotonic() if self._due else None)
+                _, _, hedge = heapq.heappop(self._due)
+            hedge.fire(self)
+
+
+class LLMClient:
+    def __init__(self, api_key=GROQ_API_KEY, primary=PRIMARY_MODEL, fallback=FALLBACK_MODEL,
+                 base_url=GROQ_BASE_URL):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.primary = primary
+        self.fallback = fallback or None
+        self.breakers = {m: CircuitBreaker(m) for m in (primary, fallback) if m}
+        self._sync = None
+        self._async = None
+        self._hedger = None
+        self._lock = threading.Lock()
+
+    # ---- 클라이언트 (처음 쓸 때 생성) ----
+    def _require_key(self):
+        if not self.api_key:
+            raise RuntimeError("GROQ_API_KEY 환경변수가 설정되지 않았습니다.")
+
+    def sync_client(self):
+        if self._sync is None:
+            self._require_key()
+            with self._lock:
+                if self._sync is None:
+                    import groq
+                    self._sync = groq.Groq(api_key=self.api_key, base_url=self.base_url, max_retries=0)
+        return self._sync
+
+    def async_client(self):
+        if self._async is None:
+            self._require_key()
+            import groq
+            self._async = groq.AsyncGroq(api_key=self.api_key, base_url=self.base_url, max_retries=0)
+        return self._async
+
+    def _hedge_scheduler(self):
+        if self._hedger is None:
+            with self._lock:
+                if self._hedger is None:
+                    self._hedger = _Hedger(LLM_HEDGE_WORKERS)
+        return self._hedger
+
+    # ---- 공통 정책 ----
+    def _pick_model(self, prefer_fallback):
+        order = (self.fallback, self.primary) if prefer_fallback else (self.primary, self.fallback)
+        for m in order:
+            if m and self.breakers[m].allow():
+                return m
+        return None
+
+    def _unavailable(self, retry_after=None):
+        wait_s = retry_after or min(b.retry_after() for b in self.breakers.values())
+        return LLMUnavailable("LLM 서버가 일시적으로 응답하지 않습니다.", retry_after=wait_s)
+
+    # ---- 동기 ----
+    def _create(self, model, messages, remaining, path, **params):
+        client = self.sync_client().with_options(timeout=remaining)
+        with metrics.llm_call(path, model) as call:
+            completion = client.chat.completions.create(model=model, messages=messages, **params)
+            call.usage = completion.usage
+        return completion
+
+    def _create_hedged(self, model, messages, remaining, path, **params):
+        if LLM_HEDGE_AFTER <= 0 or remaining <= LLM_HEDGE_AFTER:
+            return self._create(model, messages, remaining, path, **params)
+        start = time.monotonic()
+        hedge = self._hedge_scheduler().schedule(LLM_HEDGE_AFTER, _Hedge(
+            lambda: self._create(model, messages, remaining - LLM_HEDGE_AFTER, path, **params), path))
+        try:
+            completion = self._create(model, messages, remaining, path, **params)
+        except Exception as exc:
+            future = hedge.cancel()
+            if future is None:
+                raise
+            # 주 요청이 실패했고 헤지가 떠 있으면 남은 시간 안에서 그 결과를 쓴다
+            try:
+                return future.result(timeout=max(0.0, remaining - (time.monotonic() - start)))
+            except Exception:
+                raise exc
+        hedge.cancel()  # 진 쪽(헤지) 응답은 버린다
+        return completion
+
+    def complete(self, messages, *, path, timeout=None, temperature=0.8, max_tokens=1024, **extra):
+        params = dict(temperature=temperature, max_tokens=max_tokens, **extra)  # 예: response_format
+        plan = _RetryPlan(self, timeout)
+        while True:
+            model, remaining = plan.next()
+            try:
+                completion = self._create_hedged(model, messages, remaining, path, **params)
+            except _retryable() as e:
+                plan.failed(model, e, wait=False)  # 보조 모델로 바로 넘어갈 때만 돌아온다
+                continue
+            self.breakers[model].success()
+            return completion
+
+    def open_stream(self, messages, *, path, timeout=None, temperature=0.8, max_tokens=1024) -> LLMStream:
+        # 재시도는 스트림을 여는 단계까지만 (토큰을 보내기 시작한 뒤에는 재시도하지 않음)
+        plan = _RetryPlan(self, timeout)
+        while True:
+            model, remaining = plan.next()
+            call = metrics.LLMCall(path, model, stream=True)
+            try:
+                upstream = self.sync_client().with_options(timeout=remaining).chat.completions.create(
+                    model=model, messages=messages, temperature=temperature,
+                    max_tokens=max_tokens, stream=True,
+                )
+            except _retryable() as e:
+                call.error(e)
+                call.finish()
+                plan.failed(model, e, wait=False)
+                continue
+            except Exception as e:
+                call.error(e)
+                call.finish()
+                raise
+            self.breakers[model].success()
+            return LLMStream(upstream, call)
+
+    # ---- 비동기 ----
+    async def _acreate(self, model, messages, remaining, path, **params):
+        client = self.async_client().with_options(timeout=remaining)
+        with metrics.llm_call(path, model) as call:
+            completion = await client.chat.completions.create(model=model, messages=messages, **params)
+            call.usage = completion.usage
+        return completion
+
+    async def _acreate_hedged(self, model, messages, remaining, path, **params):
+        if LLM_HEDGE_AFTER <= 0 or remaining <= LLM_HEDGE_AFTER:
+            return await self._acreate(model, messages, remaining, path, **params)
+        first = asyncio.ensure_future(self._acreate(model, messages, remaining, path, **params))
+        done, _ = await asyncio.wait({first}, timeout=LLM_HEDGE_AFTER)
+        if done:
+            return first.result()
+        metrics.LLM_HEDGES.inc(path=path)
+        second = asyncio.ensure_future(
+            self._acreate(model, messages, remaining - LLM_HEDGE_AFTER, path, **params))
+        pending = {first, second}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for f in done:
+                    if f.exception() is None:
+                        return f.result()
+            return first.result()
+        finally:
+            for f in pending:
+                f.cancel()  # 진 쪽 요청은 취소해 토큰 낭비를 줄인다
+
+    async def acomplete(self, messages, *, path, timeout=None, temperature=0.8, max_tokens=1024, **extra):
+        params = dict(temperature=temperature, max_tokens=max_tokens, **extra)  # 예: response_format
+        plan = _RetryPlan(self, timeout)
+        while True:
+            model, remaining = plan.next()
+            try:
+                completion = await self._acreate_hedged(model, messages, remaining, path, **params)
+            except _retryable() as e:
+                await asyncio.sleep(plan.failed(model, e))
+                continue
+            self.breakers[model].success()
+            return completion
+
+    async def aopen_stream(self, messages, *, path, timeout=None, temperature=0.8,
+                           max_tokens=1024) -> AsyncLLMStream:
+        plan = _RetryPlan(self, timeout)
+        while True:
+            model, remaining = plan.next()
+            call = metrics.LLMCall(path, model, stream=True)
+            try:
+                upstream = await self.async_client().with_options(timeout=remaining).chat.completions.create(
+                    model=model, messages=messages, temperature=temperature,
+                    max_tokens=max_tokens, stream=True,
+                )
+            except _retryable() as e:
+                call.error(e)
+                call.finish()
+                await asyncio.sleep(plan.failed(model, e))
+                continue
+            except Exception as e:
+                call.error(e)
+                call.finish()
+                raise
+            self.breakers[model].success()
+            return AsyncLLMStream(upstream, call)
+
+
+llm = LLMClient()
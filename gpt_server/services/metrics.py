@@ -0,0 +1,226 @@
+# services/metrics.py
+#  Prometheus 텍스트 형식 지표 (외부 의존성 없음)
+#  - 카운터/게이지/히스토그램 모두 lock + 덧셈 몇 번이라 요청 경로 부담이 거의 없다
+#  - 프로세스별 지표이므로 워커가 여러 개면 Prometheus 쪽에서 인스턴스별로 수집/합산
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+from services import profiler
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _esc(v) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_esc(v)}"' for k, v in pairs) + "}"
+
+
+def _fmt_num(v):
+    return repr(float(v)) if v != int(v) else str(int(v))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, doc, labels=()):
+        self.name = name
+        self.doc = doc
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(n, "") for n in self.labels)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_fmt_labels(self.labels, k)} {_fmt_num(v)}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def __init__(self, name, doc, labels=(), func=None):
+        super().__init__(name, doc, labels)
+        self.func = func  # 수집 시점에 값을 계산하는 게이지 (labels 없음)
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def render(self):
+        if self.func is not None:
+            try:
+                return [f"{self.name} {_fmt_num(self.func())}"]
+            except Exception:
+                return []
+        return super().render()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, doc, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, doc, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][idx] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        with self._lock:
+            items = [(k, (list(v[0]), v[1], v[2])) for k, v in self._values.items()]
+        out = []
+        for key, (counts, total, n) in items:
+            acc = 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                acc += c
+                le = "+Inf" if bound == float("inf") else _fmt_num(bound)
+                out.append(f"{self.name}_bucket{_fmt_labels(self.labels, key, [('le', le)])} {acc}")
+            out.append(f"{self.name}_sum{_fmt_labels(self.labels, key)} {_fmt_num(total)}")
+            out.append(f"{self.name}_count{_fmt_labels(self.labels, key)} {n}")
+        return out
+
+
+REGISTRY = []
+
+
+def render() -> str:
+    lines = []
+    for m in REGISTRY:
+        body = m.render()
+        if body:
+            lines += m.header() + body
+    return "\n".join(lines) + "\n"
+
+
+# -------------------------------
+# LLM
+# -------------------------------
+LLM_LATENCY = Histogram("llm_request_duration_seconds", "Groq 호출 전체 소요 시간", ("path", "model", "stream"))
+LLM_TTFT = Histogram("llm_time_to_first_token_seconds", "스트리밍 첫 토큰까지 시간", ("path", "model"))
+LLM_QUEUE_WAIT = Histogram("llm_queue_wait_seconds", "업스트림 동시성 슬롯 대기 시간", ("path",))
+LLM_PROMPT_TOKENS = Counter("llm_prompt_tokens_total", "프롬프트 토큰 수", ("model",))
+LLM_COMPLETION_TOKENS = Counter("llm_completion_tokens_total", "생성 토큰 수", ("model",))
+LLM_ERRORS = Counter("llm_errors_total", "Groq 호출 오류 수", ("path", "error"))
+LLM_INFLIGHT = Gauge("llm_inflight_requests", "진행 중인 Groq 호출 수", ("path",))
+LLM_RETRIES = Counter("llm_retries_total", "재시도(또는 보조 모델 전환)로 이어진 실패 수", ("model", "error"))
+LLM_HEDGES = Counter("llm_hedged_requests_total", "지연으로 추가 발사한 헤지 요청 수", ("path",))
+LLM_BREAKER_OPENED = Counter("llm_breaker_opened_total", "서킷 브레이커가 열린 횟수", ("model",))
+
+# -------------------------------
+# 요청 수용 제어 (services/admission.py)
+# -------------------------------
+ADMISSION_QUEUE = Gauge("admission_queue_length", "자리 대기 중인 요청 수", ("route_class", "priority"))
+ADMISSION_ACTIVE = Gauge("admission_active_requests", "처리 중인 요청 수", ("route_class",))
+ADMISSION_SHED = Counter("admission_shed_total", "503 으로 거절된 요청 수", ("route_class", "priority", "reason"))
+ADMISSION_WAIT = Histogram("admission_wait_seconds", "자리를 받기까지 대기 시간", ("route_class", "priority"))
+
+# -------------------------------
+# 감정 분석 작업
+# -------------------------------
+ANALYSIS_JOBS = Counter("analysis_jobs_total", "감정 분석 작업 처리 결과", ("result",))
+ANALYSIS_BATCH = Histogram("analysis_batch_size", "LLM 호출 한 번에 묶인 일기 수", (),
+                           buckets=(1, 2, 4, 8, 16, 32))
+
+# -------------------------------
+# DB
+# -------------------------------
+DB_QUERY = Histogram("db_query_duration_seconds", "쿼리 실행 시간", ("statement",),
+                     buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5))
+DB_POOL_WAIT = Histogram("db_pool_wait_seconds", "연결 풀 체크아웃 대기 시간", (),
+                         buckets=(0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10))
+DB_READ_ROUTE = Counter("db_read_route_total", "읽기 연결을 보낸 곳 (replica / primary 사유)", ("target",))
+DB_REPLICA_HEALTHY = Gauge("db_replica_healthy", "복제본 상태 점검 결과 (1=읽기 후보)", ("replica",))
+DB_REPLICA_LAG = Gauge("db_replica_lag_seconds", "복제본 지연 (Seconds_Behind_Master)", ("replica",))
+
+
+def record_usage(model, usage):
+    if usage is None:
+        return
+    LLM_PROMPT_TOKENS.inc(getattr(usage, "prompt_tokens", 0) or 0, model=model)
+    LLM_COMPLETION_TOKENS.inc(getattr(usage, "completion_tokens", 0) or 0, model=model)
+
+
+class LLMCall:
+    def __init__(self, path, model, stream):
+        self.path, self.model, self.stream = path, model, stream
+        self.start = time.perf_counter()
+        self._first = False
+        self.ttft = None
+        self.usage = None
+        # 스트림은 다른 스레드에서 끝날 수 있으므로 시작할 때의 프로파일을 잡아 둔다
+        self.profile = profiler.current()
+        LLM_INFLIGHT.inc(path=path)
+
+    def first_token(self):
+        if not self._first:
+            self._first = True
+            self.ttft = time.perf_counter() - self.start
+            LLM_TTFT.observe(self.ttft, path=self.path, model=self.model)
+
+    def error(self, exc):
+        LLM_ERRORS.inc(path=self.path, error=type(exc).__name__)
+
+    def finish(self):
+        end = time.perf_counter()
+        LLM_INFLIGHT.dec(path=self.path)
+        LLM_LATENCY.observe(end - self.start, path=self.path, model=self.model, stream=str(self.stream).lower())
+        record_usage(self.model, self.usage)
+        if self.profile is not None:
+            attrs = {"model": self.model, "stream": self.stream}
+            if self.ttft is not None:
+                attrs["ttft_ms"] = round(self.ttft * 1000, 3)
+            self.profile.add("llm", self.start, end, attrs)
+
+
+@contextmanager
+def llm_call(path, model, stream=False):
+    """비스트리밍 호출용: with llm_call(...) as call: completion = ...; call.usage = completion.usage"""
+    call = LLMCall(path, model, stream)
+    try:
+        yield call
+    except Exception as e:
+        call.error(e)
+        raise
+    finally:
+        call.finish()
+
+
+def stream_usage(chunk):
+    # Groq 스트림은 마지막 청크의 x_groq.usage 에 토큰 사용량을 담아 보낸다
+    extra = getattr(chunk, "x_groq", None)
+    return getattr(extra, "usage", None) if extra is not None else None
@@ -0,0 +1,130 @@
+# services/mood_rollup.py
+#  감정 통계용 일별 롤업(diary_mood_daily) 유지 및 조회
+#  - 일기 생성/수정/삭제 트랜잭션 안에서 apply() 로 ±1 씩 반영 → 통계 조회는 O(일수)
+#  백필: python -m services.mood_rollup
+from collections import Counter, OrderedDict
+from datetime import date, timedelta
+
+
+def apply(cur, diary_id, delta, user_pk=None):
+    """diary_id 행의 (일자, mood) 칸에 delta 를 더합니다. 삭제된 행은 건너뜁니다."""
+    sql = """
+        INSERT INTO diary_mood_daily (user_pk, day, mood, cnt)
+        SELECT user_pk, DATE(created_at), COALESCE(mood, ''), %s
+        FROM emotion_diary
+        WHERE id=%s AND deleted_at IS NULL{owner}
+        ON DUPLICATE KEY UPDATE cnt = cnt + VALUES(cnt)
+    """
+    if user_pk is None:
+        cur.execute(sql.format(owner=""), (delta, diary_id))
+    else:
+        cur.execute(sql.format(owner=" AND user_pk=%s"), (delta, diary_id, user_pk))
+
+
+def add(cur, user_pk, cells):
+    """이미 알고 있는 (일자, mood, delta) 들을 행을 다시 읽지 않고 한 문장으로 반영합니다.
+    같은 칸의 +1/-1 은 상쇄되어 쿼리를 보내지 않습니다."""
+    net = Counter()
+    for day, mood, delta in cells:
+        net[(day, mood or "")] += delta
+    values = [(user_pk, day, mood, delta) for (day, mood), delta in net.items() if delta]
+    if not values:
+        return
+    marks = ", ".join(["(%s, %s, %s, %s)"] * len(values))
+    cur.execute(
+        f"INSERT INTO diary_mood_daily (user_pk, day, mood, cnt) VALUES {marks} "
+        "ON DUPLICATE KEY UPDATE cnt = cnt + VALUES(cnt)",
+        [v for row in values for v in row],
+    )
+
+
+def apply_many(cur, user_pk, diary_ids, delta):
+    if not diary_ids:
+        return
+    marks = ", ".join(["%s"] * len(diary_ids))
+    cur.execute(f"""
+        INSERT INTO diary_mood_daily (user_pk, day, mood, cnt)
+        SELECT user_pk, DATE(created_at), COALESCE(mood, ''), COUNT(*) * %s
+        FROM emotion_diary
+        WHERE user_pk=%s AND id IN ({marks}) AND deleted_at IS NULL
+        GROUP BY user_pk, DATE(created_at), COALESCE(mood, '')
+        ON DUPLICATE KEY UPDATE cnt = cnt + VALUES(cnt)
+    """, (delta, user_pk, *diary_ids))
+
+
+def fetch_days(cur, user_pk, day_from: date, day_to: date):
+    cur.execute(
+        "SELECT day, mood, cnt FROM diary_mood_daily "
+        "WHERE user_pk=%s AND day BETWEEN %s AND %s AND cnt > 0 ORDER BY day",
+        (user_pk, day_from, day_to),
+    )
+    return cur.fetchall()
+
+
+def summarize(rows, today: date):
+    by_day, by_week, by_month = OrderedDict(), OrderedDict(), OrderedDict()
+    totals = Counter()
+    for r in rows:
+        d, mood, cnt = r["day"], r["mood"], r["cnt"]
+        iso = d.isocalendar()
+        for bucket, key in ((by_day, d.isoformat()),
+                            (by_week, f"{iso[0]}-W{iso[1]:02d}"),
+                            (by_month, d.strftime("%Y-%m"))):
+            bucket.setdefault(key, Counter())[mood] += cnt
+        totals[mood] += cnt
+
+    days = sorted({r["day"] for r in rows})
+    longest, run, prev = 0, 0, None
+    for d in days:
+        run = run + 1 if prev is not None and d - prev == timedelta(days=1) else 1
+        longest = max(longest, run)
+        prev = d
+    # 현재 연속 기록: 오늘(또는 아직 안 썼다면 어제)까지 이어지는 구간
+    current = 0
+    day_set = set(days)
+    cursor = today if today in day_set else today - timedelta(days=1)
+    while cursor in day_set:
+        current += 1
+        cursor -= timedelta(days=1)
+
+    def _items(bucket, key_name):
+        return [{key_name: k, "moods": dict(v), "total": sum(v.values())} for k, v in bucket.items()]
+
+    return {
+        "days": _items(by_day, "day"),
+        "weeks": _items(by_week, "week"),
+        "months": _items(by_month, "month"),
+        "totals": dict(totals),
+        "streak": {"current": current, "longest": longest},
+    }
+
+
+def backfill(user_pk=None):
+    from db import get_conn
+    from services import diary_archive
+
+    with get_conn() as conn, conn.cursor() as cur:
+        if user_pk is None:
+            cur.execute(f"SELECT DISTINCT user_pk FROM {diary_archive.source(True)}")
+            users = [r["user_pk"] for r in cur.fetchall()]
+        else:
+            users = [user_pk]
+        # 사용자 단위 트랜잭션 → 긴 잠금 없이 재실행 가능. 통계에는 보관된 일기도 포함
+        for pk in users:
+            conn.begin()
+            cur.execute("DELETE FROM diary_mood_daily WHERE user_pk=%s", (pk,))
+            cur.execute(f"""
+                INSERT INTO diary_mood_daily (user_pk, day, mood, cnt)
+                SELECT user_pk, DATE(created_at), COALESCE(mood, ''), COUNT(*)
+                FROM {diary_archive.source(True)}
+                WHERE user_pk=%s AND deleted_at IS NULL
+                GROUP BY user_pk, DATE(created_at), COALESCE(mood, '')
+            """, (pk,))
+            conn.commit()
+            print(f"user_pk={pk}: {cur.rowcount} rollup rows")
+    return len(users)
+
+
+if __name__ == "__main__":
+    import sys
+    backfill(int(sys.argv[1]) if len(sys.argv) > 1 else None)
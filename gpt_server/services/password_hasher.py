@@ -0,0 +1,147 @@
+# services/password_hasher.py
+#  scrypt 해싱/검증을 별도 프로세스 풀에서 수행
+#  - scrypt 는 한 번에 ~100ms CPU 와 수십 MB 메모리를 쓰므로 요청 스레드에서 돌리면
+#    로그인 폭주 시 다른 API 까지 멈춘다.
+#  - 대기열이 HASH_MAX_PENDING 을 넘으면 기다리지 않고 HasherBusy → 호출 측에서 503
+#  - 해시 비용은 PASSWORD_SCRYPT_N / _R / _P 로 조정, 로그인 성공 시 오래된 파라미터면 재해싱
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(os.cpu_count() or 1)))
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", str(HASH_WORKERS * 4)))
+HASH_TIMEOUT = float(os.getenv("HASH_TIMEOUT", "5"))
+SCRYPT_N = int(os.getenv("PASSWORD_SCRYPT_N", str(2 ** 15)))
+SCRYPT_R = int(os.getenv("PASSWORD_SCRYPT_R", "8"))
+SCRYPT_P = int(os.getenv("PASSWORD_SCRYPT_P", "1"))
+
+
+class HasherBusy(Exception):
+    pass
+
+
+# -------------------------------
+# 워커 프로세스에서 실행되는 함수
+# -------------------------------
+def _b64decode_with_padding(s: str) -> bytes:
+    pad = "=" * (-len(s) % 4)
+    return base64.b64decode(s + pad)
+
+
+def verify_password_compat(stored_hash: str, password: str) -> bool:
+    try:
+        if check_password_hash(stored_hash, password):
+            return True
+    except Exception:
+        pass
+
+    if stored_hash.startswith("scrypt:"):
+        try:
+            header, salt, hex_digest = stored_hash.split("$", 2)
+            _, n_s, r_s, p_s = header.split(":")
+            n, r, p = int(n_s), int(r_s), int(p_s)
+
+            salt_bytes = _b64decode_with_padding(salt)
+            dk = hashlib.scrypt(
+                password.encode("utf-8"),
+                salt=salt_bytes,
+                n=n, r=r, p=p,
+                maxmem=0,
+                dklen=len(bytes.fromhex(hex_digest)),
+            )
+            return hmac.compare_digest(dk, bytes.fromhex(hex_digest))
+        except Exception:
+            return False
+    return False
+
+
+def _hash(password: str, n: int, r: int, p: int) -> str:
+    return generate_password_hash(password, method=f"scrypt:{n}:{r}:{p}")
+
+
+# -------------------------------
+# 요청 스레드 쪽 API
+# -------------------------------
+def current_method() -> str:
+    return f"scrypt:{SCRYPT_N}:{SCRYPT_R}:{SCRYPT_P}"
+
+
+def needs_rehash(stored_hash: str) -> bool:
+    return stored_hash.split("$", 1)[0] != current_method()
+
+
+class PasswordHasher:
+    def __init__(self, workers=HASH_WORKERS, max_pending=HASH_MAX_PENDING, timeout=HASH_TIMEOUT):
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max(self.workers, max_pending))
+        self._executor = None
+        self._saver = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        # fork 이후(각 WSGI 워커 안에서) 처음 쓸 때 만든다
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def _save_pool(self):
+        # rehash_later 의 on_done(DB 쓰기)을 돌릴 스레드 하나.
+        # 프로세스 풀의 결과 처리 스레드에서 돌리면 DB 가 느릴 때 다른 해싱 결과 전달까지 막힌다
+        if self._saver is None:
+            with self._lock:
+                if self._saver is None:
+                    self._saver = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rehash-save")
+        return self._saver
+
+    def submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy("비밀번호 처리 대기열이 가득 찼습니다.")
+        try:
+            fut = self._pool().submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        fut.add_done_callback(lambda _f: self._slots.release())
+        return fut
+
+    def _run(self, fn, *args):
+        fut = self.submit(fn, *args)
+        try:
+            return fut.result(timeout=self.timeout)
+        except FutureTimeout:
+            fut.cancel()
+            raise HasherBusy("비밀번호 처리 시간이 초과되었습니다.")
+
+    def hash(self, password: str) -> str:
+        return self._run(_hash, password, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+
+    def verify(self, stored_hash: str, password: str) -> bool:
+        return self._run(verify_password_compat, stored_hash, password)
+
+    def rehash_later(self, password: str, on_done):
+        """새 파라미터로 해싱해 on_done(new_hash) 호출. 대기열이 차 있으면 다음 로그인으로 미룬다."""
+        try:
+            fut = self.submit(_hash, password, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+        except HasherBusy:
+            return
+
+        def _save(f):
+            try:
+                on_done(f.result())
+            except Exception as e:
+                logging.warning(f"비밀번호 재해싱 실패: {e}")
+
+        fut.add_done_callback(lambda f: self._save_pool().submit(_save, f))
+
+
+hasher = PasswordHasher()
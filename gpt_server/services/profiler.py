@@ -0,0 +1,500 @@
+# services/profiler.py
+#  요청 단위 프로파일링 (켜진 요청만)
+#  - 켜는 방법: 관리자 서명 헤더 X-Profile: <만료 unix 초>.<HMAC-SHA256(PROFILE_SECRET)>  (python -m services.profiler --token)
+#              또는 PROFILE_SAMPLE_RATE 비율로 무작위 표본. 둘 다 없으면 install() 이 훅을 달지 않는다
+#  - 구간(span): DB 연결 체크아웃 / 쿼리, 수용 제어 대기, Groq 호출(+TTFT), JSON 직렬화·압축.
+#    응답에 Server-Timing 헤더로 요약을 싣는다 (브라우저 개발자 도구 Timing 탭에서 보임)
+#  - 스택 샘플링: 켜진 요청의 스레드를 PROFILE_INTERVAL_MS 마다 sys._current_frames() 로 찍는다.
+#    스레드 하나가 켜진 요청이 있을 때만 깨어 있다
+#  - 저장: 서명 헤더로 켠 요청, 또는 PROFILE_SLOW_MS 이상 걸린 요청을 PROFILE_DIR 에 JSON 한 파일로.
+#    PROFILE_MAX_FILES / PROFILE_MAX_BYTES 를 넘으면 오래된 것부터 지운다 (링 버퍼)
+#  - 내려받기: GET /api/admin/profiles[/<id>?format=json|collapsed|spans], /api/admin/profiles/flamegraph?path=
+#    collapsed 는 flamegraph.pl / speedscope / inferno 가 읽는 "a;b;c 횟수" 형식
+#  - 꺼져 있을 때: span()/record() 는 진행 중인 프로파일 dict 가 비었는지만 보고 돌아간다
+import contextlib
+import contextvars
+import hashlib
+import hmac
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+
+import config  # noqa: F401 (.env 로드 — 아래 설정을 읽기 전에)
+
+PROFILE_SECRET = os.getenv("PROFILE_SECRET", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "1000"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_PATHS = tuple(p.strip() for p in os.getenv("PROFILE_PATHS", "/api/history,/api/chat").split(",") if p.strip())
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "data", "profiles"))
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+PROFILE_MAX_BYTES = int(os.getenv("PROFILE_MAX_BYTES", str(50 * 1024 * 1024)))
+PROFILE_MAX_SPANS = 2000     # 요청 하나에 남길 구간 수 (넘으면 요약에만 더한다)
+PROFILE_MAX_DEPTH = 128      # 스택 샘플 깊이
+PROFILE_TOKEN_MAX_TTL = 86400
+
+HEADER = "X-Profile"
+ENABLED = bool(PROFILE_SECRET) or PROFILE_SAMPLE_RATE > 0
+
+_current = contextvars.ContextVar("profile", default=None)
+_live = {}                   # id → Profile (진행 중)
+_live_lock = threading.Lock()
+_wake = threading.Event()    # 스택을 찍을 프로파일이 있을 때만 set
+_sampler = None
+_NULL = contextlib.nullcontext()
+
+
+# -------------------------------
+# 서명 토큰
+# -------------------------------
+def _sign(expires: int) -> str:
+    return hmac.new(PROFILE_SECRET.encode(), f"profile:{expires}".encode(), hashlib.sha256).hexdigest()
+
+
+def make_token(ttl=600) -> str:
+    if not PROFILE_SECRET:
+        raise RuntimeError("PROFILE_SECRET 이 설정되지 않았습니다.")
+    expires = int(time.time()) + min(int(ttl), PROFILE_TOKEN_MAX_TTL)
+    return f"{expires}.{_sign(expires)}"
+
+
+def verify_token(token) -> bool:
+    if not PROFILE_SECRET or not token:
+        return False
+    expires, _, sig = str(token).partition(".")
+    if not expires.isdigit():
+        return False
+    now = time.time()
+    if not now < int(expires) <= now + PROFILE_TOKEN_MAX_TTL:
+        return False
+    return hmac.compare_digest(sig, _sign(int(expires)))
+
+
+# -------------------------------
+# 프로파일
+# -------------------------------
+class Profile:
+    def __init__(self, path, method, forced, stacks=True):
+        self.id = uuid.uuid4().hex[:16]
+        self.path, self.method = path, method
+        self.forced = forced
+        self.status = None
+        self.wall = time.time()
+        self.start = time.perf_counter()
+        self.end = None
+        self.spans = []
+        self.summary = {}           # name → [횟수, 합계 초]
+        self.stacks = Counter() if stacks else None
+        self.samples = 0
+        self.threads = set()
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def add(self, name, start, end, attrs=None):
+        with self._lock:
+            item = self.summary.setdefault(name, [0, 0.0])
+            item[0] += 1
+            item[1] += end - start
+            if len(self.spans) < PROFILE_MAX_SPANS:
+                span = {"name": name, "start_ms": round((start - self.start) * 1000, 3),
+                        "dur_ms": round((end - start) * 1000, 3)}
+                if attrs:
+                    span.update(attrs)
+                self.spans.append(span)
+
+    def duration(self):
+        return (self.end or time.perf_counter()) - self.start
+
+    def server_timing(self) -> str:
+        parts = [f'{name};dur={total * 1000:.1f};desc="{count}x"'
+                 for name, (count, total) in sorted(self.summary.items())]
+        parts.append(f"total;dur={self.duration() * 1000:.1f}")
+        return ", ".join(parts)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "id": self.id, "path": self.path, "method": self.method, "status": self.status,
+                "forced": self.forced,
+                "started_at": datetime.fromtimestamp(self.wall).isoformat(timespec="milliseconds"),
+                "duration_ms": round(self.duration() * 1000, 3),
+                "summary": {name: {"count": c, "total_ms": round(t * 1000, 3)} for name, (c, t) in self.summary.items()},
+                "spans": list(self.spans),
+                "interval_ms": PROFILE_INTERVAL_MS,
+                "samples": self.samples,
+                "stacks": dict(self.stacks) if self.stacks is not None else {},
+            }
+
+
+class _Span:
+    __slots__ = ("prof", "name", "attrs", "t0")
+
+    def __init__(self, prof, name, attrs):
+        self.prof, self.name, self.attrs = prof, name, attrs
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.prof.add(self.name, self.t0, time.perf_counter(), self.attrs)
+        return False
+
+
+def current():
+    return _current.get() if _live else None
+
+
+def span(name, **attrs):
+    """with profiler.span("json"): ... — 켜진 요청 안에서만 기록."""
+    if not _live:
+        return _NULL
+    prof = _current.get()
+    return _NULL if prof is None else _Span(prof, name, attrs)
+
+
+def record(name, start, end=None, **attrs):
+    """이미 잰 구간(perf_counter 기준)을 기록. 다른 스레드에서 끝나는 구간은 Profile.add 를 직접."""
+    if not _live:
+        return
+    prof = _current.get()
+    if prof is not None:
+        prof.add(name, start, time.perf_counter() if end is None else end, attrs)
+
+
+# -------------------------------
+# 스택 샘플링
+# -------------------------------
+def _frame_name(code):
+    path = code.co_filename
+    parts = path.replace("\\", "/").rsplit("/", 2)
+    return f"{code.co_name} ({'/'.join(parts[-2:])}:{code.co_firstlineno})"
+
+
+def _collapse(frame):
+    names = []
+    while frame is not None and len(names) < PROFILE_MAX_DEPTH:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def _sample_loop():
+    interval = PROFILE_INTERVAL_MS / 1000.0
+    while True:
+        _wake.wait()
+        time.sleep(interval)
+        with _live_lock:
+            live = [p for p in _live.values() if p.stacks is not None]
+            if not live:
+                _wake.clear()
+                continue
+        frames = sys._current_frames()
+        for prof in live:
+            for tid in tuple(prof.threads):
+                frame = frames.get(tid)
+                if frame is not None:
+                    stack = _collapse(frame)
+                    with prof._lock:
+                        prof.stacks[stack] += 1
+                        prof.samples += 1
+        del frames
+
+
+def _ensure_sampler():
+    global _sampler
+    if _sampler is None:
+        with _live_lock:
+            if _sampler is None:
+                _sampler = threading.Thread(target=_sample_loop, daemon=True, name="profile-sampler")
+                _sampler.start()
+
+
+# -------------------------------
+# 시작 / 종료
+# -------------------------------
+def start(path, method, token=None, stacks=True):
+    """켜야 하는 요청이면 Profile, 아니면 None. 이어서 activate() 로 현재 컨텍스트에 건다."""
+    if not path.startswith(PROFILE_PATHS):
+        return None
+    forced = verify_token(token) if token else False
+    if not forced and not (PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE):
+        return None
+    prof = Profile(path, method, forced, stacks=stacks)
+    if stacks:
+        prof.threads.add(threading.get_ident())
+        _ensure_sampler()
+    with _live_lock:
+        _live[prof.id] = prof
+        if stacks:
+            _wake.set()
+    return prof
+
+
+def activate(prof):
+    return _current.set(prof)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+def bind(prof, iterable):
+    """스트리밍 응답 본문: 본문을 도는 스레드에서도 구간/스택이 이 프로파일로 가도록."""
+    it = iter(iterable)
+    try:
+        while True:
+            tid = threading.get_ident()
+            prof.threads.add(tid)
+            token = _current.set(prof)
+            try:
+                chunk = next(it)
+            except StopIteration:
+                return
+            finally:
+                _current.reset(token)
+                prof.threads.discard(tid)
+            yield chunk
+    finally:
+        close = getattr(iterable, "close", None)
+        if close is not None:
+            close()
+
+
+def finish(prof, status=None):
+    """요청 종료 (본문 전송 뒤). 서명 요청이거나 느린 요청이면 링 버퍼에 저장하고 id 를 돌려준다."""
+    if prof is None or prof._closed:
+        return None
+    prof._closed = True
+    prof.end = time.perf_counter()
+    if status is not None:
+        prof.status = status
+    with _live_lock:
+        _live.pop(prof.id, None)
+    prof.threads.clear()
+    if prof.forced or prof.duration() * 1000 >= PROFILE_SLOW_MS:
+        try:
+            return save(prof)
+        except OSError:
+            return None
+    return None
+
+
+# -------------------------------
+# 링 버퍼 (PROFILE_DIR)
+# -------------------------------
+_ring_lock = threading.Lock()
+
+
+def _files():
+    try:
+        names = sorted(n for n in os.listdir(PROFILE_DIR) if n.endswith(".json"))
+    except FileNotFoundError:
+        return []
+    return names
+
+
+def save(prof):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    data = json.dumps(prof.to_dict(), ensure_ascii=False).encode("utf-8")
+    name = f"{int(prof.wall * 1000):013d}-{prof.id}.json"
+    tmp = os.path.join(PROFILE_DIR, f".{name}.{os.getpid()}")
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, os.path.join(PROFILE_DIR, name))
+    with _ring_lock:
+        names = _files()
+        sizes = {}
+        for n in names:
+            try:
+                sizes[n] = os.path.getsize(os.path.join(PROFILE_DIR, n))
+            except OSError:
+                sizes[n] = 0
+        total = sum(sizes.values())
+        while names and (len(names) > PROFILE_MAX_FILES or total > PROFILE_MAX_BYTES):
+            oldest = names.pop(0)
+            total -= sizes[oldest]
+            try:
+                os.remove(os.path.join(PROFILE_DIR, oldest))
+            except OSError:
+                pass
+    return prof.id
+
+
+def load(profile_id):
+    if not profile_id.isalnum():
+        return None
+    for name in _files():
+        if name[:-5].endswith(f"-{profile_id}"):
+            try:
+                with open(os.path.join(PROFILE_DIR, name), encoding="utf-8") as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                return None
+    return None
+
+
+def iter_profiles(path=None):
+    """최신 것부터. path 는 요청 경로 접두사."""
+    for name in reversed(_files()):
+        try:
+            with open(os.path.join(PROFILE_DIR, name), encoding="utf-8") as f:
+                p = json.load(f)
+        except (OSError, ValueError):
+            continue  # 링 버퍼에서 막 지워진 파일
+        if path and not p["path"].startswith(path):
+            continue
+        yield p
+
+
+def list_profiles(limit=50, path=None):
+    out = []
+    for p in iter_profiles(path):
+        out.append({k: p[k] for k in ("id", "path", "method", "status", "forced", "started_at",
+                                      "duration_ms", "samples", "summary")})
+        if len(out) >= limit:
+            break
+    return out
+
+
+def collapsed(profiles) -> str:
+    """스택 샘플 → "프레임;프레임 횟수" 줄 (여러 프로파일이면 합친다)."""
+    merged = Counter()
+    for p in profiles:
+        root = f"{p['method']} {p['path']}"
+        for stack, count in p.get("stacks", {}).items():
+            merged[f"{root};{stack}"] += count
+    return "".join(f"{stack} {count}\n" for stack, count in merged.most_common())
+
+
+def collapsed_spans(p) -> str:
+    """구간 요약 → 같은 형식(값 = 마이크로초). 구간에 들지 않은 시간은 other."""
+    root = f"{p['method']} {p['path']}"
+    lines, covered = [], 0.0
+    for name, s in sorted(p["summary"].items()):
+        lines.append(f"{root};{name} {int(s['total_ms'] * 1000)}\n")
+        covered += s["total_ms"]
+    other = p["duration_ms"] - covered
+    if other > 0:
+        lines.append(f"{root};other {int(other * 1000)}\n")
+    return "".join(lines)
+
+
+# -------------------------------
+# Flask 연동
+# -------------------------------
+def install(app):
+    if not ENABLED:
+        return
+    from flask import Response, g, jsonify, request
+
+    def _before():
+        prof = start(request.path, request.method, request.headers.get(HEADER))
+        if prof is not None:
+            g.profile = (prof, activate(prof))
+
+    def _after(resp):
+        item = g.pop("profile", None)
+        if item is None:
+            return resp
+        prof, token = item
+        prof.status = resp.status_code
+        # 이 스레드는 곧 다른 요청을 처리한다 → 스트리밍 본문은 bind() 가 도는 스레드에서만 찍는다
+        prof.threads.discard(threading.get_ident())
+        resp.headers["Server-Timing"] = prof.server_timing()
+        resp.headers["X-Profile-Id"] = prof.id
+        if resp.is_streamed:
+            resp.response = bind(prof, resp.response)
+        resp.call_on_close(lambda: finish(prof))
+        deactivate(token)
+        return resp
+
+    def _teardown(exc):
+        # 예외로 after_request 를 건너뛴 경우
+        item = g.pop("profile", None)
+        if item is not None:
+            deactivate(item[1])
+            finish(item[0], 500)
+
+    # 가장 먼저 시작하고(before) 가장 늦게 끝나도록(after 는 등록 역순) create_app 에서 제일 먼저 부른다
+    app.before_request(_before)
+    app.after_request(_after)
+    app.teardown_request(_teardown)
+
+    if not PROFILE_SECRET:
+        return
+
+    def _authorized():
+        return verify_token(request.headers.get(HEADER))
+
+    def profiles_index():
+        if not _authorized():
+            return jsonify(error="unauthorized"), 401
+        try:
+            limit = min(max(int(request.args.get("limit", "50")), 1), PROFILE_MAX_FILES)
+        except ValueError:
+            return jsonify(error="limit 형식이 올바르지 않습니다."), 400
+        return jsonify(items=list_profiles(limit, request.args.get("path")))
+
+    def profiles_flamegraph():
+        if not _authorized():
+            return jsonify(error="unauthorized"), 401
+        return Response(collapsed(iter_profiles(request.args.get("path"))), mimetype="text/plain")
+
+    def profiles_get(profile_id):
+        if not _authorized():
+            return jsonify(error="unauthorized"), 401
+        p = load(profile_id)
+        if p is None:
+            return jsonify(error="not found"), 404
+        fmt = request.args.get("format", "json")
+        if fmt == "collapsed":
+            return Response(collapsed([p]), mimetype="text/plain")
+        if fmt == "spans":
+            return Response(collapsed_spans(p), mimetype="text/plain")
+        return jsonify(p)
+
+    app.add_url_rule("/api/admin/profiles", "profiles_index", profiles_index, methods=["GET"])
+    app.add_url_rule("/api/admin/profiles/flamegraph", "profiles_flamegraph", profiles_flamegraph,
+                     methods=["GET"])
+    app.add_url_rule("/api/admin/profiles/<profile_id>", "profiles_get", profiles_get, methods=["GET"])
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="요청 프로파일 토큰 발급 / 저장된 프로파일 보기")
+    parser.add_argument("--token", type=int, metavar="TTL", help="X-Profile 헤더 값 발급 (유효 초)")
+    parser.add_argument("--list", action="store_true", help="저장된 프로파일 목록")
+    parser.add_argument("--export", metavar="ID", help="프로파일 하나 출력")
+    parser.add_argument("--format", choices=("json", "collapsed", "spans"), default="collapsed")
+    parser.add_argument("--merge", metavar="PATH", nargs="?", const="",
+                        help="저장된 프로파일 스택을 합쳐 collapsed 로 출력 (경로 접두사로 거르기)")
+    args = parser.parse_args()
+    if args.token:
+        print(make_token(args.token))
+    elif args.list:
+        for p in list_profiles(PROFILE_MAX_FILES):
+            top = sorted(p["summary"].items(), key=lambda kv: -kv[1]["total_ms"])[:3]
+            spans = ", ".join(f"{k}={v['total_ms']:.0f}ms" for k, v in top)
+            print(f"{p['id']}  {p['started_at']}  {p['method']} {p['path']:<24} {p['status']}  "
+                  f"{p['duration_ms']:8.1f}ms  samples={p['samples']:<5} {spans}")
+    elif args.export:
+        p = load(args.export)
+        if p is None:
+            sys.exit(f"프로파일 {args.export} 이 없습니다.")
+        if args.format == "json":
+            print(json.dumps(p, ensure_ascii=False, indent=2))
+        else:
+            sys.stdout.write(collapsed([p]) if args.format == "collapsed" else collapsed_spans(p))
+    elif args.merge is not None:
+        sys.stdout.write(collapsed(iter_profiles(args.merge or None)))
+    else:
+        parser.print_help()
@@ -0,0 +1,148 @@
+# services/rate_limiter.py
+#  토큰 버킷 기반 요청 제한
+#  - 키: 로그인 사용자는 "u:<user_pk>", 게스트/비로그인은 "ip:<주소>"
+#  - 로컬 상태는 최대 RATE_LIMIT_MAX_KEYS 개까지만 LRU 로 유지 (스캐너 트래픽에도 메모리 상한)
+#  - RATE_LIMIT_REDIS_URL 이 있으면 Redis 에서 버킷을 공유 → 워커/노드가 여러 개여도 한도는 하나
+#  - 예산: "<요청 수>/<초>" 형식. RATE_LIMIT_CHAT(기본 10/20), RATE_LIMIT_LOGIN(기본 5/60)
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import jsonify, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1").lower() in ("1", "true", "yes")
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL")
+
+
+def parse_budget(spec: str):
+    count, _, period = spec.partition("/")
+    return int(count), float(period or 1)
+
+
+BUDGETS = {
+    "chat": parse_budget(os.getenv("RATE_LIMIT_CHAT", "10/20")),
+    "login": parse_budget(os.getenv("RATE_LIMIT_LOGIN", "5/60")),
+}
+
+
+class LocalBuckets:
+    def __init__(self, max_keys=RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max(1, max_keys)
+        self._buckets = OrderedDict()  # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, period, now=None):
+        """토큰 하나를 꺼냅니다. (허용 여부, 재시도까지 남은 초)"""
+        now = time.monotonic() if now is None else now
+        rate = capacity / period
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                allowed, retry = True, 0.0
+                tokens -= 1
+            else:
+                allowed, retry = False, (1 - tokens) / rate
+            # 가장 오래 안 쓴 버킷부터 밀려난다. 그런 버킷은 대개 이미 가득 차 있어 지워도 결과가 같다
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, retry
+
+
+class RedisBuckets:
+    # 원자적으로 리필 + 차감 (시간은 Redis 서버 시계 사용)
+    _SCRIPT = """
+    local capacity = tonumber(ARGV[1])
+    local rate = tonumber(ARGV[2])
+    local t = redis.call('TIME')
+    local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+    local b = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(b[1]) or capacity
+    local ts = tonumber(b[2]) or now
+    tokens = math.min(capacity, tokens + (now - ts) * rate)
+    local allowed = 0
+    local retry = 0
+    if tokens >= 1 then
+        allowed = 1
+        tokens = tokens - 1
+    else
+        retry = (1 - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+    return {allowed, tostring(retry)}
+    """
+
+    def __init__(self, url):
+        import redis  # 선택 의존성
+        self.client = redis.Redis.from_url(url, socket_timeout=0.2)
+        self._take = self.client.register_script(self._SCRIPT)
+
+    def take(self, key, capacity, period, now=None):
+        allowed, retry = self._take(keys=[f"rl:{key}"], args=[capacity, capacity / period])
+        return bool(int(allowed)), float(retry)
+
+
+class RateLimiter:
+    def __init__(self, redis_url=RATE_LIMIT_REDIS_URL):
+        self.local = LocalBuckets()
+        self.shared = None
+        if redis_url:
+            try:
+                self.shared = RedisBuckets(redis_url)
+            except Exception as e:
+                logging.warning(f"Redis 요청 제한 사용 불가, 프로세스 로컬로 동작: {e}")
+
+    def take(self, budget: str, key: str):
+        capacity, period = BUDGETS[budget]
+        full_key = f"{budget}:{key}"
+        if self.shared is not None:
+            try:
+                return self.shared.take(full_key, capacity, period)
+            except Exception as e:
+                # Redis 장애 시에도 서비스는 계속: 로컬 버킷으로 대체
+                logging.warning(f"Redis 요청 제한 실패, 로컬로 대체: {e}")
+        return self.local.take(full_key, capacity, period)
+
+
+limiter = RateLimiter()
+
+
+def client_key() -> str:
+    """JWT 가 있으면 user_pk, 게스트(0)나 비로그인이면 IP."""
+    try:
+        verify_jwt_in_request(optional=True)
+        ident = get_jwt_identity()
+    except Exception:
+        ident = None
+    if isinstance(ident, int) and ident > 0:
+        return f"u:{ident}"
+    return f"ip:{request.remote_addr}"
+
+
+def too_many(retry_after: float):
+    resp = jsonify(error="요청이 너무 많습니다. 잠시 후 다시 시도해주세요.")
+    resp.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return resp, 429
+
+
+def rate_limited(budget: str, key_func=client_key):
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if RATE_LIMIT_ENABLED and request.method != "OPTIONS":
+                key = key_func()
+                allowed, retry = limiter.take(budget, key)
+                if not allowed:
+                    logging.warning(f"429 제한: {budget} {key} ({retry:.1f}s 후 재시도)")
+                    return too_many(retry)
+            return fn(*args, **kwargs)
+        return wrapper
+    return deco
@@ -0,0 +1,76 @@
+# services/user_context.py
+#  요청 단위 사용자 컨텍스트
+#  - 로그인/게스트 토큰에는 user_pk, user_id, user_name 클레임이 들어 있으므로
+#    요청마다 users 테이블을 다시 읽지 않고 클레임만으로 만든다 (flask.g 에 한 번만)
+#  - 토큰에 없는 프로필 필드(created_at)는 PROFILE_CACHE_TTL 초 동안 프로세스 내 캐시
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import g
+from flask_jwt_extended import get_jwt, get_jwt_identity
+
+from db import get_conn
+
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "300"))
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "10000"))
+
+
+class UserContext:
+    __slots__ = ("user_pk", "user_id", "user_name")
+
+    def __init__(self, user_pk, user_id=None, user_name=None):
+        self.user_pk = user_pk
+        self.user_id = user_id
+        self.user_name = user_name
+
+    @property
+    def is_guest(self) -> bool:
+        return not isinstance(self.user_pk, int) or self.user_pk <= 0
+
+
+def current_user() -> UserContext:
+    """jwt_required / verify_jwt_in_request 이후에 호출."""
+    ctx = g.get("user_ctx")
+    if ctx is None:
+        claims = get_jwt() or {}
+        ctx = UserContext(get_jwt_identity(), claims.get("user_id"), claims.get("user_name"))
+        g.user_ctx = ctx
+    return ctx
+
+
+class ProfileCache:
+    def __init__(self, ttl=PROFILE_CACHE_TTL, max_entries=PROFILE_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self._data = OrderedDict()  # user_pk -> (expires_at, row)
+        self._lock = threading.Lock()
+
+    def get(self, user_pk):
+        now = time.monotonic()
+        with self._lock:
+            hit = self._data.get(user_pk)
+            if hit is not None and hit[0] > now:
+                self._data.move_to_end(user_pk)
+                return hit[1]
+        with get_conn() as conn, conn.cursor() as cur:
+            cur.execute("SELECT id, user_id, user_name, created_at FROM users WHERE id=%s", (user_pk,))
+            row = cur.fetchone()
+        if row is not None:  # 없는 사용자는 캐시하지 않는다
+            self.put(user_pk, row)
+        return row
+
+    def put(self, user_pk, row):
+        with self._lock:
+            self._data[user_pk] = (time.monotonic() + self.ttl, row)
+            self._data.move_to_end(user_pk)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def invalidate(self, user_pk):
+        with self._lock:
+            self._data.pop(user_pk, None)
+
+
+profiles = ProfileCache()
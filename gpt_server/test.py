@@ -1,7 +1,7 @@
-from db import get_db_connection
+from db import get_conn
 
 try:
-    conn = get_db_connection()
+    conn = get_conn()
     with conn.cursor() as cursor:
         cursor.execute("SELECT NOW() AS time;")
         result = cursor.fetchone()